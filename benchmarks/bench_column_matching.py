@@ -0,0 +1,100 @@
+"""
+Benchmark of the column matching steps (clean_dashboard_columns, mark_worksheet_columns).
+The old pairwise comparisons are kept here as the reference: the output has to stay the same,
+and the time per column has to stay flat while the workbook grows.
+
+Run from the repository root: python benchmarks/bench_column_matching.py
+"""
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tableau_metadata_extractor import Tableau
+
+SIZES = (250, 500, 1000, 2000, 4000)
+# new time per column on the biggest size may be at most this many times the one on the smallest size
+MAX_SCALING = 3.0
+
+
+def make_extracted_data(size, dashboards=4):
+    views = [{'caption': f'"Filter {i}"', 'options': [f'"Option {i}.{j}"' for j in range(3)]} for i in range(size // 10)]
+    columns = [{'caption': f'Column {i}' if i % 7 else f'Filter {i % (size // 10)}', 'name': f'[Column {i}]', 'role': 'measure'}
+               for i in range(size)]
+    return {'Dashboards': {f'Dashboard {d}': {'Views': copy.deepcopy(views), 'Columns': copy.deepcopy(columns)}
+                           for d in range(dashboards)}}
+
+
+def make_column_metadata(size):
+    return [{'caption': f'Column {i}', 'formula': 'SUM(1)', 'worksheet': 'yes'} for i in range(0, size, 2)]
+
+
+def old_clean_dashboard_columns(extracted_data):
+    view_captions_and_options = []
+    for dashboard_content in extracted_data.get("Dashboards", {}).values():
+        for view in dashboard_content.get("Views", []):
+            caption = view.get("caption", "").strip("\"'")
+            stripped_options = [option.strip("\"'") for option in view.get("options", [])]
+            if caption:
+                view_captions_and_options.append(caption)
+            if stripped_options:
+                view_captions_and_options.extend(stripped_options)
+    for dashboard_content in extracted_data.get("Dashboards", {}).values():
+        cleaned_columns = [col for col in dashboard_content.get("Columns", []) if col.get("caption") is not None]
+        cleaned_columns = [col for col in cleaned_columns if
+                           col.get("caption").strip("\"'") not in view_captions_and_options]
+        dashboard_content["Columns"] = cleaned_columns
+
+
+def old_mark_worksheet_columns(extracted_data, column_metadata):
+    for dashboard_content in extracted_data.get("Dashboards", {}).values():
+        for column in dashboard_content.get("Columns", []):
+            for col_metadata in column_metadata:
+                if col_metadata.get('caption') == column.get('caption'):
+                    column['worksheet'] = 'yes'
+                    break
+                else:
+                    column['worksheet'] = 'no'
+
+
+def run_old(extracted_data, column_metadata):
+    old_clean_dashboard_columns(extracted_data)
+    old_mark_worksheet_columns(extracted_data, column_metadata)
+
+
+def run_new(extracted_data, column_metadata):
+    tableau = Tableau('bench.twb')
+    tableau.extracted_data = extracted_data
+    tableau.clean_dashboard_columns()
+    tableau.mark_worksheet_columns(column_metadata)
+
+
+def timed(function, size):
+    extracted_data = make_extracted_data(size)
+    column_metadata = make_column_metadata(size)
+    start = time.perf_counter()
+    function(extracted_data, column_metadata)
+    return time.perf_counter() - start, extracted_data
+
+
+def main():
+    per_column = []
+    print(f"{'columns':>8} {'old s':>10} {'new s':>10} {'new us/column':>14}")
+    for size in SIZES:
+        old_seconds, old_result = timed(run_old, size)
+        new_seconds, new_result = timed(run_new, size)
+        if old_result != new_result:
+            raise SystemExit(f"Output differs from the old matching for {size} columns")
+        per_column.append(new_seconds / size)
+        print(f"{size:>8} {old_seconds:>10.4f} {new_seconds:>10.4f} {new_seconds / size * 1e6:>14.2f}")
+
+    scaling = per_column[-1] / per_column[0]
+    print(f"time per column grew {scaling:.2f}x from {SIZES[0]} to {SIZES[-1]} columns")
+    if scaling > MAX_SCALING:
+        raise SystemExit(f"Column matching does not scale linearly (limit {MAX_SCALING}x)")
+
+
+if __name__ == '__main__':
+    main()
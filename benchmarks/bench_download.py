@@ -0,0 +1,108 @@
+"""
+Downloads synthetic workbooks from the stub Tableau server (benchmarks/stub_tableau_server.py) through
+TableauRestClient and run_extraction, with rate limiting and token expiry switched on, and checks that
+- every workbook arrives byte for byte and extracts like the local file,
+- connections are reused (no more of them than the concurrency limit, plus one for signing in),
+- the concurrency limit holds and the expired token is renewed,
+- spooled downloads (--spool memory / spill) leave nothing behind, neither in the working directory
+  nor in the temp directory they spill to.
+
+Run from the repository root: python benchmarks/bench_download.py
+"""
+import argparse
+import filecmp
+import json
+import logging
+import multiprocessing.util
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_tableau_server import StubTableauServer
+from synthetic_workbook import write_workbook
+from tableau_metadata_extractor import extract_workbook, run_extraction
+from tableau_records import record_default
+from tableau_rest import SPOOL_MAX_MEMORY, TableauRestClient
+
+# spool threshold of each mode, spill is small enough for every synthetic workbook to go through a temporary file
+SPOOL_MODES = {'files': None, 'memory': SPOOL_MAX_MEMORY, 'spill': 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workbooks', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the stub takes per download')
+    parser.add_argument('--spool', choices=sorted(SPOOL_MODES), default='memory',
+                        help='files: download into the working directory, memory / spill: spooled downloads')
+    args = parser.parse_args()
+    logging.getLogger('tableau_extractor').setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        sources = {}
+        for i in range(args.workbooks):
+            extension = '.twbx' if i % 2 else '.twb'
+            sources[f'luid-{i}'] = write_workbook(os.path.join(directory, f'source-{i}{extension}'),
+                                                  worksheets=3 + i % 5, columns=10 + i % 7, seed=i)
+        download_dir = os.path.join(directory, 'downloads')
+        spill_dir = os.path.join(directory, 'spill')
+        os.makedirs(download_dir)
+        os.makedirs(spill_dir)
+        current = os.getcwd()
+        os.chdir(download_dir)
+        # the extraction pool keeps its forkserver socket in a temp dir of its own, created before the spill dir is set
+        multiprocessing.util.get_temp_dir()
+        tempfile.tempdir = spill_dir
+        try:
+            with StubTableauServer(sources, rate_limit_every=7, token_requests=15, latency=args.latency) as server:
+                client = TableauRestClient(server.url, token_name='name', token_secret='secret',
+                                           max_concurrency=args.concurrency, backoff=0.05)
+                with client:
+                    start = time.perf_counter()
+                    records, failed = run_extraction(list(sources), client,
+                                                     download_workers=args.concurrency * 2, extract_workers=2,
+                                                     retry_delay=0, output_path=None,
+                                                     spool_bytes=SPOOL_MODES[args.spool])
+                    seconds = time.perf_counter() - start
+                stats = dict(server.stats, retries=client.retries, client_sign_ins=client.sign_ins)
+        finally:
+            os.chdir(current)
+            tempfile.tempdir = None
+
+        failures = []
+        if failed:
+            failures.append(f"downloads failed: {failed}")
+        if args.spool == 'files':
+            for code, source in sources.items():
+                downloaded = os.path.join(download_dir, code + os.path.splitext(source)[1])
+                if not os.path.exists(downloaded) or not filecmp.cmp(source, downloaded, shallow=False):
+                    failures.append(f"{code} was not downloaded intact")
+        else:
+            # a spooled workbook is checked through its extraction below
+            for leftover_dir in (download_dir, spill_dir):
+                if os.listdir(leftover_dir):
+                    failures.append(f"{len(os.listdir(leftover_dir))} files left in {leftover_dir}")
+        for record in records:
+            expected = extract_workbook(record['workbook_luid'], sources[record['workbook_luid']])
+            if json.dumps(record, default=record_default) != json.dumps(expected, default=record_default):
+                failures.append(f"{record['workbook_luid']} extracts differently after the download")
+
+    print(f"{len(records)} workbooks in {seconds:.2f}s, {len(records) / seconds:.1f} workbooks/s")
+    print(stats)
+    if stats['max_in_flight'] > args.concurrency:
+        failures.append(f"{stats['max_in_flight']} requests at once, the limit is {args.concurrency}")
+    # one pooled connection per download slot plus one for signing in
+    if stats['connections'] > args.concurrency + 1:
+        failures.append(f"{stats['connections']} connections for {stats['requests']} requests, they are not reused")
+    if stats['expired'] and stats['client_sign_ins'] < 2:
+        failures.append("the expired token was not renewed")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark of the whole Tableau method pipeline (extract_workbook) on synthetic workbooks, offline.
+Every scale is run as a plain .twb and as a zipped .twbx and reports workbooks/s, xml elements/s and
+the peak python memory of one extraction.
+
+The run fails when
+- the time per element on the biggest scale grows more than MAX_SCALING times the one on the smallest scale, or
+- with --baseline, a scale got more than --tolerance times slower than in the saved baseline
+  (save one on the same machine first with --save-baseline).
+
+Run from the repository root: python benchmarks/bench_pipeline.py [--baseline benchmarks/.pipeline_baseline.json]
+Compare the parser engines with --engine etree --save-baseline etree.json, then --engine lxml --baseline etree.json.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_workbook import write_workbook
+from tableau_metadata_extractor import Tableau, extract_workbook
+from tableau_xml import ENGINES
+
+SCALES = {
+    'small': dict(datasources=2, worksheets=5, dashboards=2, columns=20, calculations=5, members=5, metadata_records=20),
+    'medium': dict(datasources=5, worksheets=25, dashboards=5, columns=60, calculations=15, members=10,
+                   metadata_records=60),
+    'large': dict(datasources=10, worksheets=80, dashboards=10, columns=150, calculations=40, members=20,
+                  metadata_records=150),
+}
+# time per element on the largest scale may be at most this many times the one on the smallest scale
+# (some phases still compare every worksheet with every column, so it is not flat yet)
+MAX_SCALING = 5.0
+
+
+def count_elements(path, engine):
+    tableau = Tableau(path, engine)
+    tableau.unpack_twbx(save_decoded=False)
+    return len(tableau.index.elements)
+
+
+def best_time(path, repeat, engine, min_seconds=0.5):
+    """
+    Fastest of at least repeat runs, small workbooks are run until min_seconds passed so their time is not noise.
+    """
+    times = []
+    gc.collect()
+    gc.disable()  # like timeit, collections of earlier garbage are not the pipeline's time
+    try:
+        while len(times) < repeat or sum(times) < min_seconds:
+            start = time.perf_counter()
+            extract_workbook('benchmark', path, engine=engine)
+            times.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(times)
+
+
+def peak_memory(path, engine):
+    tracemalloc.start()
+    try:
+        extract_workbook('benchmark', path, engine=engine)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(directory, repeat, engine=None):
+    results = {}
+    for scale, sizes in SCALES.items():
+        for extension in ('.twb', '.twbx'):
+            path = write_workbook(os.path.join(directory, f'{scale}{extension}'), **sizes)
+            elements = count_elements(path, engine)
+            seconds = best_time(path, repeat, engine)
+            results[f'{scale}{extension}'] = {
+                'elements': elements,
+                'seconds': seconds,
+                'workbooks_per_second': 1 / seconds,
+                'elements_per_second': elements / seconds,
+                'peak_bytes': peak_memory(path, engine),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3, help='runs per workbook, the fastest one counts')
+    parser.add_argument('--baseline', help='json file with the results of an earlier run to compare with')
+    parser.add_argument('--save-baseline', help='write the results as a baseline to this json file')
+    parser.add_argument('--engine', choices=sorted(ENGINES), help='xml parser engine, stdlib by default')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    logging.getLogger('tableau_extractor').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        current = os.getcwd()
+        os.chdir(directory)  # extract_workbook writes its decoded copies next to the workbook
+        try:
+            results = run(directory, args.repeat, args.engine)
+        finally:
+            os.chdir(current)
+
+    print(f"{'workbook':>12} {'elements':>9} {'seconds':>9} {'wb/s':>8} {'elements/s':>11} {'peak MB':>8}")
+    for name, result in results.items():
+        print(f"{name:>12} {result['elements']:>9} {result['seconds']:>9.4f} {result['workbooks_per_second']:>8.2f} "
+              f"{result['elements_per_second']:>11.0f} {result['peak_bytes'] / 2 ** 20:>8.2f}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    smallest, largest = list(SCALES)[0], list(SCALES)[-1]
+    for extension in ('.twb', '.twbx'):
+        small, large = results[smallest + extension], results[largest + extension]
+        scaling = (large['seconds'] / large['elements']) / (small['seconds'] / small['elements'])
+        print(f"{extension}: time per element grew {scaling:.2f}x from {smallest} to {largest}")
+        if scaling > MAX_SCALING:
+            failures.append(f"{extension} extraction does not scale linearly (limit {MAX_SCALING}x)")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            slowdown = result['seconds'] / baseline[name]['seconds']
+            print(f"{name}: {slowdown:.2f}x the baseline time")
+            if slowdown > args.tolerance:
+                failures.append(f"{name} is {slowdown:.2f}x slower than the baseline (limit {args.tolerance}x)")
+
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark of the view title lookup (renamed_field_lookup), with the old regex per view kept as the reference:
+every view the old lookup renamed has to get the same title, also for field names with colons in them,
+and the lookup has to stay fast while the workbook grows.
+
+Run from the repository root: python benchmarks/bench_renamed_columns.py
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tableau_metadata_extractor import parse_field_instance, renamed_field_lookup
+
+SIZES = (250, 500, 1000, 2000)
+
+# key -> (derivation, name, type)
+PARSED = {
+    '[sqlproxy.x].[none:Region:nk]': ('none', 'Region', 'nk'),
+    '[none:ratio:calc:nk]': ('none', 'ratio:calc', 'nk'),
+    '[sqlproxy.x].[none:Time: Hour:nk]': ('none', 'Time: Hour', 'nk'),
+    '[sum:ratio:calc:qk]': ('sum', 'ratio:calc', 'qk'),
+    '[pcto:sum:Sales:qk]': ('pcto:sum', 'Sales', 'qk'),
+    '[cum:sum:a:b:qk]': ('cum:sum', 'a:b', 'qk'),
+    '[yr:Order Date:ok:3]': ('yr', 'Order Date', 'ok'),
+    '[none:a]]b:nk]': ('none', 'a]]b', 'nk'),
+}
+
+
+def make_renamed_columns(size):
+    renamed_columns = {}
+    for i in range(size):
+        name = f'Field {i}' if i % 3 else f'ratio:field {i}'
+        if i % 4 == 0:
+            renamed_columns[f'[sqlproxy.{i % 5}].[sum:{name}:qk]'] = f'"Sum of {i}"'
+        renamed_columns[f'[sqlproxy.{i % 5}].[none:{name}:nk]'] = f'"Title {i}"'
+    return renamed_columns
+
+
+def old_lookup(renamed_columns, names):
+    titles = {}
+    for name in names:
+        pattern = re.compile(rf".*\[none:{re.escape(name)}:nk\]")
+        for full_key, renamed_name in renamed_columns.items():
+            if pattern.match(full_key):
+                titles[name] = renamed_name
+                break
+    return titles
+
+
+def new_lookup(renamed_columns, names):
+    renamed_fields = renamed_field_lookup(renamed_columns)
+    return {name: renamed_fields[name] for name in names if name in renamed_fields}
+
+
+def main():
+    failures = [f"{key} parses as {parse_field_instance(key)}, expected {expected}"
+                for key, expected in PARSED.items() if parse_field_instance(key) != expected]
+
+    print(f"{'views':>8} {'old s':>10} {'new s':>10}")
+    for size in SIZES:
+        renamed_columns = make_renamed_columns(size)
+        names = [f'Field {i}' if i % 3 else f'ratio:field {i}' for i in range(size)]
+        start = time.perf_counter()
+        old = old_lookup(renamed_columns, names)
+        old_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        new = new_lookup(renamed_columns, names)
+        new_seconds = time.perf_counter() - start
+        changed = [name for name, title in old.items() if new.get(name) != title]
+        if changed:
+            failures.append(f"{len(changed)} of {size} views get another title than before, e.g. {changed[0]!r}: "
+                            f"{new.get(changed[0])!r} instead of {old[changed[0]]!r}")
+        print(f"{size:>8} {old_seconds:>10.4f} {new_seconds:>10.4f}")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Kills a command line run (tableau_cli.py) halfway through and resumes it, against the stub Tableau server, and checks that
+- the resumed run downloads only the workbooks the manifest does not have as done,
+- the output ends up with every workbook exactly once, extracted like the local file,
+- the manifest has every workbook as done.
+
+Run from the repository root: python benchmarks/bench_resume.py
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_tableau_server import StubTableauServer
+from synthetic_workbook import write_workbook
+from tableau_metadata_extractor import extract_workbook, load_records
+from tableau_records import record_default
+from tableau_runs import DONE, RunManifest
+
+
+def cli(arguments, env, cwd):
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, 'tableau_cli.py')] + arguments, env=env, cwd=cwd,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def done_count(runs_dir):
+    manifests = os.listdir(runs_dir) if os.path.isdir(runs_dir) else []
+    if not manifests:
+        return 0, None
+    path = os.path.join(runs_dir, manifests[0])
+    with open(path, 'r', encoding='utf-8') as f:
+        return sum('"done"' in line for line in f), path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workbooks', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds the stub takes per download')
+    parser.add_argument('--kill-after', type=int, default=15, help='workbooks done when the run is killed')
+    args = parser.parse_args()
+    logging.getLogger('tableau_extractor').setLevel(logging.ERROR)
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        sources = {}
+        for i in range(args.workbooks):
+            extension = '.twbx' if i % 2 else '.twb'
+            sources[f'luid-{i}'] = write_workbook(os.path.join(directory, f'source-{i}{extension}'),
+                                                  worksheets=3 + i % 5, columns=10 + i % 7, seed=i)
+        work_dir = os.path.join(directory, 'work')
+        runs_dir = os.path.join(work_dir, 'runs')
+        os.makedirs(work_dir)
+        output = os.path.join(work_dir, 'out.jsonl')
+
+        with StubTableauServer(sources, latency=args.latency) as server:
+            env = dict(os.environ, TABLEAU_SERVER=server.url, TABLEAU_SITE='site', TABLEAU_TOKEN_NAME='name',
+                       TABLEAU_TOKEN_SECRET='secret')
+            common = ['--runs-dir', runs_dir, '--no-tables', '--download-workers', '2', '--extract-workers', '2']
+
+            start = time.perf_counter()
+            process = cli(['--site', '--output', output] + common, env, work_dir)
+            while process.poll() is None and done_count(runs_dir)[0] < args.kill_after:
+                time.sleep(0.02)
+            process.send_signal(signal.SIGKILL)
+            process.wait()
+            done, manifest_path = done_count(runs_dir)
+            first_requests = server.stats['requests']
+            print(f"killed after {done} workbooks, {first_requests} downloads")
+
+            process = cli(['--resume', manifest_path] + common, env, work_dir)
+            if process.wait() != 0:
+                failures.append(f"resumed run exited with {process.returncode}")
+            seconds = time.perf_counter() - start
+            resumed_requests = server.stats['requests'] - first_requests
+
+        print(f"{args.workbooks} workbooks in {seconds:.2f}s, {resumed_requests} downloads after resuming")
+        if resumed_requests > args.workbooks - done:
+            failures.append(f"{resumed_requests} downloads after resuming, {args.workbooks - done} workbooks were left")
+        records = list(load_records(output))
+        luids = [record['workbook_luid'] for record in records]
+        if sorted(luids) != sorted(sources):
+            failures.append(f"{len(luids)} records for {len(sources)} workbooks, {len(set(luids))} distinct")
+        for record in records:
+            expected = extract_workbook(record['workbook_luid'], sources[record['workbook_luid']], save_decoded=False)
+            if json.dumps(record, default=record_default) != json.dumps(expected, default=record_default):
+                failures.append(f"{record['workbook_luid']} extracts differently after resuming")
+        with RunManifest.load(manifest_path) as manifest:
+            if manifest.counts() != {DONE: args.workbooks}:
+                failures.append(f"manifest: {manifest.counts()}")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Loads synthetic workbooks into the SQLite store (tableau_sqlite_export) and checks that
+- a workbook_luid repeated in one batch, or in the json lines file, is stored once, with its last entry,
+- upserting workbooks that are already stored replaces them and keeps the full text index intact.
+
+Run from the repository root: python benchmarks/bench_sqlite.py
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_workbook import write_workbook
+from tableau_metadata_extractor import extract_workbook, save_records
+from tableau_sqlite_export import MetadataStore, write_sqlite
+
+
+def integrity_errors(store):
+    if not store.fts:
+        return None
+    try:
+        store.connection.execute("INSERT INTO columns_fts(columns_fts) VALUES ('integrity-check')")
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workbooks', type=int, default=50)
+    args = parser.parse_args()
+    logging.getLogger('tableau_extractor').setLevel(logging.ERROR)
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        records = []
+        for i in range(args.workbooks):
+            path = write_workbook(os.path.join(directory, f'source-{i}.twb'), worksheets=3 + i % 5, columns=10 + i % 7,
+                                  seed=i)
+            records.append(extract_workbook(f'luid-{i}', path, save_decoded=False))
+
+        start = time.perf_counter()
+        with MetadataStore(os.path.join(directory, 'once.db')) as store:
+            store.upsert(records)
+            expected = store.counts()
+        print(f"{len(records)} workbooks loaded in {time.perf_counter() - start:.2f}s: {expected}")
+
+        with MetadataStore(os.path.join(directory, 'repeated.db')) as store:
+            first, second = records[0], records[1]
+            try:
+                store.upsert([first])
+                written = store.upsert([first, first])
+                store.upsert([second, first, second])
+                store.upsert(records)
+                store.upsert(records + records[:5])
+            except Exception as e:
+                failures.append(f"upsert with a repeated workbook_luid fails: {type(e).__name__}: {e}")
+            else:
+                if written != 1:
+                    failures.append(f"upsert([u0, u0]) wrote {written} workbooks")
+                if store.counts() != expected:
+                    failures.append(f"after repeated upserts: {store.counts()}, loaded once: {expected}")
+                error = integrity_errors(store)
+                if error:
+                    failures.append(f"full text index after repeated upserts: {error}")
+
+        # an accumulated json lines file, the same workbooks extracted by two runs
+        json_path = os.path.join(directory, 'records.jsonl')
+        save_records(records, json_path)
+        save_records(records, json_path)
+        try:
+            counts = write_sqlite(json_path, os.path.join(directory, 'jsonl.db'), batch_size=args.workbooks * 2)
+        except Exception as e:
+            failures.append(f"write_sqlite with repeated workbook_luids fails: {type(e).__name__}: {e}")
+        else:
+            if counts != expected:
+                failures.append(f"write_sqlite with repeated workbook_luids: {counts}, loaded once: {expected}")
+    if failures:
+        raise SystemExit("\n".join(failures))
+    print("repeated workbook_luids are stored once")
+
+
+if __name__ == '__main__':
+    main()
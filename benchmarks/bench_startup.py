@@ -0,0 +1,76 @@
+"""
+Startup time of the scripts and of a short job (extracting one workbook), each in a fresh interpreter, and checks that
+- none of them loads a heavy dependency it does not use (pandas, pyarrow, requests, bs4, selenium),
+- each stays within the time budget on top of the bare interpreter start.
+
+Run from the repository root: python benchmarks/bench_startup.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_workbook import write_workbook
+
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'requests', 'bs4', 'selenium')
+
+# name -> python code, run from the repository root
+JOBS = {
+    'import tableau_metadata_extractor': 'import tableau_metadata_extractor',
+    'import tableau_cli': 'import tableau_cli',
+    'tableau_cli.py --help': 'import tableau_cli\ntry:\n    tableau_cli.main(["--help"])\nexcept SystemExit:\n    pass',
+    'extract one workbook': 'from tableau_metadata_extractor import extract_workbook\n'
+                            'extract_workbook("luid", {workbook!r}, save_decoded=False)',
+    'import tettra_scraper': 'import tettra_scraper',
+    'import confluencathor': 'import confluencathor',
+}
+
+REPORT = ('\nimport json as _json, sys as _sys\n'
+          'print(_json.dumps(sorted(name for name in {heavy!r} if name in _sys.modules)))')
+
+
+def run(code):
+    """
+    :return: (seconds, list of heavy modules loaded)
+    """
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    seconds = time.perf_counter() - start
+    return seconds, json.loads(output.strip().splitlines()[-1]) if output.strip() else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='runs of every job, the fastest one counts')
+    parser.add_argument('--budget-ms', type=float, default=250, help='time allowed on top of the bare interpreter')
+    args = parser.parse_args()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        workbook = write_workbook(os.path.join(directory, 'workbook.twbx'), worksheets=5, columns=20)
+        bare = min(run('pass')[0] for _ in range(args.repeat))
+        print(f"{'bare interpreter':36} {bare * 1000:7.0f} ms")
+        for name, code in JOBS.items():
+            code = code.format(workbook=workbook) + REPORT.format(heavy=HEAVY_MODULES)
+            runs = [run(code) for _ in range(args.repeat)]
+            seconds = min(seconds for seconds, _ in runs)
+            loaded = runs[0][1]
+            extra = (seconds - bare) * 1000
+            print(f"{name:36} {seconds * 1000:7.0f} ms  (+{extra:.0f} ms){'  loads ' + ', '.join(loaded) if loaded else ''}")
+            if loaded:
+                failures.append(f"{name} loads {', '.join(loaded)}")
+            if extra > args.budget_ms:
+                failures.append(f"{name} takes {extra:.0f} ms on top of the interpreter, the budget is {args.budget_ms:.0f} ms")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
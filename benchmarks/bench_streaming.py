@@ -0,0 +1,63 @@
+"""
+Compares the streaming parse (extract_workbook(streaming=True), Tableau.unpack_twbx_streaming) with the normal one
+on synthetic workbooks with thumbnails and a shared-views section. Both have to give exactly the same extracted_data,
+also for the columns outside worksheets and dashboards. The peak python memory of both is reported.
+
+Run from the repository root: python benchmarks/bench_streaming.py
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_workbook import write_workbook
+from tableau_metadata_extractor import extract_workbook
+from tableau_records import record_default
+
+SCALES = {
+    'small': dict(datasources=2, worksheets=5, dashboards=2, columns=20, calculations=5),
+    'large': dict(datasources=10, worksheets=80, dashboards=10, columns=150, calculations=40, metadata_records=150),
+}
+
+
+def measured(path, streaming):
+    tracemalloc.start()
+    try:
+        extracted_data = extract_workbook('benchmark', path, save_decoded=False, streaming=streaming)
+        return json.dumps(extracted_data, default=record_default), tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--thumbnail-bytes', type=int, default=100000, help='base64 thumbnail of every sheet')
+    args = parser.parse_args()
+    logging.getLogger('tableau_extractor').setLevel(logging.ERROR)
+    failures = []
+
+    print(f"{'workbook':>12} {'peak MB':>8} {'streaming peak MB':>18}")
+    with tempfile.TemporaryDirectory() as directory:
+        for scale, sizes in SCALES.items():
+            for extension in ('.twb', '.twbx'):
+                path = write_workbook(os.path.join(directory, f'{scale}{extension}'), shared_views=True,
+                                      thumbnail_bytes=args.thumbnail_bytes, **sizes)
+                output, peak = measured(path, streaming=False)
+                streamed, streaming_peak = measured(path, streaming=True)
+                print(f"{scale + extension:>12} {peak / 2 ** 20:>8.2f} {streaming_peak / 2 ** 20:>18.2f}")
+                if streamed != output:
+                    failures.append(f"{scale}{extension}: streaming extracts differently")
+                if 'SharedCol' not in output:
+                    failures.append(f"{scale}{extension}: the shared-views column is missing from the output")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
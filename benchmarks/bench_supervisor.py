@@ -0,0 +1,137 @@
+"""
+Runs synthetic workbooks mixed with pathological tasks through the SupervisedPool of run_extraction and checks that
+- a task that hangs is stopped after the timeout, one that eats memory once its worker passes the RSS cap,
+  and a worker that dies fails only its own task,
+- the pool stays at its size and every other workbook still extracts like it does in process,
+- shutdown(wait=False) returns at once and fails the running tasks (cancels the queued ones), nobody waits forever,
+- run_extraction quarantines a workbook that does not extract and skips it (no download) on the next run.
+
+Run from the repository root: python benchmarks/bench_supervisor.py
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import wait
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_tableau_server import StubTableauServer
+from synthetic_workbook import write_workbook
+from tableau_metadata_extractor import extract_workbook, run_extraction
+from tableau_records import record_default
+from tableau_rest import TableauRestClient
+from tableau_supervisor import ExtractionAborted, Quarantine, SupervisedPool, WorkbookMemoryExceeded, WorkbookTimeout
+
+
+def hang():
+    time.sleep(3600)
+
+
+def eat_memory(limit_bytes):
+    chunks = []
+    while sum(map(len, chunks)) < limit_bytes:
+        chunks.append(bytearray(16 << 20))  # bytearray zero-fills, so the pages are really resident
+        time.sleep(0.01)
+    time.sleep(3600)
+
+
+def crash():
+    os._exit(3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workbooks', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--timeout', type=float, default=5.0, help='seconds one task may take')
+    parser.add_argument('--max-rss-mb', type=int, default=512)
+    args = parser.parse_args()
+    logging.getLogger('tableau_extractor').setLevel(logging.ERROR)
+    max_rss_bytes = args.max_rss_mb << 20
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        sources = {}
+        for i in range(args.workbooks):
+            extension = '.twbx' if i % 2 else '.twb'
+            sources[f'luid-{i}'] = write_workbook(os.path.join(directory, f'source-{i}{extension}'),
+                                                  worksheets=3 + i % 5, columns=10 + i % 7, seed=i)
+
+        # the pathological tasks go in first, so the workbooks have to get through while the workers are replaced
+        start = time.perf_counter()
+        with SupervisedPool(args.workers, timeout=args.timeout, max_rss_bytes=max_rss_bytes) as pool:
+            bad = {'hang': (pool.submit(hang), WorkbookTimeout),
+                   'memory': (pool.submit(eat_memory, 2 * max_rss_bytes), WorkbookMemoryExceeded),
+                   'crash': (pool.submit(crash), ExtractionAborted)}
+            good = {code: pool.submit(extract_workbook, code, path, None, None, False) for code, path in sources.items()}
+            for name, (future, expected) in bad.items():
+                error = future.exception()
+                if type(error) is not expected:
+                    failures.append(f"{name}: expected {expected.__name__}, got {error!r}")
+            for code, future in good.items():
+                expected = extract_workbook(code, sources[code], save_decoded=False)
+                if json.dumps(future.result(), default=record_default) != json.dumps(expected, default=record_default):
+                    failures.append(f"{code} extracts differently in the pool")
+            restarts = pool.restarts
+            alive = sum(worker.process.is_alive() for worker in pool._workers)
+        seconds = time.perf_counter() - start
+        print(f"{len(good)} workbooks and {len(bad)} pathological tasks in {seconds:.2f}s, {restarts} workers replaced")
+        if restarts != len(bad):
+            failures.append(f"{restarts} workers replaced, expected {len(bad)}")
+        if alive != args.workers:
+            failures.append(f"{alive} workers alive after the run, the pool has {args.workers}")
+        if seconds > 2 * args.timeout + 30:
+            failures.append("the pool waited for the pathological tasks instead of stopping them")
+
+        pool = SupervisedPool(args.workers, timeout=None, max_rss_bytes=None)
+        running = [pool.submit(hang) for _ in range(args.workers)]
+        queued = [pool.submit(hang) for _ in range(args.workers)]
+        time.sleep(1)
+        start = time.perf_counter()
+        pool.shutdown(wait=False)
+        done, not_done = wait(running + queued, timeout=args.timeout)
+        print(f"shutdown(wait=False) with {len(running)} running tasks took {time.perf_counter() - start:.2f}s")
+        if not_done:
+            failures.append(f"{len(not_done)} tasks still pending after shutdown(wait=False)")
+        elif any(type(future.exception()) is not ExtractionAborted for future in running) \
+                or not all(future.cancelled() for future in queued):
+            failures.append("shutdown(wait=False) did not fail the running tasks and cancel the queued ones")
+        if any(worker.process.is_alive() for worker in pool._workers):
+            failures.append("workers alive after shutdown(wait=False)")
+
+        broken = os.path.join(directory, 'broken.twb')
+        with open(broken, 'w', encoding='utf-8') as f:
+            f.write("<?xml version='1.0' encoding='utf-8' ?>\n<workbook><datasources>")
+        served = dict(sources, broken=broken)
+        quarantine = Quarantine(os.path.join(directory, 'quarantine.json'))
+        current = os.getcwd()
+        os.chdir(directory)
+        try:
+            with StubTableauServer(served) as server:
+                with TableauRestClient(server.url, token_name='name', token_secret='secret') as client:
+                    records, failed = run_extraction(list(served), client, extract_workers=args.workers,
+                                                     retry_delay=0, output_path=None, quarantine=quarantine)
+                    first_requests = server.stats['requests']
+                    again, failed_again = run_extraction(list(served), client,
+                                                         extract_workers=args.workers, retry_delay=0,
+                                                         output_path=None, quarantine=Quarantine(quarantine.path))
+                    second_requests = server.stats['requests'] - first_requests
+        finally:
+            os.chdir(current)
+        print(f"quarantine: {quarantine.report()}")
+        if failed != ['broken'] or 'broken' not in quarantine or len(records) != len(sources):
+            failures.append(f"first run: {len(records)} extracted, failed {failed}, quarantine {quarantine.report()}")
+        if failed_again != ['broken'] or len(again) != len(sources) or second_requests != len(sources):
+            failures.append(f"second run: {len(again)} extracted, failed {failed_again}, "
+                            f"{second_requests} downloads for {len(sources)} workbooks")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
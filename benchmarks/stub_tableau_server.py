@@ -0,0 +1,181 @@
+"""
+Local stand-in for the parts of the Tableau REST API the extractor uses: sign in / sign out,
+GET /api/<version>/sites/<site-id>/workbooks (the paged listing, every workbook in project 'Default') and
+GET /api/<version>/sites/<site-id>/workbooks/<workbook-id>/content.
+It can answer with 429 + Retry-After, expire tokens after a number of requests and add latency,
+and counts connections, requests and the highest number of requests served at once.
+
+    with StubTableauServer({'luid1': 'Report.twbx'}, rate_limit_every=5) as server:
+        client = TableauRestClient(server.url, token_name='name', token_secret='secret')
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+SITE_ID = 'stub-site-id'
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients closing their keep-alive connections are not errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubTableauServer:
+    def __init__(self, workbooks, rate_limit_every=0, retry_after=0, token_requests=0, latency=0.0):
+        """
+        :param workbooks: dict workbook id -> path of the .twb / .twbx served as its content.
+        :param rate_limit_every: every n-th content request gets 429, 0 for never.
+        :param retry_after: Retry-After seconds sent with the 429.
+        :param token_requests: a token expires (401) after this many content requests, 0 for never.
+        :param latency: seconds every content request takes.
+        """
+        self.workbooks = workbooks
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.token_requests = token_requests
+        self.latency = latency
+        self.tokens = {}
+        self.stats = {'connections': 0, 'sign_ins': 0, 'sign_outs': 0, 'requests': 0, 'rate_limited': 0,
+                      'expired': 0, 'max_in_flight': 0}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def setup(self):
+                super().setup()
+                stub._count('connections')
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=b'', headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path.endswith('/auth/signin'):
+                    credentials = json.loads(body)['credentials']
+                    if not (credentials.get('personalAccessTokenName') or credentials.get('name')):
+                        return self._send(401)
+                    token = uuid.uuid4().hex
+                    with stub._lock:
+                        stub.tokens[token] = 0
+                    stub._count('sign_ins')
+                    site = {'id': SITE_ID, 'contentUrl': credentials['site']['contentUrl']}
+                    answer = {'credentials': {'token': token, 'site': site, 'user': {'id': 'stub-user'}}}
+                    return self._send(200, json.dumps(answer).encode('utf-8'), {'Content-Type': 'application/json'})
+                if self.path.endswith('/auth/signout'):
+                    with stub._lock:
+                        stub.tokens.pop(self.headers.get('X-Tableau-Auth'), None)
+                    stub._count('sign_outs')
+                    return self._send(204)
+                self._send(404)
+
+            def do_GET(self):
+                token = self.headers.get('X-Tableau-Auth')
+                listing = re.match(r'/api/[^/]+/sites/([^/]+)/workbooks(?:\?(.*))?$', self.path)
+                if listing:
+                    with stub._lock:
+                        known = token in stub.tokens
+                    return self._send(*self._listing(listing, known))
+                match = re.match(r'/api/[^/]+/sites/([^/]+)/workbooks/([^/?]+)/content', self.path)
+                if not match:
+                    return self._send(404)
+                with stub._lock:
+                    stub.stats['requests'] += 1
+                    number = stub.stats['requests']
+                    known = token in stub.tokens
+                    expired = False
+                    if known:
+                        stub.tokens[token] += 1
+                        expired = bool(stub.token_requests) and stub.tokens[token] > stub.token_requests
+                    stub._in_flight += 1
+                    stub.stats['max_in_flight'] = max(stub.stats['max_in_flight'], stub._in_flight)
+                try:
+                    answer = self._content(match, known and not expired, number)
+                finally:
+                    # counted out before answering, a client that got its answer may already send the next request
+                    with stub._lock:
+                        stub._in_flight -= 1
+                self._send(*answer)
+
+            def _listing(self, match, valid_token):
+                if not valid_token:
+                    return 401, b'{"error": {"code": "401002"}}', {'Content-Type': 'application/json'}
+                if match.group(1) != SITE_ID:
+                    return 404, b'', {}
+                query = parse_qs(match.group(2) or '')
+                page_size = int(query.get('pageSize', ['100'])[0])
+                page_number = int(query.get('pageNumber', ['1'])[0])
+                project = 'Default'
+                wanted = query.get('filter', [f'projectName:eq:{project}'])[0]
+                workbooks = [] if wanted != f'projectName:eq:{project}' else [
+                    {'id': workbook_id, 'name': os.path.splitext(os.path.basename(path))[0],
+                     'project': {'id': 'default-project', 'name': project},
+                     'updatedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(os.path.getmtime(path)))}
+                    for workbook_id, path in stub.workbooks.items()]
+                page = workbooks[(page_number - 1) * page_size:page_number * page_size]
+                answer = {'pagination': {'pageNumber': str(page_number), 'pageSize': str(page_size),
+                                         'totalAvailable': str(len(workbooks))},
+                          'workbooks': {'workbook': page}}
+                return 200, json.dumps(answer).encode('utf-8'), {'Content-Type': 'application/json'}
+
+            def _content(self, match, valid_token, number):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if not valid_token:
+                    stub._count('expired')
+                    return 401, b'{"error": {"code": "401002"}}', {'Content-Type': 'application/json'}
+                if stub.rate_limit_every and number % stub.rate_limit_every == 0:
+                    stub._count('rate_limited')
+                    return 429, b'', {'Retry-After': str(stub.retry_after)}
+                path = stub.workbooks.get(match.group(2))
+                if match.group(1) != SITE_ID or path is None:
+                    return 404, b'', {}
+                with open(path, 'rb') as f:
+                    content = f.read()
+                name = os.path.basename(path)
+                content_type = 'application/xml' if name.endswith('.twb') else 'application/octet-stream'
+                return 200, content, {'Content-Type': content_type,
+                                      'Content-Disposition': f'name="tableau_workbook"; filename="{name}"'}
+
+        return Handler
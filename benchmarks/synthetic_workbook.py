@@ -0,0 +1,168 @@
+"""
+Synthetic Tableau workbooks for the benchmarks. The xml has the structure the extractor reads:
+published datasources with metadata-records, calculations and parameters with members, worksheets with
+datasource-dependencies and renamed columns, dashboards with repository-locations and windows.
+
+Write one by hand: python benchmarks/synthetic_workbook.py out.twbx --datasources 10 --columns 200
+"""
+import argparse
+import random
+import zipfile
+from xml.sax.saxutils import quoteattr
+
+
+def make_twb(datasources=3, worksheets=5, dashboards=2, columns=8, calculations=3, members=3, metadata_records=6,
+             seed=1, shared_views=False, thumbnail_bytes=0):
+    """
+    :param datasources: published (sqlproxy) datasources, the Parameters datasource comes on top.
+    :param worksheets: worksheets, each one uses one datasource and renames one of its columns.
+    :param dashboards: dashboards, each one with a window and a repository-location.
+    :param columns: columns of every datasource (also listed in the worksheets using it).
+    :param calculations: calculated fields of every datasource.
+    :param members: members of every parameter.
+    :param metadata_records: metadata-records of every datasource connection.
+    :param seed: the same seed gives the same xml.
+    :param shared_views: add a top-level shared-views section with columns of its own, like Tableau writes for
+        datasources that share filters across worksheets.
+    :param thumbnail_bytes: size of the base64 thumbnail of every worksheet and dashboard, 0 for no thumbnails.
+    :return: the .twb xml as a string.
+    """
+    rnd = random.Random(seed)
+    out = []
+    w = out.append
+    w("<?xml version='1.0' encoding='utf-8' ?>\n<workbook version='18.1'>")
+    w("<repository-location derived-from='http://localhost:8000/t/site/workbooks/Report?rev=1.0' id='Report' "
+      "path='/t/site/workbooks' revision='1.0' site='site' />")
+    w("<datasources>")
+    w("<datasource hasconnection='false' inline='true' name='Parameters' version='18.1'>")
+    for p in range(2):
+        w(f"<column caption='Parameter {p}' datatype='string' name='[Parameter {p}]' param-domain-type='list' "
+          f"role='measure' type='nominal' value='&quot;A&quot;'>")
+        w("<calculation class='tableau' formula='&quot;A&quot;' /><members>")
+        for m in range(members):
+            w(f"<member value='&quot;Option {m}&quot;' />")
+        w("</members></column>")
+    w("</datasource>")
+    for d in range(datasources):
+        w(f"<datasource caption='Datasource {d}' inline='true' name='sqlproxy.ds{d}' version='18.1'>")
+        w(f"<repository-location derived-from='http://localhost:8000/t/site/datasources/DS{d}?rev=1.1' id='DS{d}' "
+          f"path='/t/site/datasources' revision='1.1' site='site' />")
+        w(f"<connection class='sqlproxy' dbname='DS{d}db' channel='https'>"
+          f"<relation name='sqlproxy' table='[sqlproxy]' type='table' /><metadata-records>")
+        for r in range(metadata_records):
+            record_class = 'measure' if r % 3 == 0 else 'column'
+            w(f"<metadata-record class='{record_class}'><remote-name>Col{r}</remote-name>"
+              f"<local-name>[Col{r}]</local-name><caption>Col {r}</caption>")
+            if r % 2 == 0:
+                w(f"<attributes><attribute datatype='string' name='formula'>SUM([Col{r}])</attribute></attributes>")
+            w("</metadata-record>")
+        w("</metadata-records></connection>")
+        for c in range(columns):
+            role = rnd.choice(['measure', 'dimension'])
+            w(f"<column caption='Col {c}' datatype='real' name='[Col{c}]' role='{role}' type='quantitative' />")
+        for k in range(calculations):
+            w(f"<column caption='Calculation {d}.{k}' datatype='real' name='[Calculation_{d}{k}]' role='measure' "
+              f"type='quantitative'><calculation class='tableau' formula={quoteattr(f'SUM([Col{k}]) / {k + 1}')} />"
+              f"</column>")
+        w("</datasource>")
+    w("</datasources><worksheets>")
+    for s in range(worksheets):
+        d = s % max(datasources, 1)
+        w(f"<worksheet name='Sheet {s}'><table><view><datasources>"
+          f"<datasource caption='Datasource {d}' name='sqlproxy.ds{d}' /><datasource name='Parameters' /></datasources>")
+        w(f"<datasource-dependencies datasource='sqlproxy.ds{d}'>")
+        for c in range(columns):
+            w(f"<column caption='Col {c}' datatype='real' name='[Col{c}]' role='measure' type='quantitative' />")
+        for k in range(calculations):
+            w(f"<column caption='Calculation {d}.{k}' datatype='real' name='[Calculation_{d}{k}]' role='measure' "
+              f"type='quantitative'><calculation class='tableau' formula={quoteattr(f'SUM([Col{k}]) / {k + 1}')} />"
+              f"</column>")
+        w("<column-instance column='[Col0]' derivation='None' name='[none:Col0:nk]' pivot='key' type='nominal' />")
+        w("</datasource-dependencies>")
+        w("<datasource-dependencies datasource='Parameters'>")
+        w("<column caption='Parameter 0' datatype='string' name='[Parameter 0]' param-domain-type='list' role='measure' "
+          "type='nominal' value='&quot;A&quot;'><calculation class='tableau' formula='&quot;A&quot;' /><members>")
+        for m in range(members):
+            w(f"<member value='&quot;Option {m}&quot;' />")
+        w("</members></column></datasource-dependencies>")
+        w("</view><style>")
+        w(f"<style-rule element='cell'><format attr='title' field='[sqlproxy.ds{d}].[none:Col{s % max(columns, 1)}:nk]' "
+          f"value='Renamed {s}' /></style-rule>")
+        if s == 1:
+            w("<style-rule element='header'><format attr='title' field='[Parameters].[none:Parameter 0:nk]' "
+              "value='Renamed parameter' /></style-rule>")
+        w("</style></table>")
+        if s % 2 == 0:
+            w(f"<repository-location derived-from='http://localhost:8000/t/site/workbooks/Report/Sheet{s}?rev=' "
+              f"id='Sheet{s}' path='/t/site/workbooks/Report' revision='' site='site' />")
+        w("</worksheet>")
+    w("</worksheets><dashboards>")
+    for b in range(dashboards):
+        w(f"<dashboard name='Dashboard {b}'>")
+        w(f"<repository-location derived-from='http://localhost:8000/t/site/workbooks/Report/Dashboard{b}?rev=' "
+          f"id='Dashboard{b}' path='/t/site/workbooks/Report' revision='' site='site' />")
+        w("<datasources><datasource name='Parameters' /><datasource caption='Datasource 0' name='sqlproxy.ds0' />"
+          "</datasources>")
+        w("<datasource-dependencies datasource='Parameters'><column caption='Parameter 1' datatype='string' "
+          "name='[Parameter 1]' param-domain-type='list' role='measure' type='nominal' value='&quot;A&quot;'><members>")
+        for m in range(members):
+            w(f"<member value='&quot;Option {m}&quot;' />")
+        w("</members></column></datasource-dependencies><zones /></dashboard>")
+    w("</dashboards><windows>")
+    for s in range(worksheets):
+        w(f"<window class='worksheet' name='Sheet {s}'><cards /></window>")
+    for b in range(dashboards):
+        w(f"<window class='dashboard' name='Dashboard {b}'><viewpoints /></window>")
+    w("</windows>")
+    if thumbnail_bytes:
+        image = ''.join(rnd.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/')
+                        for _ in range(thumbnail_bytes))
+        w("<thumbnails>")
+        for name in [f'Sheet {s}' for s in range(worksheets)] + [f'Dashboard {b}' for b in range(dashboards)]:
+            w(f"<thumbnail height='192' name='{name}' width='192'>{image}</thumbnail>")
+        w("</thumbnails>")
+    if shared_views:
+        w("<shared-views><shared-view name='sqlproxy.ds0'><datasources><datasource caption='Datasource 0' "
+          "name='sqlproxy.ds0' /></datasources><datasource-dependencies datasource='sqlproxy.ds0'>"
+          "<column caption='Shared column' datatype='string' name='[SharedCol]' role='dimension' type='nominal' />"
+          "</datasource-dependencies></shared-view></shared-views>")
+    w("</workbook>")
+    return "\n".join(out)
+
+
+def write_workbook(path, packaged=None, extract_bytes=1000, **sizes):
+    """
+    Writes a synthetic workbook, a zipped .twbx (with a dummy extract next to the .twb) or a plain .twb.
+    :param packaged: True for .twbx, False for .twb, None to go by the extension of path.
+    :param extract_bytes: size of the dummy .hyper extract in the .twbx.
+    :param sizes: keyword arguments of make_twb.
+    :return: path
+    """
+    if packaged is None:
+        packaged = path.endswith('.twbx')
+    xml = make_twb(**sizes)
+    if packaged:
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr('Report.twb', xml)
+            zip_file.writestr('Data/Extracts/extract.hyper', b'\0' * extract_bytes)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(xml)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help='.twb or .twbx file to write')
+    for name, default in (('datasources', 3), ('worksheets', 5), ('dashboards', 2), ('columns', 8),
+                          ('calculations', 3), ('members', 3), ('metadata-records', 6), ('seed', 1),
+                          ('thumbnail-bytes', 0)):
+        parser.add_argument(f'--{name}', type=int, default=default)
+    parser.add_argument('--shared-views', action='store_true')
+    args = vars(parser.parse_args())
+    path = args.pop('path')
+    write_workbook(path, **args)
+
+
+if __name__ == '__main__':
+    main()
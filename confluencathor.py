@@ -1,4 +1,4 @@
-from bs4 import BeautifulSoup, NavigableString, Tag
+import json
 import re
 
 space_key = ""
@@ -43,6 +43,8 @@ def encode_url_for_confluence(url):
     return confluence_url
 
 def convert_html_to_confluence_format(html_content):
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, 'html.parser')
 
     # Clean up scripts, styles, and unnecessary tags
@@ -71,15 +73,11 @@ def convert_html_to_confluence_format(html_content):
 
 
 confluence_API = ""
-import json
-import requests
-from bs4 import BeautifulSoup
-
-with open('', 'r') as file:
-    data = json.load(file)
 
 # Filters out the non existing or archived pages
 def check_page_status(pages):
+    from bs4 import BeautifulSoup
+
     total_pages = len(pages)
     accessible_pages = []
 
@@ -104,12 +102,9 @@ def check_page_status(pages):
 
     #print(f"Filtered pages saved to 'filtered_pages.json'")
 
-with open('all_scrapped_data_combined.json', 'r') as file:
-    tettra = json.load(file)
-
-#check_page_status(tettra)
-
 def extract_folders_and_subfolders(html_content):
+    from bs4 import BeautifulSoup
+
     # Initialize BeautifulSoup with the HTML content
     soup = BeautifulSoup(html_content, 'html.parser')
 
@@ -133,24 +128,9 @@ def extract_folders_and_subfolders(html_content):
     return folder_number, subfolder_number
 
 
-#### Tettra categories
-with open('', 'r') as file:
-    categories_data = json.load(file)
-categories_dict = {category['id']: category['name'] for category in categories_data['categories']}
-folders_dict = {}
-
-# Include folders from each category
-for category in categories_data['categories']:
-    for folder in category['folders']:
-        folder_id = folder['id']
-        parent_folder_id = folder.get('parent_folder_id')  # Get parent_folder_id if it exists
-
-        if parent_folder_id is not None and parent_folder_id in folders_dict:
-            folder_id = parent_folder_id
-        folders_dict[folder_id] = folder['name']
-
-
 def get_or_create_page(title, space_key, parent_id=None):
+    import requests
+
     #print(f"Creating or getting page: Title={title}, Space={space_key}, ParentID={parent_id}")
     encoded_title = requests.utils.quote(title.replace("'", "\\'"))
 
@@ -211,6 +191,8 @@ def clean_json(article):
     return article
 
 def clean_html_structure(html_content):
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, 'html.parser')
     for tag in soup.find_all(text=True):
         stripped_text = tag.strip()
@@ -222,154 +204,187 @@ def clean_html_structure(html_content):
 
     return str(soup)
 
-with open('', 'r') as file:
-    tettra_article = json.load(file)
 
-    for article in tettra_article:
-        article = clean_json(article)
-        html_content = article['content']
-        html_content = clean_html_structure(html_content)
-        owned_by = None
-        owned_by = extract_owned_by([article])
-        print(owned_by)
-        print(type(owned_by))
-        urls = extract_url(article, 'extracted_url.txt')
+def main():
+    global confluence_auth
+    # requests and bs4 are only imported when the articles are really sent, not by importing the helpers above
+    import requests
+    from bs4 import BeautifulSoup
+
+    with open('', 'r') as file:
+        data = json.load(file)
+
+    with open('all_scrapped_data_combined.json', 'r') as file:
+        tettra = json.load(file)
+
+    #check_page_status(tettra)
+
+    #### Tettra categories
+    with open('', 'r') as file:
+        categories_data = json.load(file)
+    categories_dict = {category['id']: category['name'] for category in categories_data['categories']}
+    folders_dict = {}
+
+    # Include folders from each category
+    for category in categories_data['categories']:
+        for folder in category['folders']:
+            folder_id = folder['id']
+            parent_folder_id = folder.get('parent_folder_id')  # Get parent_folder_id if it exists
+
+            if parent_folder_id is not None and parent_folder_id in folders_dict:
+                folder_id = parent_folder_id
+            folders_dict[folder_id] = folder['name']
+
+    with open('', 'r') as file:
+        tettra_article = json.load(file)
+
+        for article in tettra_article:
+            article = clean_json(article)
+            html_content = article['content']
+            html_content = clean_html_structure(html_content)
+            owned_by = None
+            owned_by = extract_owned_by([article])
+            print(owned_by)
+            print(type(owned_by))
+            urls = extract_url(article, 'extracted_url.txt')
+
+            for url in urls:
+                confluence_url = encode_url_for_confluence(url)
+                confluence_content = html_content.replace(url, confluence_url)
+
+            url = article['url']
+            folder, subfolder = extract_folders_and_subfolders(html_content)
+            #print("path found:", url, folder, subfolder)
+            article = {
+                'url': article['url'],
+                'folder_id': folder,
+                'subfolder_id': subfolder,
+                'owned_by': owned_by,
+                'content': article['content']
+            }
 
-        for url in urls:
-            confluence_url = encode_url_for_confluence(url)
-            confluence_content = html_content.replace(url, confluence_url)
-
-        url = article['url']
-        folder, subfolder = extract_folders_and_subfolders(html_content)
-        #print("path found:", url, folder, subfolder)
-        article = {
-            'url': article['url'],
-            'folder_id': folder,
-            'subfolder_id': subfolder,
-            'owned_by': owned_by,
-            'content': article['content']
-        }
-
-        folder_id = int(article.get('folder_id', -1)) if article.get('folder_id') else -1
-        subfolder_id = int(article.get('subfolder_id', -1)) if article.get('subfolder_id') else -1
-
-        if folder_id in categories_dict:
-            article['category_name'] = categories_dict[folder_id]
-        if subfolder_id in folders_dict:
-            article['subfolder_name'] = folders_dict[subfolder_id]
-        else:
-            article['subfolder_name'] = 'Uncategorized'
+            folder_id = int(article.get('folder_id', -1)) if article.get('folder_id') else -1
+            subfolder_id = int(article.get('subfolder_id', -1)) if article.get('subfolder_id') else -1
 
-        folder_name = article['category_name']
-        subfolder_name = article['subfolder_name']
+            if folder_id in categories_dict:
+                article['category_name'] = categories_dict[folder_id]
+            if subfolder_id in folders_dict:
+                article['subfolder_name'] = folders_dict[subfolder_id]
+            else:
+                article['subfolder_name'] = 'Uncategorized'
 
-        #print(article)
-        confluence_url = "https://atlassian.net/wiki/rest/api/content"
-        confluence_auth = (email, confluence_API)
+            folder_name = article['category_name']
+            subfolder_name = article['subfolder_name']
 
-        folder_page_id = get_or_create_page(folder_name, space_key)
-        subfolder_page_id = get_or_create_page(subfolder_name, space_key, parent_id=folder_page_id)
+            #print(article)
+            confluence_url = "https://atlassian.net/wiki/rest/api/content"
+            confluence_auth = (email, confluence_API)
 
-        tettra_article = article
+            folder_page_id = get_or_create_page(folder_name, space_key)
+            subfolder_page_id = get_or_create_page(subfolder_name, space_key, parent_id=folder_page_id)
 
+            tettra_article = article
 
-        content = tettra_article.get('content', '')
 
-        # Extract the TITLE of the article
-        start_index = content.find("<title>") + len("<title>")
-        end_index = content.find("</title>")
+            content = tettra_article.get('content', '')
 
-        # Extract the ARTICLE
-        title = content[start_index:end_index].strip()
-        pattern = re.compile(r'\s*-\s*company\s*group\s*-\s*tettra\s*', re.IGNORECASE)
-        updated_title = re.sub(pattern, '', title).strip()
-        print("Updated Title:", updated_title)
-        title = updated_title
+            # Extract the TITLE of the article
+            start_index = content.find("<title>") + len("<title>")
+            end_index = content.find("</title>")
 
-        #print(f"Title: {title}\nContent: {content[:100]}...")
-        soup = BeautifulSoup(content, 'html.parser')
-        for script in soup(["script", "style"]):
-            script.extract()
-        draft_editor_content = soup.find('div', class_='public-DraftEditor-content')
-        article_html = str(draft_editor_content)
-        converted_html = convert_html_to_confluence_format(article_html)
-        owned_by = '5daf1a205480c10c3357aa7d'
-
-        #print(converted_html)
-        ownership_data = {
-            "type": "user",
-            "username": owned_by
-        }
-
-        # Sends data to CONFLUENCE
-        confluence_data = {
-            "type": "page",
-            "title": title,
-            "space": {
-                "key": space_key
-            },
-            "ancestors": [{"id": subfolder_page_id}],
-            "body": {
-                "storage": {
-                    "value": converted_html,
-                    "representation": "storage"
-                }
-            },
-            "metadata": {
-                "properties": {
-                    "editor": {
-                        "value": "v4"}
-                }
-            }                }
-        # Confluence API credentials and endpoint
-        confluence_url = "https://atlassian.net/wiki/rest/api/content"
-        confluence_auth = (email, confluence_API)
-
-        # Send the POST request to Confluence
-        response = requests.post(confluence_url, json=confluence_data, auth=confluence_auth)
-
-        # Check the response
-        if response.status_code == 200:
-            current_version = 1
-            print(response.text)
-            new_page_id = response.json().get('id')
-            print(f"Page created successfully! {new_page_id}")
-        else:
-            print(f"Failed to create page. Status code: {response.status_code}")
-            try:
-                print(response.json())
-            except json.JSONDecodeError:
-                print("Response content is not valid JSON.")
+            # Extract the ARTICLE
+            title = content[start_index:end_index].strip()
+            pattern = re.compile(r'\s*-\s*company\s*group\s*-\s*tettra\s*', re.IGNORECASE)
+            updated_title = re.sub(pattern, '', title).strip()
+            print("Updated Title:", updated_title)
+            title = updated_title
+
+            #print(f"Title: {title}\nContent: {content[:100]}...")
+            soup = BeautifulSoup(content, 'html.parser')
+            for script in soup(["script", "style"]):
+                script.extract()
+            draft_editor_content = soup.find('div', class_='public-DraftEditor-content')
+            article_html = str(draft_editor_content)
+            converted_html = convert_html_to_confluence_format(article_html)
+            owned_by = '5daf1a205480c10c3357aa7d'
+
+            #print(converted_html)
+            ownership_data = {
+                "type": "user",
+                "username": owned_by
+            }
+
+            # Sends data to CONFLUENCE
+            confluence_data = {
+                "type": "page",
+                "title": title,
+                "space": {
+                    "key": space_key
+                },
+                "ancestors": [{"id": subfolder_page_id}],
+                "body": {
+                    "storage": {
+                        "value": converted_html,
+                        "representation": "storage"
+                    }
+                },
+                "metadata": {
+                    "properties": {
+                        "editor": {
+                            "value": "v4"}
+                    }
+                }                }
+            # Confluence API credentials and endpoint
+            confluence_url = "https://atlassian.net/wiki/rest/api/content"
+            confluence_auth = (email, confluence_API)
+
+            # Send the POST request to Confluence
+            response = requests.post(confluence_url, json=confluence_data, auth=confluence_auth)
+
+            # Check the response
+            if response.status_code == 200:
+                current_version = 1
+                print(response.text)
+                new_page_id = response.json().get('id')
+                print(f"Page created successfully! {new_page_id}")
+            else:
+                print(f"Failed to create page. Status code: {response.status_code}")
+                try:
+                    print(response.json())
+                except json.JSONDecodeError:
+                    print("Response content is not valid JSON.")
+                    print(response.text)
+
+            confluence_url = f"https://atlassian.net/wiki/api/v2/pages/{new_page_id}"
+            headers = {
+                "Accept": "application/json",
+                "Content-Type": "application/json"
+            }
+            update_data = {
+                "id": new_page_id,
+                "status": "current",
+                "title": title,
+                "body": {
+                    "representation": "storage",
+                    "value": converted_html
+                },
+                "version": {
+                    "number": 2,
+                    "message": "updating page"},
+                "ownerId": owned_by
+            }
+            update_data_json = json.dumps(update_data)
+            response = requests.put(confluence_url, headers=headers, data=update_data_json, auth=confluence_auth)
+            if response.status_code == 200:
+                print(response.text)
+                print(f"Ownership transferred successfully to {owned_by}.")
+            else:
+                print(f"Failed to transfer ownership. Status code: {response.status_code}")
                 print(response.text)
 
-        confluence_url = f"https://atlassian.net/wiki/api/v2/pages/{new_page_id}"
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        }
-        update_data = {
-            "id": new_page_id,
-            "status": "current",
-            "title": title,
-            "body": {
-                "representation": "storage",
-                "value": converted_html
-            },
-            "version": {
-                "number": 2,
-                "message": "updating page"},
-            "ownerId": owned_by
-        }
-        update_data_json = json.dumps(update_data)
-        response = requests.put(confluence_url, headers=headers, data=update_data_json, auth=confluence_auth)
-        if response.status_code == 200:
-            print(response.text)
-            print(f"Ownership transferred successfully to {owned_by}.")
         else:
-            print(f"Failed to transfer ownership. Status code: {response.status_code}")
-            print(response.text)
-
-    else:
-        print("The list is empty.")
+            print("The list is empty.")
 
 
+if __name__ == '__main__':
+    main()
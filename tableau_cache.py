@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+
+from tableau_package import open_package
+from tableau_records import record_default
+
+# Part of every cache key. Bump it whenever a change of the extraction changes its output,
+# so the entries of the old extractor are no longer returned (they are evicted as the least recently used).
+EXTRACTOR_VERSION = 1
+
+
+def workbook_content_hash(twbx_path):
+    """
+    sha256 of the .twb xml of a workbook. For a .twbx only the .twb member is hashed, so a refreshed extract
+    or a new image in the package does not count as a change of the metadata.
+    :param twbx_path: downloaded .twb or .twbx file, or its content as bytes.
+    :return: hex digest.
+    """
+    digest = hashlib.sha256()
+    with open_package(twbx_path) as package:
+        if package is not None:
+            if package.twb_info is not None:
+                with package.open_twb() as file:
+                    for chunk in iter(lambda: file.read(1 << 20), b''):
+                        digest.update(chunk)
+        elif isinstance(twbx_path, (bytes, bytearray)):
+            digest.update(twbx_path)
+        else:
+            with open(twbx_path, 'rb') as file:
+                for chunk in iter(lambda: file.read(1 << 20), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    On-disk cache of the final extracted_data of workbooks, so unchanged workbooks are not unpacked and extracted again.
+    An entry is keyed by the workbook_luid and EXTRACTOR_VERSION plus either its revision (known before downloading)
+    or the content hash of its .twb (known after downloading). Least recently used entries are removed once the cache
+    is bigger than max_bytes.
+    """
+
+    def __init__(self, directory='.tableau_cache', max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith('.json'))
+
+    @staticmethod
+    def key(workbook_luid, revision=None, content_hash=None):
+        if revision is None and content_hash is None:
+            raise ValueError("Cache key needs a revision or a content hash")
+        if revision is not None:
+            return f"{workbook_luid}@v{EXTRACTOR_VERSION}@rev:{revision}"
+        return f"{workbook_luid}@v{EXTRACTOR_VERSION}@sha256:{content_hash}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, workbook_luid, revision=None, content_hash=None, count_miss=True):
+        """
+        :param count_miss: False when another lookup of the workbook follows on a miss (by the content hash,
+            after the download), so a workbook counts as one miss only.
+        :return: cached extracted_data, or None when the workbook (in this revision / content) is not cached.
+        """
+        path = self._path(self.key(workbook_luid, revision, content_hash))
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            if count_miss:
+                self.misses += 1
+            return None
+        os.utime(path)  # marks the entry as recently used for the eviction
+        self.hits += 1
+        return data
+
+    def put(self, workbook_luid, extracted_data, revision=None, content_hash=None):
+        """
+        Stores extracted_data under every key that is known (revision and/or content hash).
+        """
+        keys = []
+        if revision is not None:
+            keys.append(self.key(workbook_luid, revision=revision))
+        if content_hash is not None:
+            keys.append(self.key(workbook_luid, content_hash=content_hash))
+        if not keys:
+            raise ValueError("Cache key needs a revision or a content hash")
+
+        payload = json.dumps(extracted_data, default=record_default).encode('utf-8')
+        for key in keys:
+            path = self._path(key)
+            if os.path.exists(path):
+                self.size -= os.path.getsize(path)
+            # write to a temporary file first, so a crash never leaves half an entry behind
+            with open(path + '.tmp', 'wb') as f:
+                f.write(payload)
+            os.replace(path + '.tmp', path)
+            self.size += len(payload)
+        self.evict()
+
+    def evict(self):
+        if self.size <= self.max_bytes:
+            return
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')),
+                         key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.size <= self.max_bytes:
+                break
+            self.size -= entry.stat().st_size
+            os.remove(entry.path)
+            self.evictions += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'bytes': self.size}
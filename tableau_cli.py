@@ -0,0 +1,130 @@
+import argparse
+import logging
+import os
+import sys
+
+from tableau_cache import ExtractionCache
+from tableau_logging import logger, configure_logging
+from tableau_metadata_extractor import OUTPUT_JSONL_FILE, is_json_lines, run_extraction, write_tables
+from tableau_rest import TableauRestClient
+from tableau_runs import RunManifest
+from tableau_supervisor import EXTRACT_TIMEOUT, MAX_RSS_BYTES, Quarantine
+
+RUNS_DIRECTORY = 'tableau_runs'
+QUARANTINE_FILE = 'tableau_quarantine.json'
+
+
+def read_luids(path):
+    """
+    workbook_luids from a text file, one per line. Blank lines and lines starting with # are skipped.
+    :param path: the file, '-' for stdin.
+    """
+    file = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        return [line.strip() for line in file if line.strip() and not line.lstrip().startswith('#')]
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def site_workbooks(client, project=None):
+    """
+    Every workbook of the site from the REST listing.
+    :param project: only the workbooks of the project with this name.
+    :return: dict workbook_luid -> updatedAt, which serves as the revision for the extraction cache.
+    """
+    return {workbook['id']: workbook.get('updatedAt') for workbook in client.list_workbooks(project)}
+
+
+def start_run(luids, output_path=OUTPUT_JSONL_FILE, runs_dir=RUNS_DIRECTORY, revisions=None):
+    """
+    Starts a run with a fresh output file.
+    :return: tableau_runs.RunManifest, pass it to extract_run.
+    """
+    if not is_json_lines(output_path):
+        raise ValueError(f"The output of a run is a json lines file, not {output_path}")
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    manifest = RunManifest.create(luids, output_path, runs_dir, revisions)
+    logger.info("Run %s with %s workbooks, manifest %s", manifest.run_id, len(manifest.luids), manifest.path)
+    return manifest
+
+
+def extract_run(manifest, client, quarantine_path=QUARANTINE_FILE, cache_dir=None, **options):
+    """
+    Extracts the workbooks of a run that are not finished yet: all of them in a new run, the rest in a resumed one.
+    :param manifest: RunManifest from start_run or RunManifest.load.
+    :param client: tableau_rest.TableauRestClient, signed in.
+    :param quarantine_path: json file of the quarantined workbooks, kept across runs.
+    :param cache_dir: directory of a tableau_cache.ExtractionCache, None for no cache.
+    :param options: more run_extraction arguments, e.g. download_workers, extract_workers, extract_timeout.
+    :return: (dict status -> number of workbooks of the run, list of workbook_luids that failed)
+        The extracted workbooks are in manifest.output_path, see tableau_metadata_extractor.load_records.
+    """
+    codes = manifest.resume()
+    if len(codes) < len(manifest.luids):
+        logger.info("Resuming run %s, %s of %s workbooks left", manifest.run_id, len(codes), len(manifest.luids))
+    cache = ExtractionCache(cache_dir) if cache_dir is not None else None
+    with manifest:
+        _, failed = run_extraction(codes, client, output_path=manifest.output_path, cache=cache,
+                                   revisions=manifest.revisions, quarantine=Quarantine(quarantine_path),
+                                   manifest=manifest, **options)
+    counts = manifest.counts()
+    logger.info("Run %s: %s", manifest.run_id, counts)
+    return counts, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='tableau_cli.py', description='Extracts the metadata of Tableau workbooks.',
+        epilog='The server and the personal access token come from TABLEAU_SERVER, TABLEAU_SITE, TABLEAU_TOKEN_NAME '
+               'and TABLEAU_TOKEN_SECRET. Every run keeps a manifest in the runs directory, '
+               'an interrupted run is finished with --resume <manifest>.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--luids', metavar='FILE', help="workbook_luids, one per line ('-' for stdin)")
+    source.add_argument('--site', action='store_true', help='every workbook of the site, from the REST listing')
+    source.add_argument('--resume', metavar='MANIFEST', help='finish the run of this manifest')
+    parser.add_argument('--project', help='with --site, only the workbooks of this project')
+    parser.add_argument('--output', default=OUTPUT_JSONL_FILE,
+                        help='json lines file the workbooks are written to, replaced by a new run (default: %(default)s)')
+    parser.add_argument('--runs-dir', default=RUNS_DIRECTORY, help='where the manifests go (default: %(default)s)')
+    parser.add_argument('--fsync', action='store_true',
+                        help='fsync every workbook to the disk before it is marked as done (survives a power loss)')
+    parser.add_argument('--download-workers', type=int, default=4)
+    parser.add_argument('--extract-workers', type=int, help='extraction processes, one per CPU by default')
+    parser.add_argument('--timeout', type=float, default=EXTRACT_TIMEOUT,
+                        help='seconds one workbook may take to extract (default: %(default)s)')
+    parser.add_argument('--max-rss-mb', type=int, default=MAX_RSS_BYTES >> 20,
+                        help='memory one extraction process may use (default: %(default)s)')
+    parser.add_argument('--quarantine', default=QUARANTINE_FILE, help='quarantined workbooks (default: %(default)s)')
+    parser.add_argument('--cache', metavar='DIR', help='extraction cache directory, no cache by default')
+    parser.add_argument('--streaming', action='store_true',
+                        help='parse the workbooks with iterparse, dropping thumbnails and window layouts (less memory)')
+    parser.add_argument('--no-tables', action='store_true', help='do not write the csv tables after the run')
+    parser.add_argument('--verbose', action='store_true', help='debug logging')
+    parser.add_argument('--json-logs', action='store_true', help='log json lines')
+    args = parser.parse_args(argv)
+    if args.project and not args.site:
+        parser.error('--project needs --site')
+
+    configure_logging(logging.DEBUG if args.verbose else logging.INFO, json_format=args.json_logs)
+    with TableauRestClient.from_env() as client:
+        if args.resume:
+            manifest = RunManifest.load(args.resume)
+        elif args.site:
+            revisions = site_workbooks(client, args.project)
+            manifest = start_run(list(revisions), args.output, args.runs_dir, revisions)
+        else:
+            manifest = start_run(read_luids(args.luids), args.output, args.runs_dir)
+        _, failed = extract_run(manifest, client, args.quarantine, args.cache,
+                                download_workers=args.download_workers, extract_workers=args.extract_workers,
+                                extract_timeout=args.timeout, max_rss_bytes=args.max_rss_mb << 20,
+                                fsync=args.fsync, streaming=args.streaming)
+
+    if not args.no_tables and os.path.exists(manifest.output_path):
+        write_tables(manifest.output_path)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import json
+import os
+import time
+from collections import defaultdict
+
+from tableau_logging import logger
+from tableau_metadata_extractor import OUTPUT_FILE, flatten_record, load_records
+from tableau_records import record_default
+
+# Columns identifying a row of each table. all_columns_wb is left out, its rows do not carry the workbook.
+TABLE_KEYS = {
+    'workbooks': ('wbldbn',),
+    'views': ('wbldbn',),
+    'filters': ('wbldbn', 'caption'),
+    'columns': ('wbldbn', 'name'),
+    'datasources': ('wbldbn', 'id'),
+}
+
+
+def keyed_rows(entry):
+    """
+    Flattens one workbook and keys every row by its table key. The same key can repeat inside a workbook
+    (e.g. a column listed twice), so the n-th repetition gets n as the last part of the key.
+    :param entry: extracted_data of one workbook, or None.
+    :return: dict table name -> {key tuple: row}
+    """
+    tables = {table: {} for table in TABLE_KEYS}
+    if entry is None:
+        return tables
+    seen = defaultdict(int)
+    for table, row in flatten_record(entry):
+        if table not in TABLE_KEYS:
+            continue
+        key = tuple(row.get(column) for column in TABLE_KEYS[table])
+        occurrence = seen[(table, key)]
+        seen[(table, key)] += 1
+        tables[table][key + (occurrence,)] = row
+    return tables
+
+
+def diff_workbook(old_entry, new_entry):
+    """
+    Compares two snapshots of the same workbook table by table.
+    :param old_entry: previous extracted_data, None for a new workbook.
+    :param new_entry: current extracted_data, None for a removed workbook.
+    :return: list of changes {'op': 'insert' | 'update' | 'delete', 'table', 'key', 'row'}, deletes carry the old row.
+    """
+    old_tables = keyed_rows(old_entry)
+    new_tables = keyed_rows(new_entry)
+    changes = []
+    for table, key_columns in TABLE_KEYS.items():
+        old_rows = old_tables[table]
+        new_rows = new_tables[table]
+        for key, row in new_rows.items():
+            old_row = old_rows.get(key)
+            if old_row is None:
+                op = 'insert'
+            elif old_row != row:
+                op = 'update'
+            else:
+                continue
+            changes.append({'op': op, 'table': table, 'key': _key_dict(key_columns, key), 'row': row})
+        for key, row in old_rows.items():
+            if key not in new_rows:
+                changes.append({'op': 'delete', 'table': table, 'key': _key_dict(key_columns, key), 'row': row})
+    return changes
+
+
+def _key_dict(key_columns, key):
+    key_dict = dict(zip(key_columns, key))
+    key_dict['occurrence'] = key[-1]
+    return key_dict
+
+
+class SnapshotStore:
+    """
+    Last extracted_data of every workbook, one json file per workbook_luid.
+    """
+
+    def __init__(self, directory='tableau_snapshots'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, workbook_luid):
+        return os.path.join(self.directory, f'{workbook_luid}.json')
+
+    def get(self, workbook_luid):
+        try:
+            with open(self._path(workbook_luid), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, workbook_luid, extracted_data):
+        path = self._path(workbook_luid)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(extracted_data, f, default=record_default)
+        os.replace(path + '.tmp', path)
+
+    def remove(self, workbook_luid):
+        try:
+            os.remove(self._path(workbook_luid))
+        except FileNotFoundError:
+            pass
+
+
+def write_changelog(json_path=OUTPUT_FILE, snapshot_dir='tableau_snapshots', changelog_path='changelog.jsonl',
+                    removed_luids=()):
+    """
+    Incremental alternative to write_tables. Every workbook in json_path is compared with its previous snapshot and
+    only the inserted, updated and deleted rows are appended to changelog_path (json lines, one change per line),
+    together with the workbook_luid and the time of the run, for the warehouse to merge. Snapshots are updated afterwards,
+    so a workbook without changes writes nothing.
+    :param json_path: json or json lines file written by save_records.
+    :param removed_luids: workbooks that are gone from the site, all their rows are deleted.
+    :return: dict op -> number of changes written.
+    """
+    snapshots = SnapshotStore(snapshot_dir)
+    counts = {'insert': 0, 'update': 0, 'delete': 0}
+    run_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    def emit(changelog, workbook_luid, changes):
+        for change in changes:
+            change['workbook_luid'] = workbook_luid
+            change['run_at'] = run_at
+            changelog.write(json.dumps(change) + '\n')
+            counts[change['op']] += 1
+
+    with open(changelog_path, 'a', encoding='utf-8') as changelog:
+        for entry in load_records(json_path):
+            workbook_luid = entry['workbook_luid']
+            changes = diff_workbook(snapshots.get(workbook_luid), entry)
+            if changes:
+                emit(changelog, workbook_luid, changes)
+                changelog.flush()
+                snapshots.put(workbook_luid, entry)
+
+        for workbook_luid in removed_luids:
+            emit(changelog, workbook_luid, diff_workbook(snapshots.get(workbook_luid), None))
+            changelog.flush()
+            snapshots.remove(workbook_luid)
+
+    logger.info("Changelog written to %s: %s", changelog_path, counts)
+    return counts
@@ -0,0 +1,278 @@
+import json
+import os
+import re
+from collections import defaultdict, deque
+
+from tableau_logging import logger
+from tableau_metadata_extractor import OUTPUT_FILE, load_records
+
+# Tableau calculation language, just enough to find field references: strings and comments may contain brackets,
+# "]]" escapes a "]" inside a field name, and [datasource].[field] qualifies a reference.
+FORMULA_TOKEN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+  | (?P<field>\[(?:[^\]]|\]\])*\])
+  | (?P<number>\d+(?:\.\d*)?|\.\d+)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<operator><=|>=|<>|!=|==|[-+*/%^=<>(),.])
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+
+def tokenize_formula(formula):
+    """
+    Splits a calculation formula into tokens, whitespace left out.
+    :param formula: formula text, e.g. 'SUM([Sales]) / [Parameters].[Target]'.
+    :return: list of (kind, text), kind is one of comment, string, field, number, name, operator, other.
+    """
+    return [(match.lastgroup, match.group()) for match in FORMULA_TOKEN.finditer(formula or '')
+            if match.lastgroup != 'space']
+
+
+def formula_references(formula):
+    """
+    Fields a formula refers to.
+    :return: list of (datasource, field) in order of appearance, datasource None for an unqualified reference.
+        Field names keep their brackets as Tableau stores them ('[Sales]'), datasource names lose them.
+    """
+    tokens = tokenize_formula(formula)
+    references = []
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        if kind == 'field':
+            if i + 2 < len(tokens) and tokens[i + 1] == ('operator', '.') and tokens[i + 2][0] == 'field':
+                references.append((text[1:-1].replace(']]', ']'), tokens[i + 2][1]))
+                i += 3
+                continue
+            references.append((None, text))
+        i += 1
+    return references
+
+
+def workbook_edges(entry, calculations=None):
+    """
+    Dependency edges of one extracted workbook, "a uses b":
+    workbook -> dashboard -> column / datasource, column -> datasource, calculation -> the fields its formula refers to.
+    Nodes are tuples: ('workbook', luid), ('dashboard', luid, name), ('field', luid, datasource, name) and
+    ('datasource', id) for a published datasource (shared by every workbook using it) or ('datasource', luid, name).
+    :param entry: extracted_data of one workbook.
+    :param calculations: the whole calculation table of the workbook (extract_workbook with keep_calculations),
+        so calculations only other calculations use are in the graph too. Without it only the formulas of the
+        dashboard columns are followed.
+    :return: (set of (node, node) edges, dict field node -> caption)
+    """
+    workbook_luid = entry['workbook_luid']
+    workbook = ('workbook', workbook_luid)
+    edges = set()
+    captions = {}
+
+    def general_datasource_node(datasource):
+        # a datasource without an id is not published, it only belongs to this workbook
+        if datasource.get('id'):
+            return 'datasource', datasource['id']
+        return 'datasource', workbook_luid, datasource.get('Sqlproxy') or datasource.get('name')
+
+    # the columns name a published datasource by its sqlproxy (or its name)
+    published = {}
+    for dashboard in entry['Dashboards'].values():
+        for datasource in dashboard['GeneralInfo']['Data sources']:
+            for key in ('Sqlproxy', 'name'):
+                if datasource.get(key):
+                    published[datasource[key]] = general_datasource_node(datasource)
+
+    def datasource_node(name):
+        return published.get(name) or ('datasource', workbook_luid, name)
+
+    def add_formula(field, datasource, formula):
+        for reference_datasource, reference in formula_references(formula):
+            target_datasource = reference_datasource or datasource
+            target = ('field', workbook_luid, target_datasource, reference)
+            edges.add((field, target))
+            if target_datasource:
+                edges.add((target, datasource_node(target_datasource)))
+
+    for dashboard_name, dashboard in entry['Dashboards'].items():
+        dashboard_node = ('dashboard', workbook_luid, dashboard_name)
+        edges.add((workbook, dashboard_node))
+        edges.update((dashboard_node, general_datasource_node(datasource))
+                     for datasource in dashboard['GeneralInfo']['Data sources'])
+
+        for column in dashboard['Columns']:
+            name = column.get('name')
+            if not name:
+                continue
+            datasource = column.get('datasource')
+            field = ('field', workbook_luid, datasource, name)
+            edges.add((dashboard_node, field))
+            if column.get('caption'):
+                captions[field] = column['caption']
+            if datasource:
+                edges.add((field, datasource_node(datasource)))
+            add_formula(field, datasource, column.get('formula'))
+
+    for calculation in calculations or ():
+        name, datasource = calculation.get('column name'), calculation.get('datasource')
+        if not name:
+            continue
+        field = ('field', workbook_luid, datasource, name)
+        if datasource:
+            edges.add((field, datasource_node(datasource)))
+        add_formula(field, datasource, calculation.get('formula'))
+    return edges, captions
+
+
+def _node(value):
+    return tuple(value)
+
+
+class LineageGraph:
+    """
+    Site-wide dependency graph of the extracted workbooks, kept as adjacency sets in both directions, so
+    "what does X use" and "what uses X" are both a breadth-first walk over the reachable part only.
+    Workbooks are added and replaced one at a time. With a directory every workbook's edges are saved as
+    <workbook_luid>.json there, and the graph is loaded back from it on start.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.uses = {}
+        self.used_by = {}
+        self.captions = {}
+        self._edges = {}
+        self._fields = defaultdict(set)
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    def _path(self, workbook_luid):
+        return os.path.join(self.directory, f'{workbook_luid}.json')
+
+    def _load(self):
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith('.json'):
+                continue
+            with open(os.path.join(self.directory, file_name), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            edges = {(_node(source), _node(target)) for source, target in saved['edges']}
+            captions = {_node(node): caption for node, caption in saved['captions']}
+            self._add(saved['workbook_luid'], edges, captions)
+
+    def __len__(self):
+        return len(self._edges)
+
+    def __contains__(self, workbook_luid):
+        return workbook_luid in self._edges
+
+    def _add(self, workbook_luid, edges, captions):
+        self._edges[workbook_luid] = edges
+        for source, target in edges:
+            self.uses.setdefault(source, set()).add(target)
+            self.used_by.setdefault(target, set()).add(source)
+            for node in (source, target):
+                if node[0] == 'field':
+                    self._fields[node[3].lower()].add(node)
+        for node, caption in captions.items():
+            self.captions[node] = caption
+            self._fields[caption.lower()].add(node)
+
+    def _remove(self, workbook_luid):
+        for source, target in self._edges.pop(workbook_luid, ()):
+            for adjacency, node, other in ((self.uses, source, target), (self.used_by, target, source)):
+                neighbours = adjacency.get(node)
+                if neighbours is not None:
+                    neighbours.discard(other)
+                    if not neighbours:
+                        del adjacency[node]
+            for node in (source, target):
+                if node[0] == 'field' and node[1] == workbook_luid:
+                    caption = self.captions.pop(node, None)
+                    for key in (node[3].lower(), caption.lower() if caption else None):
+                        nodes = self._fields.get(key)
+                        if nodes is not None:
+                            nodes.discard(node)
+                            if not nodes:
+                                del self._fields[key]
+
+    def add_workbook(self, entry, calculations=None):
+        """
+        Adds a workbook, or replaces its previous version.
+        :param entry: extracted_data of the workbook.
+        :param calculations: its whole calculation table, see workbook_edges.
+        """
+        workbook_luid = entry['workbook_luid']
+        edges, captions = workbook_edges(entry, calculations)
+        self._remove(workbook_luid)
+        self._add(workbook_luid, edges, captions)
+        if self.directory is not None:
+            path = self._path(workbook_luid)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'workbook_luid': workbook_luid, 'edges': sorted(edges, key=repr),
+                           'captions': sorted(captions.items(), key=repr)}, f)
+            os.replace(path + '.tmp', path)
+
+    def remove_workbook(self, workbook_luid):
+        self._remove(workbook_luid)
+        if self.directory is not None:
+            try:
+                os.remove(self._path(workbook_luid))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _walk(start, adjacency, kinds):
+        seen = set(start)
+        queue = deque(start)
+        while queue:
+            for neighbour in adjacency.get(queue.popleft(), ()):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+        return {node for node in seen.difference(start) if kinds is None or node[0] in kinds}
+
+    def dependencies(self, nodes, kinds=None):
+        """
+        Everything the nodes use, directly or through other fields.
+        :param nodes: iterable of nodes.
+        :param kinds: only return these kinds of nodes, e.g. ('datasource',). None for all.
+        """
+        return self._walk(nodes, self.uses, kinds)
+
+    def dependents(self, nodes, kinds=None):
+        """
+        Everything that uses the nodes, directly or through other fields.
+        """
+        return self._walk(nodes, self.used_by, kinds)
+
+    def find_fields(self, name, datasource=None):
+        """
+        Field nodes of every workbook whose name ('[Sales]' or 'Sales') or caption is name, case insensitive.
+        :param datasource: only fields of this datasource (as the columns name it, e.g. 'sqlproxy.ds1').
+        """
+        key = name.lower()
+        nodes = self._fields.get(key, set()) | self._fields.get(f'[{key}]', set())
+        return {node for node in nodes if datasource is None or node[2] == datasource}
+
+    def dashboards_using(self, name, datasource=None):
+        """
+        Dashboards that depend on a field, directly or through calculations.
+        :return: set of ('dashboard', workbook_luid, dashboard name).
+        """
+        return self.dependents(self.find_fields(name, datasource), kinds=('dashboard',))
+
+
+def build_lineage(json_path=OUTPUT_FILE, directory='tableau_lineage', removed_luids=()):
+    """
+    Updates the saved lineage graph with every workbook in json_path.
+    :param json_path: json or json lines file written by save_records.
+    :param removed_luids: workbooks that are gone from the site.
+    :return: LineageGraph
+    """
+    graph = LineageGraph(directory)
+    for entry in load_records(json_path):
+        graph.add_workbook(entry)
+    for workbook_luid in removed_luids:
+        graph.remove_workbook(workbook_luid)
+    logger.info("Lineage of %s workbooks is in %s", len(graph), directory)
+    return graph
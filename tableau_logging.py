@@ -0,0 +1,114 @@
+import json
+import logging
+import sys
+from collections import Counter
+
+# Below DEBUG, for the lines logged once per xml element. Off unless trace sampling is switched on.
+TRACE = 5
+logging.addLevelName(TRACE, 'TRACE')
+
+logger = logging.getLogger('tableau_extractor')
+
+
+class PhaseSummary(logging.Filter):
+    """
+    Counts the records of every phase (the method that logged them) by level, and in trace mode lets only
+    every sample_every-th TRACE record of each message through.
+    """
+
+    def __init__(self, sample_every=None):
+        super().__init__()
+        self.sample_every = sample_every
+        self.counts = Counter()
+        self.dropped = Counter()
+        self._seen = Counter()
+
+    def filter(self, record):
+        self.counts[(record.funcName, record.levelname)] += 1
+        if record.levelno != TRACE or not self.sample_every:
+            return True
+        self._seen[record.msg] += 1
+        if (self._seen[record.msg] - 1) % self.sample_every == 0:
+            return True
+        self.dropped[record.funcName] += 1
+        return False
+
+    def log_summary(self):
+        """
+        Logs one line per phase with the number of records of each level, then starts counting again.
+        """
+        phases = {}
+        for (phase, level), count in sorted(self.counts.items()):
+            phases.setdefault(phase, []).append(f"{level}={count}")
+        for phase, levels in phases.items():
+            dropped = f", {self.dropped[phase]} trace lines sampled out" if self.dropped[phase] else ""
+            logger.info("phase %s: %s%s", phase, " ".join(levels), dropped)
+        self.counts.clear()
+        self.dropped.clear()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One json object per line, for log collectors.
+    """
+
+    def format(self, record):
+        return json.dumps({
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'phase': record.funcName,
+            'message': record.getMessage(),
+        })
+
+
+def log_phase_summary():
+    """
+    Writes the per-phase counts collected since the last summary (one workbook) when debug logging is on.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    for log_filter in logger.filters:
+        if isinstance(log_filter, PhaseSummary):
+            log_filter.log_summary()
+
+
+def configure_logging(level=logging.INFO, trace_sample=None, handler=None, json_format=False):
+    """
+    Sets up the extractor logger. Messages are formatted only when a record is really written,
+    so disabled debug lines cost one level check.
+    :param level: lowest level written, e.g. logging.DEBUG.
+    :param trace_sample: write every n-th TRACE line of each message (per element dumps), None to leave them off.
+    :param handler: any logging handler, stderr by default.
+    :param json_format: write json lines instead of plain text.
+    :return: PhaseSummary with the counts of the run.
+    """
+    for old_filter in list(logger.filters):
+        logger.removeFilter(old_filter)
+    for old_handler in list(logger.handlers):
+        logger.removeHandler(old_handler)
+
+    handler = handler or logging.StreamHandler(sys.stderr)
+    if json_format:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(funcName)s: %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(TRACE if trace_sample else level)
+    logger.propagate = False
+
+    summary = PhaseSummary(trace_sample)
+    logger.addFilter(summary)
+    return summary
+
+
+def logging_settings():
+    """
+    The configure_logging arguments the extractor logger is set up with, for worker processes that start
+    with logging unconfigured (forkserver, spawn).
+    :return: dict, None when configure_logging has not been called.
+    """
+    summary = next((log_filter for log_filter in logger.filters if isinstance(log_filter, PhaseSummary)), None)
+    if summary is None:
+        return None
+    return {'level': logger.level, 'trace_sample': summary.sample_every,
+            'json_format': any(isinstance(handler.formatter, JsonFormatter) for handler in logger.handlers)}
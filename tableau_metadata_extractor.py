@@ -1,85 +1,359 @@
-import zipfile
-import xml.etree.ElementTree as ET
-from collections import OrderedDict
+import io
+import gc
+from collections import defaultdict
+from bisect import bisect_left, bisect_right
 import re
-import pandas as pd
+from functools import lru_cache
 import json
-import subprocess
 import sys
 import time
-import logging
-import requests
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from tableau_cache import workbook_content_hash
+from tableau_logging import logger, TRACE, log_phase_summary
+from tableau_metrics import PhaseMetrics, no_phase, write_metrics
+from tableau_package import open_package
+from tableau_records import compact_workbook, record_default
+from tableau_rest import SPOOL_MAX_MEMORY, WorkbookSpool
+from tableau_supervisor import EXTRACT_TIMEOUT, MAX_RSS_BYTES, Quarantine, SupervisedPool
+from tableau_xml import get_engine
+
+
+# workbooks which also get the measures of their datasources in the columns table
+DATASOURCE_ONLY_CODES = ['code1', 'code2']
+
+OUTPUT_FILE = 'TABLEAUDATAZEXTRAKTORU_test.json'
+# Same records as OUTPUT_FILE, one json object per line. Saving only appends, so it does not get slower with every workbook.
+OUTPUT_JSONL_FILE = 'TABLEAUDATAZEXTRAKTORU_test.jsonl'
+
+# Top-level parts of the workbook no extraction method reads, thrown away while streaming (the base64 images).
+# Every other section stays: the whole-workbook passes find columns and datasources wherever they are.
+STREAMING_DROPPED_SECTIONS = ('thumbnails',)
+
+# Top-level key of extracted_data with the calculation table of the workbook, only there when extract_workbook was
+# asked to keep it (for the lineage graph). remove_views_and_calculations deletes the table from the datasources,
+# run_extraction takes this key out again before the workbook is saved.
+LINEAGE_CALCULATIONS = 'Lineage calculations'
+
+# Last part of a field instance key, e.g. [sqlproxy.x].[none:Region:nk] or [sum:Sales:qk]. Some keys end with a number.
+# The name may contain colons itself ([none:ratio:calc:nk]), so only the first part is taken as the derivation here.
+FIELD_INSTANCE_PATTERN = re.compile(r'\[([a-z][a-z0-9]*):((?:[^\]]|\]\])+?):([a-z]{2})(?::\d+)?\]$')
+
+# Derivations a table calculation stacks on top of (pcto:sum:Sales:qk): aggregations and date parts.
+# A following part of the key counts as derivation only if it is one of these.
+FIELD_DERIVATIONS = frozenset((
+    'sum', 'avg', 'min', 'max', 'cnt', 'ctd', 'attr', 'med', 'stdev', 'stdevp', 'var', 'varp', 'usr',
+    'yr', 'qr', 'mn', 'wk', 'dy', 'wd', 'hr', 'mi', 'sc', 'my', 'mdy', 'iyr', 'iwk', 'iwd',
+    'tyr', 'tqr', 'tmn', 'twk', 'tdy', 'thr', 'tmi', 'tsc', 'tiyr', 'tiwk',
+))
+
+
+@lru_cache(maxsize=4096)
+def parse_field_instance(key):
+    """
+    Splits a field instance key into its parts.
+    :param key: e.g. '[sqlproxy.x].[none:Region:nk]'.
+    :return: (derivation, name, type) e.g. ('none', 'Region', 'nk'), None when the key is not a field instance.
+    """
+    match = FIELD_INSTANCE_PATTERN.search(key or '')
+    if match is None:
+        return None
+    derivation, name, field_type = match.groups()
+    if derivation != 'none':
+        prefix, _, rest = name.partition(':')
+        while rest and prefix in FIELD_DERIVATIONS:
+            derivation, name = f'{derivation}:{prefix}', rest
+            prefix, _, rest = name.partition(':')
+    return derivation, name, field_type
+
+
+def renamed_field_lookup(renamed_columns):
+    """
+    :param renamed_columns: dict field instance key -> renamed name, in document order.
+    :return: dict field name -> renamed name. A name resolves to its [none:name:nk] instance (the plain dimension)
+        if it was renamed, otherwise to the first renamed instance with any other derivation or type.
+    """
+    renamed_fields = {}
+    other_instances = {}
+    for key, renamed_name in renamed_columns.items():
+        parsed = parse_field_instance(key)
+        if parsed is None:
+            continue
+        derivation, name, field_type = parsed
+        if (derivation, field_type) == ('none', 'nk'):
+            renamed_fields.setdefault(name, renamed_name)
+        else:
+            other_instances.setdefault(name, renamed_name)
+    for name, renamed_name in other_instances.items():
+        renamed_fields.setdefault(name, renamed_name)
+    return renamed_fields
+
+
+class TwbIndex:
+    """
+    One-pass index over a parsed workbook, so the extraction methods do not have to walk the whole tree again and again.
+    Elements are kept in document order and looked up by tag and by (tag, name).
+    Subtree lookups use the pre-order position of every element, so "all columns under this datasource" is a bisect, not a rescan.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.elements = []
+        self.by_tag = defaultdict(list)
+        self.by_name = defaultdict(list)
+        self._positions = {}
+        self._tag_positions = defaultdict(list)
+        self._subtree_end = []
+        self._by_attr = {}
+        self._build()
+
+    def _build(self):
+        stack = [self.root]
+        while stack:
+            elem = stack.pop()
+            position = len(self.elements)
+            self.elements.append(elem)
+            self._positions[elem] = position
+            self.by_tag[elem.tag].append(elem)
+            self._tag_positions[elem.tag].append(position)
+            name = elem.get('name')
+            if name is not None:
+                self.by_name[(elem.tag, name)].append(elem)
+            stack.extend(reversed(elem))
+
+        # walking backwards means every child is finished before its parent
+        self._subtree_end = list(range(len(self.elements)))
+        for position in range(len(self.elements) - 1, -1, -1):
+            elem = self.elements[position]
+            if len(elem):
+                self._subtree_end[position] = self._subtree_end[self._positions[elem[-1]]]
+
+    def iter(self, tag=None, within=None):
+        """
+        Same result as `within.iter(tag)` (the element itself included), but served from the index.
+        :param tag: tag to look for, None means every element.
+        :param within: element whose subtree is searched, None means the whole workbook.
+        :return: list of matching elements in document order.
+        """
+        if within is None or within is self.root:
+            return self.elements if tag is None else self.by_tag.get(tag, [])
+        start = self._positions[within]
+        end = self._subtree_end[start]
+        if tag is None:
+            return self.elements[start:end + 1]
+        positions = self._tag_positions.get(tag, [])
+        low = bisect_left(positions, start)
+        high = bisect_right(positions, end)
+        return self.by_tag[tag][low:high]
+
+    def findall(self, tag, within=None):
+        """
+        Same result as `within.findall('.//tag')` - descendants only, the element itself is left out.
+        """
+        skip = self.root if within is None else within
+        return [elem for elem in self.iter(tag, within) if elem is not skip]
 
+    def named(self, tag, name):
+        return self.by_name.get((tag, name), [])
 
-token, site_id, auth_header, auth_header_xml = auth_tableau()
+    def children(self, elem, tag):
+        return [child for child in elem if child.tag == tag]
 
-codes = ['123457']
+    def lookup(self, tag, attr, value):
+        """
+        All elements with the given tag whose attribute equals value, e.g. ('datasource-dependencies', 'datasource', 'sqlproxy.x').
+        The lookup table for each (tag, attr) pair is built on first use.
+        """
+        key = (tag, attr)
+        if key not in self._by_attr:
+            table = defaultdict(list)
+            for elem in self.by_tag.get(tag, []):
+                table[elem.get(attr)].append(elem)
+            self._by_attr[key] = table
+        return self._by_attr[key].get(value, [])
 
-def download_workbook(code, site_id, auth_header_xml):
-	#Intentionally deleted
 
 class Tableau:
-    def __init__(self, twbx_path=None):
+    def __init__(self, twbx_path=None, engine=None, content=None):
+        """
+        :param twbx_path: downloaded .twb / .twbx workbook.
+        :param engine: xml parser engine, 'lxml' or 'etree' (see tableau_xml), None for the default (stdlib).
+        :param content: the workbook itself (bytes or a binary file object) instead of a file on disk.
+            Nothing is written next to it, there is no "dec_..._oded" copy.
+        """
+        self.engine = get_engine(engine)
         self.in_memory_files = {}
         self.twbx_path = twbx_path
+        self.content = content
         self.extracted_data = {}
         self.tree = None
         self.root = None
         self.datasource_info = {}
-        self.directory = os.path.dirname(twbx_path)
+        self.directory = os.path.dirname(twbx_path) if twbx_path else ''
+        # contents of a .twbx package (tableau_package.TwbxPackage.manifest), when unpack_twbx is asked for it
+        self.manifest = None
+
         self.renamed_columns = {}
+        # field name -> renamed name, see identify_renamed_columns
+        self.renamed_fields = {}
+        # dashboard name -> keys add_url wants at the top of the dashboard, the order is applied by move_general_info
+        self.leading_keys = {}
+        self._index = None
+
+    @property
+    def index(self):
+        """
+        Element index of the currently loaded workbook, built once on first use and rebuilt only when the root changes.
+        :return: TwbIndex over self.root.
+        """
+        if self._index is None or self._index.root is not self.root:
+            self._index = TwbIndex(self.root)
+        return self._index
 
     def identify_renamed_columns(self):
+        """
+        Collects the titles set in style rules, keyed by the field instance they rename, and the lookup by field name.
+        A name resolves to its [none:name:nk] instance (the plain dimension) if it was renamed, otherwise to the first
+        renamed instance with any other derivation or type (sum:, yr:, usr:, ...:qk).
+        :return: self.renamed_columns (key -> renamed name) and self.renamed_fields (field name -> renamed name).
+        """
         self.renamed_columns = {}
-        for style_rule in self.root.findall(".//style-rule"):
-            format_tag = style_rule.find(".//format[@attr='title']")
+        for style_rule in self.index.findall('style-rule'):
+            format_tag = self.engine.find(style_rule, ".//format[@attr='title']")
             if format_tag is not None:
                 renamed_column_name = format_tag.get('value')
                 original_column_identifier = format_tag.get('field')
                 self.renamed_columns[original_column_identifier] = renamed_column_name
 
-    def unpack_twbx(self):
+        self.renamed_fields = renamed_field_lookup(self.renamed_columns)
+
+    def _source(self):
+        """
+        What to read the workbook from - the in-memory content as a file object, or the downloaded file.
+        """
+        if self.content is None:
+            return self.twbx_path
+        if isinstance(self.content, (bytes, bytearray, memoryview)):
+            return io.BytesIO(self.content)
+        self.content.seek(0)
+        return self.content
+
+    def _is_twb(self):
+        """
+        Plain xml workbook (anything that is not a zip package)? Content is taken as .twb, a file goes by its extension.
+        """
+        return self.content is not None or os.path.splitext(self.twbx_path)[1] == '.twb'
+
+    def _open_package(self, package, save_file_name, manifest):
+        """
+        Collects the manifest and writes the decoded copy of a .twbx package.
+        :return: True when the package has a .twb to parse.
+        """
+        if manifest:
+            self.manifest = package.manifest()
+        if package.twb_info is None:
+            logger.warning("There is no .twb in %s.", self.twbx_path or 'the downloaded workbook')
+            return False
+        if save_file_name is not None:
+            with package.open_twb() as file, open(save_file_name, 'wb') as f:
+                shutil.copyfileobj(file, f)
+        return True
+
+    def unpack_twbx(self, streaming=False, save_decoded=True, manifest=False):
         """
         Unpacks workbook files downloaded with workbook_luid from tableau serves, checks whether it is casual .twb files or whether it is zip file / file containing image {.twbx].
         If yes, it unpacks the file and save as "dec_workbook_luid_oded" xml file.
+        Only the .twb member of a package is decompressed (see tableau_package), extracts and images are not read.
+        :param streaming: parse straight from the file / zip member with iterparse and drop the parts no extraction method reads.
+        :param save_decoded: write the "dec_workbook_luid_oded" copy of a .twbx workbook (never for in-memory content).
+        :param manifest: keep the list of package members with their sizes in self.manifest.
         :return: either .twb file or unpacked "dec_workbook_luid_oded" xml file.
         """
         # save_file_name = f"dec_{os.path.splitext(os.path.basename(self.twbx_path))[0]}_oded.xml"
-        save_file_name = os.path.join(self.directory,
-                                      f"dec_{os.path.splitext(os.path.basename(self.twbx_path))[0]}_oded.xml")
-
-        file_extension = os.path.splitext(self.twbx_path)[1]
-        if zipfile.is_zipfile(self.twbx_path):
-            with zipfile.ZipFile(self.twbx_path, 'r') as zip_ref:
-                for file_info in zip_ref.infolist():
-                    if file_info.filename.endswith('.twb'):
-                        with zip_ref.open(file_info.filename) as file:
-                            file_content = file.read().decode('utf-8')
-                            with open(save_file_name, 'w', encoding='utf-8') as f:
-                                f.write(file_content)
+        save_file_name = None
+        if save_decoded and self.content is None:
+            save_file_name = os.path.join(self.directory,
+                                          f"dec_{os.path.splitext(os.path.basename(self.twbx_path))[0]}_oded.xml")
+
+        if streaming:
+            self.unpack_twbx_streaming(save_file_name, manifest)
+        else:
+            source = self._source()
+            with open_package(source) as package:
+                if package is not None:
+                    if self._open_package(package, save_file_name, manifest):
+                        # the parser reads the zip member as it is decompressed, no decoded copy in memory
+                        with package.open_twb() as file:
                             try:
-                                self.tree = ET.ElementTree(ET.fromstring(file_content))
+                                self.tree = self.engine.parse(file)
                                 self.root = self.tree.getroot()
-                                for elem in self.root.iter():
-                                    print(elem.tag,
-                                          elem.attrib)
-                            except ET.ParseError:
-                                print("XML parsing failed. Skipping this file.")
-                    else:
-                        print(f"Skipping {file_info.filename} as it is not a .twb file.")
+                                if logger.isEnabledFor(TRACE):
+                                    for elem in self.index.elements:
+                                        logger.log(TRACE, "%s %s", elem.tag, elem.attrib)
+                            except self.engine.ParseError:
+                                logger.warning("XML parsing failed. Skipping this file.")
+                elif self._is_twb():
+                    try:
+                        self.tree = self.engine.parse(source)
+                        self.root = self.tree.getroot()
+                        logger.info("I've lovingly parsed the content of %s!",
+                                    self.twbx_path or 'the downloaded workbook')
+                    except self.engine.ParseError:
+                        logger.warning("XML parsing failed for the twb file.")
+                else:
+                    logger.warning("I'm not sure what this file type is, honey.")
 
-        elif file_extension == '.twb':
-            try:
-                self.tree = ET.parse(self.twbx_path)
-                self.root = self.tree.getroot()
-                print(f"I've lovingly parsed the content of {self.twbx_path}!")
-            except ET.ParseError:
-                print("XML parsing failed for the twb file.")
-        else:
-            print("I'm not sure what this file type is, honey.")
+        logger.info("I've unpacked content of %s into memory!", self.twbx_path or 'the downloaded workbook')
+
+    def unpack_twbx_streaming(self, save_file_name=None, manifest=False):
+        """
+        Low-memory version of unpack_twbx. The .twb is parsed with iterparse straight from the zip member (or from the .twb file),
+        without reading it into a string first. The sections in STREAMING_DROPPED_SECTIONS and the content of the windows are dropped
+        as soon as they are parsed, so the thumbnails and the window layouts never take memory. The extraction output is the same.
+        :param save_file_name: where to copy the decoded .twb of a .twbx workbook, None to skip the copy.
+        :param manifest: keep the list of package members with their sizes in self.manifest.
+        :return: self.tree and self.root filled with the pruned workbook.
+        """
+        source = self._source()
+        with open_package(source) as package:
+            if package is not None:
+                if self._open_package(package, save_file_name, manifest):
+                    with package.open_twb() as file:
+                        self._iterparse_workbook(file)
+            elif self._is_twb():
+                self._iterparse_workbook(source)
+            else:
+                logger.warning("I'm not sure what this file type is, honey.")
 
-        print(f"I've unpacked content of {self.twbx_path} into memory!")
+    def _iterparse_workbook(self, source):
+        """
+        Builds the workbook tree from source, dropping the sections in STREAMING_DROPPED_SECTIONS
+        and everything inside a window (only the window attributes are used) right when they are closed.
+        :param source: path or binary file object with the .twb xml.
+        :return: self.tree and self.root, left untouched when the xml is broken.
+        """
+        stack = []
+        try:
+            for event, elem in self.engine.iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    stack.append(elem)
+                    continue
+                stack.pop()
+                if not stack:
+                    self.root = elem
+                    self.tree = self.engine.tree(elem)
+                    break
+                section = stack[1].tag if len(stack) > 1 else elem.tag
+                if section in STREAMING_DROPPED_SECTIONS or (section == 'windows' and len(stack) > 2):
+                    # the parser reads ahead, later siblings may be attached already: search from the end
+                    parent = stack[-1]
+                    for position in range(len(parent) - 1, -1, -1):
+                        if parent[position] is elem:
+                            del parent[position]
+                            break
+        except self.engine.ParseError:
+            logger.warning("XML parsing failed. Skipping this file.")
 
     def extract_info_from_twb(self):
         """
@@ -89,7 +363,9 @@ class Tableau:
         :return: Json filled with "GeneralInfo": "Datasource", "Columns"
         """
 
-        for elem in self.tree.iter('repository-location'):
+        index = self.index
+
+        for elem in index.iter('repository-location'):
             report_name = elem.attrib.get('id', 'N/A')
 
             self.extracted_data['report_name'] = report_name
@@ -99,8 +375,8 @@ class Tableau:
         self.extracted_data['Views'] = []
         self.extracted_data['Data sources'] = []
 
-        for datasource in self.root.iter('datasource'):
-            for column in datasource.iter('column'):
+        for datasource in index.iter('datasource'):
+            for column in index.iter('column', within=datasource):
                 column_data = {
                     "View name": column.attrib.get('caption'),
                     "computation": column.attrib.get('name'),
@@ -113,29 +389,29 @@ class Tableau:
         self.extracted_data['Data sources'] = []
         something = True
 
-        for i, datasource in enumerate(self.root.iter('datasource')):
+        for i, datasource in enumerate(index.iter('datasource')):
             for child in datasource:
-                print("TAGS")
-                print(child.tag, child.attrib)
+                logger.log(TRACE, "TAGS")
+                logger.log(TRACE, "%s %s", child.tag, child.attrib)
             if 'hasconnection' in datasource.attrib:
-                print("Skipping datasource with hasconnection attribute.")
+                logger.debug("Skipping datasource with hasconnection attribute.")
                 continue
             if 'caption' in datasource.attrib and 'name' in datasource.attrib:
-                print(f"Debugging datasource: {datasource.attrib}")
-                repository_location = datasource.find('./repository-location')
-                print(f"Repository location: {repository_location}")
-                id = datasource.find('.//id')
-                path = datasource.find('.//path')
+                logger.debug("Debugging datasource: %s", datasource.attrib)
+                repository_location = self.engine.find(datasource, './repository-location')
+                logger.debug("Repository location: %s", repository_location)
+                id = self.engine.find(datasource, './/id')
+                path = self.engine.find(datasource, './/path')
                 sqlproxy = datasource.attrib.get('name')
-                connection_elem = datasource.find('./connection')
+                connection_elem = self.engine.find(datasource, './connection')
 
                 if connection_elem is not None:
                     classs = connection_elem.attrib.get('class')
                     dbname = connection_elem.attrib.get('dbname')
                 else:
-                    named_conn_elem = datasource.find('./connection/named-connections/named-connection/connection')
+                    named_conn_elem = self.engine.find(datasource, './connection/named-connections/named-connection/connection')
                     if named_conn_elem is not None:
-                        print(f"Named connection element: {named_conn_elem}")
+                        logger.debug("Named connection element: %s", named_conn_elem)
                         classs = named_conn_elem.attrib.get('class')
                         dbname = named_conn_elem.attrib.get('dbname')
                     else:
@@ -152,44 +428,44 @@ class Tableau:
 
                 else:
                     sqlproxy = datasource.attrib.get('name')
-                    datasources_elem = self.root.find('./datasources')
+                    datasources_elem = self.engine.find(self.root, './datasources')
                     for child in datasources_elem:
-                        print("Datasources elements:")
-                        print(f"Tag: {child.tag}, Text: {child.attrib}")
+                        logger.log(TRACE, "Datasources elements:")
+                        logger.log(TRACE, "Tag: %s, Text: %s", child.tag, child.attrib)
 
                     if datasources_elem is not None:
-                        for nested_datasource in datasources_elem.findall('./datasource'):
-                            print("pjuu")
-                            print(child.tag, child.attrib)
+                        for nested_datasource in self.engine.findall(datasources_elem, './datasource'):
+                            logger.log(TRACE, "pjuu")
+                            logger.log(TRACE, "%s %s", child.tag, child.attrib)
                             has_connection_elem = nested_datasource.attrib.get('hasconnection')
                             if has_connection_elem is None:
-                                repository_location = datasources_elem.find('./datasource/repository-location')
+                                repository_location = self.engine.find(datasources_elem, './datasource/repository-location')
                                 if repository_location is not None:
                                     url = repository_location.attrib.get('derived-from')
                                     id = repository_location.attrib.get('id')
                                     path = repository_location.attrib.get('path')
-                                    print(" i am here ")
+                                    logger.debug(" i am here ")
                                 else:
                                     url = None
 
                 if sqlproxy is None:
-                    named2 = datasource.find('./connection/named-connections/named-connection')
-                    print(f"named2 {named2}")
+                    named2 = self.engine.find(datasource, './connection/named-connections/named-connection')
+                    logger.debug("named2 %s", named2)
                     if named2 is not None:
-                        named2 = datasource.find('./connection/named-connections/named-connection')
+                        named2 = self.engine.find(datasource, './connection/named-connections/named-connection')
                         sqlproxy = named2.attrib.get('name')
                     if dbname is None:
-                        named2 = datasource.find('./connection/named-connections/named-connection/connection')
+                        named2 = self.engine.find(datasource, './connection/named-connections/named-connection/connection')
                         dbname = named2.attrib.get('dbname')
 
                 if dbname is None:
-                    named2 = datasource.find('./connection/named-connections/named-connection')
-                    print(f"named2 {named2}")
+                    named2 = self.engine.find(datasource, './connection/named-connections/named-connection')
+                    logger.debug("named2 %s", named2)
                     if named2 is not None:
-                        named2 = datasource.find('./connection/named-connections/named-connection')
+                        named2 = self.engine.find(datasource, './connection/named-connections/named-connection')
                         sqlproxy = named2.attrib.get('name')
                     if dbname is None:
-                        named2 = datasource.find('./connection/named-connections/named-connection/connection')
+                        named2 = self.engine.find(datasource, './connection/named-connections/named-connection/connection')
                         dbname = named2.attrib.get('dbname')
 
                 datasource_info = {
@@ -203,8 +479,18 @@ class Tableau:
                     'Calculations': []
                 }
 
-                for datasource in self.root.iter('datasource'):
-                    for calculation in datasource.iter('calculation'):
+                # Calculations of the whole workbook, one entry per (datasource, column name). Every worksheet using a
+                # calculated field carries its own copy of it, so a repeated key replaces the earlier entry and moves to
+                # the end - merge_dashboard_columns_with_datasources lets the last one win, same as with the copies.
+                calculations = {}
+
+                def add_calculation(calc_datasource, column_name, calc_data):
+                    key = tuple(sys.intern(part) if isinstance(part, str) else part for part in (calc_datasource, column_name))
+                    calculations.pop(key, None)
+                    calculations[key] = calc_data
+
+                for datasource in index.iter('datasource'):
+                    for calculation in index.iter('calculation', within=datasource):
                         calc_datasource = calculation.attrib.get('datasource')
                         column_name = calculation.attrib.get('column')
                         formula = calculation.attrib.get('formula')
@@ -213,49 +499,49 @@ class Tableau:
                             continue
 
                         if not formula:
-                            print(f"No formula found for {column_name}. Let's look somewhere else")
+                            logger.log(TRACE, "No formula found for %s. Let's look somewhere else", column_name)
                         else:
                             calc_data = {
                                 'datasource': calc_datasource,
                                 'column name': column_name,
                                 'formula': formula
                             }
-                            datasource_info['Calculations'].append(calc_data)
+                            add_calculation(calc_datasource, column_name, calc_data)
 
-                for worksheet in self.root.iter('worksheet'):
+                for worksheet in index.iter('worksheet'):
                     datasource_name = ''
-                    for ds in worksheet.findall(".//datasources/datasource"):
+                    for ds in self.engine.findall(worksheet, ".//datasources/datasource"):
                         if ds.attrib.get('name', '').startswith('sqlproxy'):
                             datasource_name = ds.attrib.get('name')
                             break
 
-                    for column in worksheet.findall(".//column"):
+                    for column in index.findall('column', within=worksheet):
                         column_name = column.attrib.get('name')
-                        calculation_elem = column.find('./calculation')
+                        calculation_elem = self.engine.find(column, './calculation')
                         column_caption = column.attrib.get('caption')
                         column_role = column.attrib.get('role')
                         column_type = column.attrib.get('type')
-                        print(f"worksheet column names is {column_name}")
+                        logger.log(TRACE, "worksheet column names is %s", column_name)
                         if calculation_elem is not None:
                             formula = calculation_elem.attrib.get('formula')
                             if formula:
-                                print(f"Found the formula inside the worksheet! ")
+                                logger.log(TRACE, "Found the formula inside the worksheet! ")
                                 calc_data = {
                                     'column name': column_name,
                                     'datasource': datasource_name,
                                     'formula': formula
                                 }
-                                datasource_info['Calculations'].append(calc_data)
-                        print("i am before if dashboards")
+                                add_calculation(datasource_name, column_name, calc_data)
+                        logger.log(TRACE, "i am before if dashboards")
                         if 'Dashboards' not in self.extracted_data:
                             self.extracted_data['Dashboards'] = {}
-                            print("initialized?")
+                            logger.debug("initialized?")
 
                             for dashboard_name, dashboard_content in self.extracted_data['Dashboards'].items():
-                                print("inside for loop")
+                                logger.debug("inside for loop")
                                 if 'Columns' not in dashboard_content:
                                     self.extracted_data['Dashboards'][dashboard_name]['Columns'] = []
-                                    print("columns initialized")
+                                    logger.debug("columns initialized")
 
                                 column_data = {
                                     'name': column_name,
@@ -264,25 +550,28 @@ class Tableau:
                                     'type': column_type,
                                     'formula': formula
                                 }
-                                print("Going to populate.")
+                                logger.debug("Going to populate.")
                                 self.extracted_data['Dashboards'][dashboard_name]['Columns'].append(column_data)
-                                print("Populated.")
+                                logger.debug("Populated.")
+
+                datasource_info['Calculations'] = list(calculations.values())
+                logger.debug("%s distinct calculations", len(calculations))
 
                 datatype_mapping = {}
 
-                for metadata_record in datasource.iter('metadata-record'):
-                    local_name_element = metadata_record.find('./local-name')
+                for metadata_record in index.iter('metadata-record', within=datasource):
+                    local_name_element = self.engine.find(metadata_record, './local-name')
 
                     if local_name_element is not None:
                         local_name = local_name_element.text
-                        attribute_element = metadata_record.find('./attributes/attribute[@name="formula"]')
+                        attribute_element = self.engine.find(metadata_record, './attributes/attribute[@name="formula"]')
 
                         if attribute_element is not None:
                             datatype_mapping[local_name] = attribute_element.attrib.get('datatype')
 
                 class_mapping = {}
-                for metadata_record in datasource.iter('metadata-record'):
-                    remote_name_element = metadata_record.find('./local-name')
+                for metadata_record in index.iter('metadata-record', within=datasource):
+                    remote_name_element = self.engine.find(metadata_record, './local-name')
 
                     if remote_name_element is not None:
                         remote_name = remote_name_element.text
@@ -299,7 +588,7 @@ class Tableau:
                 self.extracted_data['Data sources'].append(datasource_info)
                 break
 
-        repository_location_elements = self.root.iter('repository-location')
+        repository_location_elements = iter(index.iter('repository-location'))
         if 'Data sources' in self.extracted_data and self.extracted_data['Data sources']:
             for data_source in self.extracted_data['Data sources']:
                 if data_source.get('id') is None or data_source.get('path') is None:
@@ -309,45 +598,38 @@ class Tableau:
 
         if 'GeneralInfo' in self.extracted_data and self.extracted_data['GeneralInfo']:
             for info in self.extracted_data['GeneralInfo']:
-                repository_location = self.root.find('./repository-location')
+                repository_location = self.engine.find(self.root, './repository-location')
                 if repository_location is not None:
                     if info['url'] is None:
                         url = repository_location.attrib.get('derived-from', None)
                         info['url'] = url
                 else:
-                    print("No repository-location found.")
+                    logger.debug("No repository-location found.")
 
-        print(f"Yay! I've extracted the data and stored it in our memory! ")
+        logger.info("Yay! I've extracted the data and stored it in our memory! ")
         self.identify_renamed_columns()
-        print(self.renamed_columns)
+        logger.debug("%s", self.renamed_columns)
         if self.renamed_columns:
             if self.extracted_data.get('Views'):
                 for view in self.extracted_data['Views']:
                     bublifuk_name = view.get('computation', '').strip('[]')
-                    pattern = re.compile(rf".*\[none:{re.escape(bublifuk_name)}:nk\]")
-
-                    renaming_occurred = False
-
-                    for full_key, renamed_name in self.renamed_columns.items():
-                        if pattern.match(full_key):
-                            print("true")
-                            view['View name'] = renamed_name
-                            renaming_occurred = True
-                            break
-
-                    if not renaming_occurred:
-                        print(f"No renaming found for {bublifuk_name}")
+                    if bublifuk_name in self.renamed_fields:
+                        logger.debug("true")
+                        view['View name'] = self.renamed_fields[bublifuk_name]
+                    else:
+                        logger.debug("No renaming found for %s", bublifuk_name)
         else:
-            print("No renaming needed for this dashboard.")
+            logger.debug("No renaming needed for this dashboard.")
 
     def extract_worksheet(self):
         column_metadata = []
 
-        for worksheet in self.root.iter('worksheet'):
-            for table in worksheet.iter('table'):
-                for view in table.iter('view'):
-                    for datasource_dependencies in view.iter('datasource-dependencies'):
-                        for column in datasource_dependencies.iter('column'):
+        index = self.index
+        for worksheet in index.iter('worksheet'):
+            for table in index.iter('table', within=worksheet):
+                for view in index.iter('view', within=table):
+                    for datasource_dependencies in index.iter('datasource-dependencies', within=view):
+                        for column in index.iter('column', within=datasource_dependencies):
                             # Only extract columns that have a 'caption' attribute
                             if 'caption' in column.attrib:
                                 if 'pivot' not in column.attrib and 'derivation' not in column.attrib:
@@ -357,7 +639,7 @@ class Tableau:
                                     }
 
                                     # Look for the 'calculation' tag to extract the formula
-                                    calculation = column.find('calculation')
+                                    calculation = self.engine.find(column, 'calculation')
                                     if calculation is not None and column_info is not None:
                                         classa = calculation.attrib.get('class')
                                         if classa is not None:
@@ -372,16 +654,16 @@ class Tableau:
 
     def extract_all_columns(self):
         column_metadata = []
-        logging.error("started logging")
-        columns = self.root.findall('.//column')  # Find all columns first
+        logger.debug("started logging")
+        columns = self.index.findall('column')  # Find all columns first
         total_columns = len(columns)  # Store the total number of columns
         processed_columns = 0  # Track the number of processed columns
-        logging.debug(f" total coluns is {total_columns}")
-        for col in self.root.findall('.//column'):
+        logger.debug(" total coluns is %s", total_columns)
+        for col in columns:
 
-            logging.error(f"{col.attrib}")
+            logger.log(TRACE, "%s", col.attrib)
             if ('name' in col.attrib and 'formula' not in col.attrib):
-                logging.error(f"found something {col.attrib.get('name')}")
+                logger.log(TRACE, "found something %s", col.attrib.get('name'))
                 new_row = {
                     'caption': col.attrib.get('caption', None),
                     'formula': None,
@@ -398,30 +680,30 @@ class Tableau:
 
             processed_columns += 1
             if processed_columns >= total_columns:
-                logging.error("All columns processed. Stopping the loop.")
-                print("All column processesd. Stopping loop")
+                logger.debug("All columns processed. Stopping the loop.")
                 break
 
         return column_metadata
 
     def extract_only_datasource(self):
         column_metadata = []
-        logging.error("Started logging")
+        logger.debug("Started logging")
 
         # Find all datasources and iterate through them
-        for col in self.root.findall('.//datasource'):
-            logging.error(f"Datasource attributes: {col.attrib}")
+        index = self.index
+        for col in index.findall('datasource'):
+            logger.log(TRACE, "Datasource attributes: %s", col.attrib)
 
             # Iterate over all metadata-records under the current datasource
-            for metadata_record in col.findall('.//metadata-record'):
-                logging.debug(f"{metadata_record.attrib} metadata found")
+            for metadata_record in index.findall('metadata-record', within=col):
+                logger.log(TRACE, "%s metadata found", metadata_record.attrib)
                 if metadata_record.get('class') == 'measure':
-                    remote_name = metadata_record.find('remote-name').text if metadata_record.find('remote-name') is not None else None
-                    logging.debug(f"{remote_name} remote name found")
-                    local_name = metadata_record.find('local-name').text if metadata_record.find('local-name') is not None else None
-                    caption = metadata_record.find('caption').text if metadata_record.find('caption') is not None else None
+                    remote_name = self.engine.find(metadata_record, 'remote-name').text if self.engine.find(metadata_record, 'remote-name') is not None else None
+                    logger.log(TRACE, "%s remote name found", remote_name)
+                    local_name = self.engine.find(metadata_record, 'local-name').text if self.engine.find(metadata_record, 'local-name') is not None else None
+                    caption = self.engine.find(metadata_record, 'caption').text if self.engine.find(metadata_record, 'caption') is not None else None
                     formula = None
-                    for attribute in metadata_record.findall('.//attributes/attribute'):
+                    for attribute in self.engine.findall(metadata_record, './/attributes/attribute'):
                         if attribute.get('name') == 'formula':
                             formula = attribute.text
                             break  # Stop once the formula is found
@@ -437,7 +719,7 @@ class Tableau:
 
                     column_metadata.append(datasource)
 
-        logging.debug(f"Extracted {len(column_metadata)} column metadata records.")
+        logger.debug("Extracted %s column metadata records.", len(column_metadata))
         return column_metadata
 
     def extract_columns_metadata(self, element, existing_columns):
@@ -449,11 +731,24 @@ class Tableau:
                     'name': child.attrib.get('name'),
                     'role': child.attrib.get('role'),
                     'calculation': child.attrib.get('calculation'),
-                    'formula': child.find('./calculation').attrib.get('formula') if child.find(
-                        './calculation') is not None else None
+                    'formula': self.engine.find(child, './calculation').attrib.get('formula') if self.engine.find(
+                        child, './calculation') is not None else None
                 }
                 existing_columns.append(column_data)
 
+    def _window_classes(self):
+        """
+        Classes of all windows ('dashboard', 'worksheet', ...), each one once.
+        Walking every window used to repeat the same pass for each window of a class and only the last pass counted,
+        so the classes are ordered by their last window.
+        :return: list of window classes.
+        """
+        windows = self.index.iter('window')
+        for window in windows:
+            logger.log(TRACE, "Checking window: %s", window.attrib)
+        last_seen = dict.fromkeys(window.attrib.get('class') for window in reversed(windows))
+        return list(reversed(list(last_seen)))
+
     def dashboard_basic_info(self):
         """
         Add dashboard details - class, name, url, sqlproxy.
@@ -461,10 +756,10 @@ class Tableau:
         """
         dashboard_data = {'Dashboards': {}}
 
-        for window in self.root.iter('window'):
-            print(f"Checking window: {window.attrib}")
+        for window in self.index.iter('window'):
+            logger.log(TRACE, "Checking window: %s", window.attrib)
             if window.attrib.get('class') == 'dashboard':
-                print("Found a dashboard class!")
+                logger.debug("Found a dashboard class!")
                 dashboard_name = window.attrib.get('name')
                 dashboard_data['Dashboards'][dashboard_name] = {"class": 'dashboard', "name": dashboard_name}
             elif window.attrib.get('class') == 'worksheet':
@@ -474,30 +769,30 @@ class Tableau:
         if 'Dashboards' not in self.extracted_data:
             self.extracted_data['Dashboards'] = {}
 
-        for dashboard in self.root.iter('dashboard'):
+        for dashboard in self.index.iter('dashboard'):
             dashboard_name = dashboard.attrib.get('name')
 
             if dashboard_name in self.extracted_data['Dashboards']:
-                repo_loc = dashboard.find('repository-location')
+                repo_loc = self.engine.find(dashboard, 'repository-location')
                 if repo_loc is not None:
                     url = repo_loc.attrib.get('derived-from')
                     self.extracted_data['Dashboards'][dashboard_name]["url"] = url
 
-                datasources = dashboard.find('datasources')
+                datasources = self.engine.find(dashboard, 'datasources')
                 if datasources is not None:
-                    print("Found datasources tag.")
+                    logger.debug("Found datasources tag.")
                     for datasource in datasources:
                         name_ = datasource.attrib.get('name')
-                        print(f"Checking datasource: {name_}")
+                        logger.log(TRACE, "Checking datasource: %s", name_)
                         if name_ and name_.startswith('sqlproxy'):
-                            print("Found the right one!")
+                            logger.debug("Found the right one!")
                             self.extracted_data['Dashboards'][dashboard_name]["id"] = name_
 
                             break
         self.extracted_data['Dashboards'].update(dashboard_data['Dashboards'])
-        print(f"Data added to the in-memory storage: {self.extracted_data['Dashboards']}")
+        logger.debug("Data added to the in-memory storage: %s", self.extracted_data['Dashboards'])
 
-        print("Yay!  Your in-memory storage is now updated with all the dashboard details! ")
+        logger.debug("Yay!  Your in-memory storage is now updated with all the dashboard details! ")
 
     def add_datasource_dependencies(self):
         """
@@ -506,14 +801,13 @@ class Tableau:
         """
         if 'Dashboards' not in self.extracted_data:
             self.extracted_data['Dashboards'] = {}
-            print("Initialized Dashboards in extracted_data.")  #
+            logger.debug("Initialized Dashboards in extracted_data.")  #
 
-        for window in self.root.iter('window'):
-            window_class = window.attrib.get('class')
-            print(f"Checking window: {window.attrib}")
-            for dashboard in self.root.iter(window_class):
+        index = self.index
+        for window_class in self._window_classes():
+            for dashboard in index.iter(window_class):
                 dashboard_name = dashboard.attrib.get('name')
-                print(f"Processing dashboard: {dashboard_name}")  # Debugging line
+                logger.log(TRACE, "Processing dashboard: %s", dashboard_name)  # Debugging line
                 if dashboard_name not in self.extracted_data.get('Dashboards', {}):
                     continue  # Skip if the dashboard is not in the JSON
                 self.extracted_data['Dashboards'][dashboard_name]['Views'] = []
@@ -522,8 +816,8 @@ class Tableau:
                 if not isinstance(self.extracted_data['Dashboards'][dashboard_name].get('Views', None), list):
                     self.extracted_data['Dashboards'][dashboard_name]['Views'] = []
 
-                for datasource_dependency in dashboard.findall('.//datasource-dependencies'):
-                    for column in datasource_dependency.findall('.//column'):
+                for datasource_dependency in index.findall('datasource-dependencies', within=dashboard):
+                    for column in index.findall('column', within=datasource_dependency):
                         param_domain_type = column.attrib.get('param-domain-type', '')
                         aggregation_type = column.attrib.get('aggregation', None)
                         caption = column.attrib.get('caption', '')
@@ -531,7 +825,7 @@ class Tableau:
                         if param_domain_type == 'list' and aggregation_type is None:
                             value = column.attrib.get('value', '')
                             type = column.attrib.get('type', 'not Found')
-                            options = [m.attrib['value'] for m in column.findall('.//member')]
+                            options = [m.attrib['value'] for m in self.engine.findall(column, './/member')]
 
                             # Append the view data to 'Views'
                             self.extracted_data['Dashboards'][dashboard_name]['Views'].append({
@@ -540,9 +834,9 @@ class Tableau:
                                 'value': value,
                                 'options': options
                             })
-                            print(
-                                f"Last appended to Views: {self.extracted_data['Dashboards'][dashboard_name]['Views'][-1]}")
-            print("Voila! The JSON is updated with datasource dependencies!")
+                            logger.log(TRACE, "Last appended to Views: %s",
+                                       self.extracted_data['Dashboards'][dashboard_name]['Views'][-1])
+            logger.debug("Voila! The JSON is updated with datasource dependencies!")
 
     def add_column_details(self):
         """
@@ -552,83 +846,86 @@ class Tableau:
         if 'Dashboards' not in self.extracted_data:
             self.extracted_data['Dashboards'] = {}
         json_dashboard_names = set(self.extracted_data.get("Dashboards", {}).keys())
-        print(f"json dashboard names: {json_dashboard_names}")
+        logger.debug("json dashboard names: %s", json_dashboard_names)
+        index = self.index
 
-        for window in self.root.iter('window'):
-            window_class = window.attrib.get('class')
-            print(f"Checking window: {window.attrib}")
-            for dashboard in self.root.iter(window_class):
-                dashboard_name = dashboard.attrib.get('name')
-                print(f"dashboard names are {dashboard_name}")
-                for dashboard_elem in self.root.findall(f'.//{window_class}'):
-                    print(f"Dashboard element attributes: {dashboard_elem.attrib}")
-                    elem_name = dashboard_elem.attrib.get('name', 'Unnamed')
-                    print(f"Element name is: {elem_name}")  # Debug line
-                    # Debug line
-                    if 'name' in dashboard_elem.attrib and dashboard_elem.attrib['name'] in json_dashboard_names:
-                        print("I am inside for loop.")
-                        sqlproxy_name = ""
-                        for ds in dashboard_elem.findall(".//datasource"):
-                            ds_name = ds.attrib.get("name", "")
-                            if ds_name.startswith("sqlproxy"):
-                                sqlproxy_name = ds_name
-                                print(sqlproxy_name)
-                                break
-                        if not sqlproxy_name:
-                            print("sqlproxy name not found")
-
-                        columns_list = []
-                        for column in self.root.findall(
-                                f".//datasource-dependencies[@datasource='{sqlproxy_name}']/column"):
-                            column_info = {
-                                "aggregation": column.attrib.get("aggregation"),
-                                "caption": column.attrib.get("caption"),
-                                "datatype": column.attrib.get("datatype"),
-                                "default-type": column.attrib.get("default-type"),
-                                "name": column.attrib.get("name"),
-                                "role": column.attrib.get("role", "null")
-                            }
-                            columns_list.append(column_info)
+        for window_class in self._window_classes():
+            # Every dashboard of this class ends up with the columns of the last named element of the class
+            # that is in the json, so that element is looked up once, not once per dashboard.
+            if window_class is None:
+                continue
+            source_elem = None
+            for dashboard_elem in index.findall(window_class):
+                if 'name' in dashboard_elem.attrib and dashboard_elem.attrib['name'] in json_dashboard_names:
+                    source_elem = dashboard_elem
+            if source_elem is None:
+                continue
 
-                        self.extracted_data["Dashboards"][dashboard_name].update({
-                            "Columns": columns_list
-                        })
+            sqlproxy_name = ""
+            for ds in index.findall('datasource', within=source_elem):
+                ds_name = ds.attrib.get("name", "")
+                if ds_name.startswith("sqlproxy"):
+                    sqlproxy_name = ds_name
+                    logger.debug("%s", sqlproxy_name)
+                    break
+            if not sqlproxy_name:
+                logger.debug("sqlproxy name not found")
+
+            columns_list = []
+            for dependency in index.lookup('datasource-dependencies', 'datasource', sqlproxy_name):
+                for column in index.children(dependency, 'column'):
+                    column_info = {
+                        "aggregation": column.attrib.get("aggregation"),
+                        "caption": column.attrib.get("caption"),
+                        "datatype": column.attrib.get("datatype"),
+                        "default-type": column.attrib.get("default-type"),
+                        "name": column.attrib.get("name"),
+                        "role": column.attrib.get("role", "null")
+                    }
+                    columns_list.append(column_info)
 
-                        if "Unknown Dashboard" in self.extracted_data["Dashboards"]:
-                            print(f"Unknown Dashboard detected. Current state of extracted_data: {self.extracted_data}")
+            for dashboard in index.iter(window_class):
+                dashboard_name = dashboard.attrib.get('name')
+                logger.log(TRACE, "dashboard names are %s", dashboard_name)
+                self.extracted_data["Dashboards"][dashboard_name].update({
+                    "Columns": [dict(column_info) for column_info in columns_list]
+                })
+
+        column_data_list = None
         for dashboard_name, dashboard_data in self.extracted_data.get("Dashboards", {}).items():
             columns = dashboard_data.get("Columns", [])
             if not columns:  # If 'Columns' is empty
-                print(f"No columns found for dashboard: {dashboard_name}. Running specific column data processing.")
-                column_data_list = []
-                for column in self.root.findall(".//column"):
-                    caption = column.attrib.get('caption', '')
-                    datatype = column.attrib.get('datatype', '')
-                    name = column.attrib.get('name', '')
-                    role = column.attrib.get('role', '')
-                    formula_element = column.find(".//calculation")
-                    formula = formula_element.attrib.get('formula', '') if formula_element is not None else ''
-                    if caption:
-                        column_data = {
-                            "caption": caption,
-                            "datatype": datatype,
-                            "name": name,
-                            "role": role,
-                            "formula": formula
-                        }
-                        column_data_list.append(column_data)
+                logger.debug("No columns found for dashboard: %s. Running specific column data processing.", dashboard_name)
+                if column_data_list is None:
+                    column_data_list = []
+                    for column in index.findall('column'):
+                        caption = column.attrib.get('caption', '')
+                        datatype = column.attrib.get('datatype', '')
+                        name = column.attrib.get('name', '')
+                        role = column.attrib.get('role', '')
+                        formula_element = self.engine.find(column, ".//calculation")
+                        formula = formula_element.attrib.get('formula', '') if formula_element is not None else ''
+                        if caption:
+                            column_data = {
+                                "caption": caption,
+                                "datatype": datatype,
+                                "name": name,
+                                "role": role,
+                                "formula": formula
+                            }
+                            column_data_list.append(column_data)
 
                 if 'Columns' not in self.extracted_data:
                     self.extracted_data['Columns'] = []
 
-                self.extracted_data['Columns'].extend(column_data_list)
-                print(f"Updated SpecificColumns: {self.extracted_data['Columns']}")
+                self.extracted_data['Columns'].extend(dict(column_data) for column_data in column_data_list)
+                logger.debug("Updated SpecificColumns: %s", self.extracted_data['Columns'])
     def clean_dashboard_columns(self):
         """
         Add "Caption" and "Options" under "Views". Updates "Columns" so only table columns are kept in there.
         :return: Updated "Views" and "Columns" dictionary in json.
         """
-        view_captions_and_options = []
+        view_captions_and_options = set()
 
         for dashboard_name, dashboard_content in self.extracted_data.get("Dashboards", {}).items():
             for view in dashboard_content.get("Views", []):
@@ -637,9 +934,9 @@ class Tableau:
                 stripped_options = [option.strip("\"'") for option in options]
 
                 if caption:
-                    view_captions_and_options.append(caption)
+                    view_captions_and_options.add(caption)
                 if stripped_options:
-                    view_captions_and_options.extend(stripped_options)
+                    view_captions_and_options.update(stripped_options)
 
         for dashboard_name, dashboard_content in self.extracted_data.get("Dashboards", {}).items():
             cleaned_columns = [col for col in dashboard_content.get("Columns", []) if
@@ -648,7 +945,7 @@ class Tableau:
                                col.get("caption").strip("\"'") not in view_captions_and_options]
             dashboard_content["Columns"] = cleaned_columns
 
-        print("Look at that! Clean and shiny columns! ")
+        logger.debug("Look at that! Clean and shiny columns! ")
 
     def merge_dashboard_columns_with_datasources(self):
         """
@@ -681,7 +978,33 @@ class Tableau:
 
             dashboard_content["Columns"] = updated_columns
 
-        print("Columns and calculations are merged and updated in memory! ")
+        logger.debug("Columns and calculations are merged and updated in memory! ")
+
+    def mark_worksheet_columns(self, column_metadata):
+        """
+        Tags every dashboard column with worksheet = yes/no, depending on whether its caption is one of the
+        worksheet columns from extract_worksheet. The captions are put into a set once, so this is one lookup per column.
+        :param column_metadata: output of extract_worksheet.
+        :return: Updated "Columns" with "worksheet".
+        """
+        if not column_metadata:
+            return
+        worksheet_captions = {col_metadata.get('caption') for col_metadata in column_metadata}
+        for dashboard_name, dashboard_content in self.extracted_data.get("Dashboards", {}).items():
+            for column in dashboard_content.get("Columns", []):
+                column['worksheet'] = 'yes' if column.get('caption') in worksheet_captions else 'no'
+
+    def calculation_table(self):
+        """
+        Calculations of the whole workbook, before remove_views_and_calculations deletes them.
+        Every datasource carries the same table, so a (datasource, column name) is listed once.
+        :return: list of {'datasource', 'column name', 'formula'}.
+        """
+        calculations = {}
+        for datasource in self.extracted_data.get("Data sources", []):
+            for calculation in datasource.get("Calculations", []):
+                calculations[(calculation.get('datasource'), calculation.get('column name'))] = calculation
+        return list(calculations.values())
 
     def remove_views_and_calculations(self):
         """
@@ -715,199 +1038,190 @@ class Tableau:
                     filtered_col = col
                 updated_columns.append(filtered_col)
             dashboard_content["Columns"] = updated_columns
-        print("'Calculations' have vanished!")
+        logger.debug("'Calculations' have vanished!")
 
     def add_url(self):
         """
         Takes care that every Dashboard, which has url in metadata, has the url also in json.
         It covers a lot of possibilities where url can be. If it is still not in the json,
         send workbook_luid and we can look. But probably the dashboard just does not have url in metadata.
+        The url is put into the dashboard dict as it is, its place among the keys is noted in self.leading_keys
+        and applied by move_general_info, so the dashboard is not copied here.
         :return: Updated GeneralInfo dict in json file.
         """
         dashboards_missing_url = set()
-        for window in self.root.iter('window'):
-            window_class = window.attrib.get('class')
-            print(f"Checking window: {window.attrib}")
-            for dashboard in self.root.iter(window_class):
+        index = self.index
+        for window_class in self._window_classes():
+            for dashboard in index.iter(window_class):
                 name = dashboard.attrib.get('name')
-                print(f"THE NAMES OF ALL {name}")
+                logger.log(TRACE, "THE NAMES OF ALL %s", name)
                 for child in dashboard:
-                    print("TAGES")
-                    print(child.tag, child.attrib)
-
-        for dashboard in self.root.findall(f".//{window_class}"):
-            print(f" WINDOW CLASS IS !! {window_class} ")
+                    logger.log(TRACE, "TAGES")
+                    logger.log(TRACE, "%s %s", child.tag, child.attrib)
+
+        # the class of the last window decides which elements get their url here
+        windows = index.iter('window')
+        window_class = windows[-1].attrib.get('class') if windows else None
+        last_dashboard_url = None
+        for dashboard in index.iter('dashboard'):
+            repo_location = self.engine.find(dashboard, "./repository-location")
+            last_dashboard_url = repo_location.get("derived-from") if repo_location is not None else None
+
+        for dashboard in (index.findall(window_class) if window_class is not None else []):
+            logger.log(TRACE, " WINDOW CLASS IS !! %s ", window_class)
             for child in dashboard:
-                print(f"tag under windows")
-                print(child.tag, child.attrib)
+                logger.log(TRACE, "tag under windows")
+                logger.log(TRACE, "%s %s", child.tag, child.attrib)
 
             name = dashboard.get("name")
-            repo_location = dashboard.find("repository-location")
+            repo_location = self.engine.find(dashboard, "repository-location")
             derived_from = repo_location.get("derived-from") if repo_location is not None else None
-            if derived_from is None:
-                for dashboard in self.root.findall(".//dashboard"):
-                    print(f"Checking dashboard: {dashboard.attrib}")
-                    repo_location = dashboard.find("repository-location")
-                    new_derived_from = repo_location.get("derived-from") if repo_location is not None else None
-                    new_name = dashboard.get("name")
-                    if new_name == name:
-                        derived_from = new_derived_from
-                        break
-            print(f"Checking Debugging god: {derived_from}")
+            if derived_from is None and name is not None:
+                for same_name in index.named('dashboard', name)[:1]:
+                    repo_location = self.engine.find(same_name, "repository-location")
+                    derived_from = repo_location.get("derived-from") if repo_location is not None else None
+            logger.debug("Checking Debugging god: %s", derived_from)
 
             if derived_from is None:
-                for dashboard in self.root.iter('dashboard'):
-                    repo_location = dashboard.find("./repository-location")
-                    derived_from = repo_location.get("derived-from") if repo_location is not None else None
+                derived_from = last_dashboard_url
 
-            print(f"Dashboard name: {name}, Derived From: {derived_from}")
+            logger.debug("Dashboard name: %s, Derived From: %s", name, derived_from)
 
             if name in self.extracted_data['Dashboards']:
-                temp_dict = self.extracted_data['Dashboards'][name]
-                new_dict = {'class': temp_dict.get('class'), 'name': temp_dict.get('name'), 'url': derived_from}
-                print(f"New Dictionary: {new_dict}")
-
-                for k, v in temp_dict.items():
-                    if k not in ['class', 'name']:
-                        new_dict[k] = v
-
-                self.extracted_data['Dashboards'][name] = new_dict
-                print(f"After Merge: {self.extracted_data['Dashboards'][name]}")
+                # a url the dashboard already has is kept
+                self.extracted_data['Dashboards'][name].setdefault('url', derived_from)
+                self.leading_keys[name] = ('class', 'name', 'url')
+                logger.debug("After Merge: %s", self.extracted_data['Dashboards'][name])
 
         for dashboard_name, dashboard_data in self.extracted_data['Dashboards'].items():
             if 'url' not in dashboard_data:
                 dashboards_missing_url.add(dashboard_name)
 
         if dashboards_missing_url:
-            for dashboard in self.root.findall(".//dashboard"):
+            for dashboard in index.findall('dashboard'):
                 name = dashboard.get("name")
                 if name in dashboards_missing_url:
-                    repo_location = dashboard.find("repository-location")
+                    repo_location = self.engine.find(dashboard, "repository-location")
                     derived_from = repo_location.get("derived-from") if repo_location is not None else None
                     if derived_from is not None:
-
-                        old_dict = self.extracted_data['Dashboards'][name]
-                        new_dict = {}
-                        new_dict['class'] = old_dict.get('class')
-                        new_dict['url'] = derived_from
-                        for k, v in old_dict.items():
-                            if k not in ['class', 'url']:
-                                new_dict[k] = v
-                        self.extracted_data['Dashboards'][name] = new_dict
+                        self.extracted_data['Dashboards'][name]['url'] = derived_from
+                        self.leading_keys[name] = ('class', 'url')
                         dashboards_missing_url.remove(name)
         if dashboards_missing_url:
-            for worksheet in self.root.findall(".//worksheet"):
+            for worksheet in index.findall('worksheet'):
                 name = worksheet.get("name")
                 if name in dashboards_missing_url:
-                    repo_location = worksheet.find(".//repository-location")
+                    repo_location = self.engine.find(worksheet, ".//repository-location")
                     derived_from = repo_location.get("derived-from") if repo_location is not None else None
                     if derived_from is not None:
-                        old_dict = self.extracted_data['Dashboards'].get(name, {})
-                        new_dict = {'class': old_dict.get('class'), 'url': derived_from}
-
-                        new_dict.update({k: v for k, v in old_dict.items() if k not in ['class', 'url']})
-                        self.extracted_data['Dashboards'][name] = new_dict
+                        self.extracted_data['Dashboards'][name]['url'] = derived_from
+                        self.leading_keys[name] = ('class', 'url')
                         dashboards_missing_url.remove(name)
 
-        print("The URLs are in! ")
+        logger.debug("The URLs are in! ")
 
-    def move_general_info(self):
+    def move_general_info(self, workbook_luid=None):
         """
         Takes care that GeneralInfo is in the right place with the right source of information.
+        This builds the final layout in one pass: every dashboard is put together once, in the output key order
+        (Introduction, GeneralInfo, the keys add_url put first, the rest), and all dashboards share one GeneralInfo dict.
+        :param workbook_luid: when given, the workbook is laid out too - report_name, workbook_luid, the rest.
         :return: Updated "GeneralInfo" dict in json.
         """
         if not self.extracted_data:
-            print("Oops, no data to move around! ")
+            logger.debug("Oops, no data to move around! ")
             return
 
         if 'Dashboards' not in self.extracted_data:
             self.extracted_data['Dashboards'] = {}
 
         general_info_keys = ['name', 'site', 'Data sources']
-        general_info = {key: self.extracted_data.get(key) for key in general_info_keys}
-        print(general_info)
-
-        for dashboard_name, dashboard_details in self.extracted_data['Dashboards'].items():
-            dashboard_details['GeneralInfo'] = {}
-            print(general_info)
-            for key, value in general_info.items():
-                if key != 'name':
-                    dashboard_details[key] = value
-        if 'Dashboards' in self.extracted_data:
-            for dashboard_name, dashboard_details in self.extracted_data['Dashboards'].items():
-
-                dashboard_details['GeneralInfo'] = general_info
-                dashboard_details.pop('Data sources', None)
-                dashboard_details.pop('site', None)
-
-                reordered_dashboard_details = OrderedDict()
-
-                if 'Introduction' in dashboard_details:
-                    reordered_dashboard_details['Introduction'] = dashboard_details['Introduction']
-
-                if 'GeneralInfo' in dashboard_details:
-                    reordered_dashboard_details['GeneralInfo'] = dashboard_details['GeneralInfo']
-                    dashboard_details['GeneralInfo'].pop('name', None)
-
-                for key, value in dashboard_details.items():
-                    if key not in ['Introduction', 'GeneralInfo']:
-                        reordered_dashboard_details[key] = value
-
-                self.extracted_data['Dashboards'][dashboard_name] = reordered_dashboard_details
-
-        for key in general_info_keys:
-            if key in self.extracted_data:
-                del self.extracted_data[key]
+        general_info = {key: self.extracted_data.get(key) for key in general_info_keys if key != 'name'}
+        logger.debug("%s", general_info)
+
+        dashboards = self.extracted_data['Dashboards']
+        moved_keys = {'Introduction', 'GeneralInfo', 'site', 'Data sources'}
+        for dashboard_name, dashboard_details in dashboards.items():
+            layout = {}
+            if 'Introduction' in dashboard_details:
+                layout['Introduction'] = dashboard_details['Introduction']
+            layout['GeneralInfo'] = general_info
+            leading_keys = self.leading_keys.get(dashboard_name, ())
+            for key in leading_keys:
+                layout[key] = dashboard_details.get(key)
+            for key, value in dashboard_details.items():
+                if key not in moved_keys and key not in leading_keys:
+                    layout[key] = value
+            dashboards[dashboard_name] = layout
+
+        if workbook_luid is not None:
+            layout = {}
+            if 'report_name' in self.extracted_data:
+                layout['report_name'] = self.extracted_data['report_name']
+            layout['workbook_luid'] = workbook_luid
+            for key, value in self.extracted_data.items():
+                if key not in layout and key not in general_info_keys:
+                    layout[key] = value
+            self.extracted_data = layout
+        else:
+            for key in general_info_keys:
+                if key in self.extracted_data:
+                    del self.extracted_data[key]
 
-        print("The general info has been moved! ")
+        logger.debug("The general info has been moved! ")
 
     def url_edits(self):
         """
         It probably renames url in "Data sources" so the program does not confuse it.
         :return: Renamed "url" in "Data sources" dictionary in json.
         """
-        print("I am inside url edits")
+        logger.debug("I am inside url edits")
         dashboards = self.extracted_data.get("Dashboards", {})
-        print("Dashboards data:", dashboards)
+        logger.debug("Dashboards data: %s", dashboards)
         if not isinstance(dashboards, dict):
             raise ValueError("Dashboards data is not a dictionary or is missing")
 
+        edited_general_info = set()
         for dashboard_name, dashboard_data in dashboards.items():
             if not isinstance(dashboard_data, dict):
-                print(f"Warning: Skipping non-dictionary dashboard data for {dashboard_name}")
+                logger.warning("Skipping non-dictionary dashboard data for %s", dashboard_name)
                 continue
 
             if 'url' in dashboard_data:
                 url = dashboard_data['url']
                 if url is not None:
                     dashboard_data['url'] = self.edit_url_directly(url)
-                    print(f"Performed URL edit for dashboard {dashboard_name}")
+                    logger.debug("Performed URL edit for dashboard %s", dashboard_name)
                 else:
-                    print(f"No URL to edit in dashboard {dashboard_name}")
+                    logger.debug("No URL to edit in dashboard %s", dashboard_name)
 
             general_info = dashboard_data.get('GeneralInfo', {})
             if not isinstance(general_info, dict):
-                print(f"Warning: 'GeneralInfo' is not a dictionary for dashboard {dashboard_name}")
+                logger.warning("'GeneralInfo' is not a dictionary for dashboard %s", dashboard_name)
+                continue
+            # all dashboards share one GeneralInfo, its data sources are edited once
+            if id(general_info) in edited_general_info:
                 continue
+            edited_general_info.add(id(general_info))
 
             data_sources = general_info.get('Data sources', [])
             if not isinstance(data_sources, list):
-                print(f"Warning: 'Data sources' is not a list for dashboard {dashboard_name}")
+                logger.warning("'Data sources' is not a list for dashboard %s", dashboard_name)
                 continue
 
             for data_source in data_sources:
                 if not isinstance(data_source, dict):
-                    print(f"Warning: Skipping non-dictionary data source in dashboard {dashboard_name}")
+                    logger.warning("Skipping non-dictionary data source in dashboard %s", dashboard_name)
                     continue
 
                 url = data_source.get('URL', None)
                 if url is not None:
                     data_source['URL'] = self.edit_url_directly(url)
-                    print(f"Performed URL edit for data source in dashboard {dashboard_name}")
+                    logger.debug("Performed URL edit for data source in dashboard %s", dashboard_name)
                 else:
-                    print(f"No URL to edit in data source for dashboard {dashboard_name}")
+                    logger.debug("No URL to edit in data source for dashboard %s", dashboard_name)
 
-            print("Completed processing for this dashboard")
+            logger.debug("Completed processing for this dashboard")
 
 
     def edit_url_directly(self, url):
@@ -932,7 +1246,7 @@ class Tableau:
 
         return url
 
-    def save_data(self):
+    def save_data(self, file_path=OUTPUT_FILE, fsync=False):
         """
         Creates file "TABLEAUDATAZEXTRAKTORU", which contains all of the scraped metadata information.
         Then go three folders backward and save it into 'langchain'
@@ -941,256 +1255,583 @@ class Tableau:
         # destination_directory = os.path.dirname(self.twbx_path)
         # destination_directory = 'in/files/'
 
-        file_path = 'TABLEAUDATAZEXTRAKTORU_test.json'
         # file_path = os.path.join(destination_directory, json_file_name)
-        print("i'm here inside saving")
-        if not os.path.isfile(file_path):
-            with open(file_path, 'w') as f:
-                json.dump([self.extracted_data], f, indent=4)
-                print("json dumped")
+        logger.debug("i'm here inside saving")
+        save_records([self.extracted_data], file_path, fsync)
+
+
+def is_json_lines(file_path):
+    return os.path.splitext(file_path)[1] == '.jsonl'
+
+
+def save_records(records, file_path=OUTPUT_FILE, fsync=False):
+    """
+    Merge step of the extraction - appends the extracted workbooks to the json file in one write.
+    A .jsonl file_path is only appended to, one line per workbook, a .json file is loaded and written again as a whole.
+    :param records: list of extracted_data (dicts or with tableau_records records inside).
+    :param file_path: json file with a list of all extracted workbooks, or json lines file with one workbook per line.
+    :param fsync: with .jsonl, make sure the records are on disk before returning.
+    :return: Updated json file.
+    """
+    if is_json_lines(file_path):
+        with open(file_path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, default=record_default) + '\n')
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+    elif not os.path.isfile(file_path):
+        with open(file_path, 'w') as f:
+            json.dump(records, f, indent=4, default=record_default)
+            logger.debug("json dumped")
+    else:
+        with open(file_path, 'r') as f:
+            try:
+                data = json.load(f)
+                if isinstance(data, list):
+                    data.extend(records)
+                    logger.debug("data appended")
+                else:
+                    data = [data] + records
+                    logger.debug("another way of saving data")
+            except json.JSONDecodeError:
+                data = list(records)
+
+        with open(file_path, 'w') as f:
+            json.dump(data, f, indent=4, default=record_default)
+            logger.debug("json dumped finally")
+
+    logger.info("Data saved to %s", file_path)
+
+
+def load_records(file_path=OUTPUT_FILE):
+    """
+    Reads the extracted workbooks back one by one. A .jsonl file is streamed line by line,
+    a .json file is still loaded at once. A half written last line (crash while saving) is skipped.
+    :param file_path: file written by save_records.
+    :return: generator of extracted_data dicts.
+    """
+    if not is_json_lines(file_path):
+        with open(file_path, 'r') as file:
+            data = json.load(file)
+        if not isinstance(data, list):
+            data = [data]
+        for item in data:
+            yield json.loads(item) if isinstance(item, str) else item
+        return
+
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Skipping broken record on line %s of %s.", line_number, file_path)
+
+
+def extract_workbook(code, twbx_path, metrics=None, engine=None, save_decoded=True, streaming=False,
+                     keep_calculations=False):
+    """
+    Runs the whole Tableau method pipeline on one downloaded workbook.
+    It only needs the path (or the content), so it can run in a worker process.
+    :param code: workbook_luid.
+    :param twbx_path: path of the downloaded workbook, or the workbook content as bytes.
+    :param metrics: optional tableau_metrics.PhaseMetrics, gets one record per phase.
+    :param engine: xml parser engine, see Tableau.
+    :param save_decoded: write the "dec_workbook_luid_oded" copy next to a downloaded .twbx.
+    :param streaming: parse with Tableau.unpack_twbx_streaming, for workbooks with big thumbnails and window layouts.
+    :param keep_calculations: also return the whole calculation table under LINEAGE_CALCULATIONS, for the lineage graph.
+    :return: extracted_data of the workbook, columns, views and datasources as tableau_records records.
+    """
+    phase = metrics.phase if metrics is not None else no_phase
+    if isinstance(twbx_path, (bytes, bytearray)):
+        tableau = Tableau(engine=engine, content=twbx_path)
+    else:
+        tableau = Tableau(twbx_path, engine)
+
+    with phase('unpack_twbx', tableau):
+        tableau.unpack_twbx(streaming=streaming, save_decoded=save_decoded)
+    logger.debug("Before Extracting")
+    with phase('extract_info_from_twb', tableau):
+        tableau.extract_info_from_twb()
+    logger.debug("After extract")
+    logger.debug("%s", tableau.extracted_data)
+    logger.debug("Extract successfull")
+
+    with phase('extract_columns_metadata', tableau):
+        for dashboard_name, dashboard_content in tableau.extracted_data['Dashboards'].items():
+            if 'Columns' not in dashboard_content:
+                dashboard_content['Columns'] = []
+            tableau.extract_columns_metadata(tableau.root, dashboard_content['Columns'])
+
+    with phase('dashboard_basic_info', tableau):
+        tableau.dashboard_basic_info()
+    logger.debug("Before datasource dependencies")
+    with phase('add_datasource_dependencies', tableau):
+        tableau.add_datasource_dependencies()
+    logger.debug("Before adding column details")
+    with phase('add_column_details', tableau):
+        tableau.add_column_details()
+    with phase('clean_dashboard_columns', tableau):
+        tableau.clean_dashboard_columns()
+    with phase('merge_dashboard_columns_with_datasources', tableau):
+        tableau.merge_dashboard_columns_with_datasources()
+    calculations = tableau.calculation_table() if keep_calculations else None
+    with phase('remove_views_and_calculations', tableau):
+        tableau.remove_views_and_calculations()
+    with phase('add_url', tableau):
+        tableau.add_url()
+    logger.debug("Before move general info")
+    with phase('move_general_info', tableau):
+        tableau.move_general_info(code)
+    logger.debug("After move general before url edits")
+    with phase('url_edits', tableau):
+        tableau.url_edits()
+    logger.debug("After url edits and extracted data")
+
+    #print(f"Extracted data before processing: {tableau.extracted_data}")
+
+    if not tableau.extracted_data or not isinstance(tableau.extracted_data, dict):
+        raise ValueError("No valid data extracted or data is not a dictionary")
+    if 'report_name' not in tableau.extracted_data:
+        raise ValueError("Report name is missing")
+    workbook_luid = tableau.extracted_data.get('workbook_luid', 'Unknown')
+    if workbook_luid == 'Unknown':
+        raise ValueError("Workbook LUID is missing")
+    logger.debug("Extracted data:")
+    with phase('extract_worksheet', tableau):
+        column_metadata = tableau.extract_worksheet()
+        logger.debug("column metadata extracted successfully")
+        tableau.mark_worksheet_columns(column_metadata)
+    with phase('extract_all_columns', tableau):
+        all_columns = tableau.extract_all_columns()
+        for i, (dashboard_name, dashboard_content) in enumerate(tableau.extracted_data.get("Dashboards", {}).items()):
+            if i == 0:
+                dashboard_content["Columns"].extend(all_columns)
+                logger.debug("Columns successfully saved")
+    if code in DATASOURCE_ONLY_CODES:
+        with phase('extract_only_datasource', tableau):
+            datasources = tableau.extract_only_datasource()
+            for i, (dashboard_name, dashboard_content) in enumerate(tableau.extracted_data.get("Dashboards", {}).items()):
+                if i == 0:
+                    dashboard_content["Columns"].extend(datasources)
+                    logger.debug("Datasources !!! Data Sources !!  successfully saved")
+    logger.info("Processing complete for code: %s", code)
+    log_phase_summary()
+    extracted_data = compact_workbook(tableau.extracted_data)
+    if calculations is not None:
+        extracted_data[LINEAGE_CALCULATIONS] = calculations
+    return extracted_data
+
+
+def extract_workbook_measured(code, twbx_path, trace_memory=False, engine=None, save_decoded=True, streaming=False,
+                              keep_calculations=False):
+    """
+    extract_workbook with phase instrumentation, for worker processes.
+    :return: (extracted_data, list of phase records)
+    """
+    metrics = PhaseMetrics(code, trace_memory)
+    extracted_data = extract_workbook(code, twbx_path, metrics, engine, save_decoded, streaming, keep_calculations)
+    return extracted_data, metrics.records
+
+
+def fetch_workbook(code, client, delay=0, spool_bytes=None):
+    """
+    Downloads one workbook, optionally after waiting for a retry.
+    :param client: tableau_rest.TableauRestClient to download with.
+    :param spool_bytes: keep the workbook in a tableau_rest.WorkbookSpool instead of the working directory,
+        in memory up to this many bytes and in a temporary file above that. None downloads into the working directory.
+    :return: path of the downloaded workbook, or the WorkbookSpool.
+    """
+    if delay:
+        time.sleep(delay)
+    logger.info("code is %s", code)
+    if spool_bytes is not None:
+        return client.download_workbook_spooled(code, spool_bytes)
+    return os.path.abspath(client.download_workbook(code))
+
+
+def fetch_workbook_with_hash(code, client, delay=0, spool_bytes=None):
+    """
+    Same as fetch_workbook, plus the content hash of the .twb for the extraction cache.
+    :return: (path of the downloaded workbook or the WorkbookSpool, content hash)
+    """
+    downloaded = fetch_workbook(code, client, delay, spool_bytes)
+    source = downloaded.source() if isinstance(downloaded, WorkbookSpool) else downloaded
+    return downloaded, workbook_content_hash(source)
+
+
+def run_extraction(codes, client, download_workers=4, extract_workers=None,
+                   max_attempts=2, retry_delay=15, output_path=OUTPUT_FILE, cache=None, revisions=None,
+                   metrics_path=None, trace_memory=False, engine=None, spool_bytes=SPOOL_MAX_MEMORY,
+                   lineage=None, extract_timeout=EXTRACT_TIMEOUT, max_rss_bytes=MAX_RSS_BYTES, quarantine=None,
+                   manifest=None, fsync=False, streaming=False):
+    """
+    Downloads and extracts many workbooks at once. Downloads run in a thread pool (they only wait for the server),
+    the xml extraction runs in a supervised process pool (it is CPU bound). Downloads only run ahead of the extraction
+    by a few workbooks (every extraction process busy, plus one workbook downloading or waiting per process or per
+    download thread), so the downloaded workbooks held in memory do not pile up when the extraction falls behind.
+    A failed download is tried again until the workbook runs out of attempts. A workbook that fails to extract - an error,
+    a worker killed for running too long or using too much memory, a worker that crashed - would fail the same way again,
+    so it is quarantined instead.
+    Workers only return their extracted_data, the results are merged and written to output_path once, in the order of codes.
+    :param codes: workbook_luids to extract.
+    :param client: tableau_rest.TableauRestClient, signed in, shared by all download threads (pooled connections,
+        token renewal, rate limit backoff).
+    :param download_workers: number of parallel downloads.
+    :param extract_workers: number of extraction processes, None means one per CPU.
+    :param max_attempts: how many times one workbook is downloaded before it is skipped.
+    :param retry_delay: seconds to wait before the next attempt.
+    :param output_path: json file the results are merged into, None to only return them.
+        A .jsonl output_path gets every workbook appended as soon as it is extracted, in the order they finish,
+        and the workbooks are not kept in memory: read them back with load_records(output_path).
+    :param cache: tableau_cache.ExtractionCache. Workbooks found in it are neither unpacked nor extracted again.
+    :param revisions: optional dict workbook_luid -> revision. A cached revision is not even downloaded.
+    :param metrics_path: where to write the timing / memory report of every phase of every extracted workbook,
+        Prometheus text for a .prom file, json lines otherwise. None turns the instrumentation off.
+    :param trace_memory: also measure the peak python allocations of every phase (slower).
+    :param engine: xml parser engine of the extraction, 'lxml' or 'etree', None for the default (stdlib).
+    :param spool_bytes: workbooks up to this size go from the download to the extraction in memory,
+        bigger ones through a temporary file that is removed once the workbook is extracted. Nothing is written into
+        the working directory. None keeps the downloaded files (and their decoded copies) in the working directory.
+    :param lineage: tableau_lineage.LineageGraph, every extracted (or cached) workbook replaces its previous version there.
+        The workbooks are extracted with their calculation table for it (cached with it too), it is not saved in output_path.
+    :param extract_timeout: seconds one workbook may take to extract, None for no limit.
+    :param max_rss_bytes: resident memory one extraction worker may use, None for no limit.
+    :param quarantine: tableau_supervisor.Quarantine. The workbooks in it are skipped, those that fail to extract
+        are added to it. None keeps the quarantine of this run in memory.
+    :param manifest: tableau_runs.RunManifest, gets the status of every workbook as soon as it is known.
+        Needs a .jsonl output_path, the manifest records how far the output is written.
+    :param fsync: with a .jsonl output_path, every workbook is on disk before it is counted as done.
+    :param streaming: parse the workbooks with Tableau.unpack_twbx_streaming, same output with less memory.
+    :return: (list of extracted_data, empty with a .jsonl output_path,
+        list of workbook_luids that failed every attempt or are quarantined)
+    """
+    append_each = output_path is not None and is_json_lines(output_path)
+    if manifest is not None and not append_each:
+        raise ValueError("A run manifest needs a json lines output_path")
+    revisions = revisions or {}
+    fetch = fetch_workbook if cache is None else fetch_workbook_with_hash
+    results = {}
+    failed = []
+    phase_records = []
+    spools = {}
+    if quarantine is None:
+        quarantine = Quarantine()
+
+    def collect(code, extracted_data):
+        calculations = extracted_data.pop(LINEAGE_CALCULATIONS, None)
+        if lineage is not None:
+            lineage.add_workbook(extracted_data, calculations)
+        if append_each:
+            save_records([extracted_data], output_path, fsync)
         else:
-            with open(file_path, 'r') as f:
+            results[code] = extracted_data
+        if manifest is not None:
+            manifest.mark(code, 'done', output_bytes=os.path.getsize(output_path))
+
+    def fail(code, status, error):
+        failed.append(code)
+        if manifest is not None:
+            manifest.mark(code, status, error=error)
+
+    def release(code):
+        spool = spools.pop(code, None)
+        if spool is not None:
+            spool.close()
+
+    with ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+            SupervisedPool(extract_workers, timeout=extract_timeout, max_rss_bytes=max_rss_bytes,
+                           preload=['tableau_metadata_extractor']) as extractions:
+        # a workbook is in pending from its download until its extraction is done, one future at a time
+        pending = {}
+        in_flight = extractions.max_workers + max(extractions.max_workers, download_workers)
+        queued_codes = iter(codes)
+
+        def start_downloads():
+            while len(pending) < in_flight:
+                code = next(queued_codes, None)
+                if code is None:
+                    return
+                if code in quarantine:
+                    logger.warning("Workbook %s is quarantined (%s), skipping it.", code, quarantine.get(code)['error'])
+                    fail(code, 'quarantined', quarantine.get(code)['error'])
+                    continue
+                if cache is not None and revisions.get(code) is not None:
+                    # a miss here is looked up again by the content hash once downloaded
+                    cached = cache.get(code, revision=revisions[code], count_miss=False)
+                    if cached is not None:
+                        logger.info("Workbook %s is unchanged, using the cache.", code)
+                        collect(code, cached)
+                        continue
+                pending[downloads.submit(fetch, code, client, 0, spool_bytes)] = \
+                    (code, 1, 'download', None)
+
+        start_downloads()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                code, attempt, stage, content_hash = pending.pop(future)
+                if stage == 'extract':
+                    # extracted or failed, the downloaded workbook is not needed any more (a retry downloads it again)
+                    release(code)
                 try:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        data.append(self.extracted_data)
-                        print("data appended")
+                    value = future.result()
+                except Exception as e:
+                    logger.warning("An error occurred with code %s: %s.", code, e)
+                    if stage == 'extract':
+                        quarantine.add(code, e)
+                        logger.error("Workbook %s did not extract (%s), quarantining it.", code,
+                                     quarantine.get(code)['reason'])
+                        fail(code, 'quarantined', quarantine.get(code)['error'])
+                    elif attempt < max_attempts:
+                        logger.warning("Waiting %s seconds to retry...", retry_delay)
+                        retry = downloads.submit(fetch, code, client, retry_delay, spool_bytes)
+                        pending[retry] = (code, attempt + 1, 'download', None)
                     else:
-                        data = [data, self.extracted_data]
-                        print("another way of saving data")
-                except json.JSONDecodeError:
-                    data = [self.extracted_data]
-
-            with open(file_path, 'w') as f:
-                json.dump(data, f, indent=4)
-                print("json dumped finally")
-
-        print(f"Data saved to {file_path}")
-
-for code in codes:
-    retry_count = 0  # Initialize retry counter
-    while retry_count < 2:  # Allow for up to 2 retries
-        try:
-            print(f"code is {code}")
-            downloaded_workbook_name = download_workbook(code, site_id, auth_header_xml)
-            print(code)
-            twbx_path = os.path.join(os.getcwd(), downloaded_workbook_name)
-            tableau = Tableau(twbx_path)
-
-            tableau.unpack_twbx()
-            print("Before Extracting")
-            tableau.extract_info_from_twb()
-            print("After extract")
-            print(f"{tableau.extracted_data}")
-            print(f"Extract successfull")
-
-            for dashboard_name, dashboard_content in tableau.extracted_data['Dashboards'].items():
-                if 'Columns' not in dashboard_content:
-                    dashboard_content['Columns'] = []
-                tableau.extract_columns_metadata(tableau.root, dashboard_content['Columns'])
-
-            tableau.dashboard_basic_info()
-            print("Before datasource dependencies")
-            tableau.add_datasource_dependencies()
-            print("Before adding column details")
-            tableau.add_column_details()
-            tableau.clean_dashboard_columns()
-            tableau.merge_dashboard_columns_with_datasources()
-            tableau.remove_views_and_calculations()
-            tableau.add_url()
-            print("Before move general info")
-            tableau.move_general_info()
-            print("After move general before url edits")
-            tableau.url_edits()
-            print("After url edits and extracted data")
-            tableau.extracted_data['workbook_luid'] = code
-            print("I came after extracted data")
-
-            #print(f"Extracted data before processing: {tableau.extracted_data}")
-
-            if not tableau.extracted_data or not isinstance(tableau.extracted_data, dict):
-                raise ValueError("No valid data extracted or data is not a dictionary")
-            report_name = tableau.extracted_data.get('report_name', 'Unknown')
-            workbook_luid = tableau.extracted_data.get('workbook_luid', 'Unknown')
-            if workbook_luid == 'Unknown':
-                raise ValueError("Workbook LUID is missing")
-
-            new_dict = {
-                'report_name': tableau.extracted_data['report_name'],
-                'workbook_luid': tableau.extracted_data['workbook_luid'],
-            }
-            dashboard_names = [key for key in tableau.extracted_data.get("Dashboards", {})]
-
-            for key, value in tableau.extracted_data.items():
-                if key not in ['report_name', 'workbook_luid']:
-                    new_dict[key] = value
-
-            tableau.extracted_data = new_dict
-            print(f"Extracted data:")
-            column_metadata = tableau.extract_worksheet()
-            logging.debug(f"column metadata extracted successfully")
-            for dashboard_name, dashboard_content in tableau.extracted_data.get("Dashboards", {}).items():
-                for column in dashboard_content.get("Columns", []):
-                    for col_metadata in column_metadata:
-                        print(f"Comparing {col_metadata.get('caption')} and {column.get('caption')}")
-                        if col_metadata.get('caption') == column.get('caption'):
-                            column['worksheet'] = 'yes'
-                            print(f"for  {col_metadata.get('caption')} and {column.get('caption')} decision is yes")
-                            break
-                        else:
-                            column['worksheet'] = 'no'
-            all_columns = tableau.extract_all_columns()
-            for i, (dashboard_name, dashboard_content) in enumerate(tableau.extracted_data.get("Dashboards", {}).items()):
-                if i == 0:
-                    dashboard_content["Columns"].extend(all_columns)
-                    logging.debug(f"Columns successfully saved")
-            if code in ['code1', 'code2']:
-                datasources = tableau.extract_only_datasource()
-                for i, (dashboard_name, dashboard_content) in enumerate(tableau.extracted_data.get("Dashboards", {}).items()):
-                    if i == 0:
-                        dashboard_content["Columns"].extend(datasources)
-                        logging.debug(f"Datasources !!! Data Sources !!  successfully saved")
-            logging.debug(f"before saving data")
-            tableau.save_data()
-            print("Processing complete for code:", code)
-            break
-
-        except Exception as e:
-            print(f"An error occurred with code {code}: {e}.")
-            retry_count += 1  # Increment retry counter
-            if retry_count < 2:  # Only wait if we have retries left
-                print("Waiting 15 seconds to retry...")
-                time.sleep(15)
-            else:
-                print("Max retries reached. Skipping to the next code.")
+                        logger.error("Max retries reached. Skipping to the next code.")
+                        fail(code, 'failed', f"{type(e).__name__}: {e}")
+                    continue
 
-import pandas as pd
-import json
+                if stage == 'download':
+                    twbx_path = value
+                    if cache is not None:
+                        twbx_path, content_hash = value
+                    save_decoded = not isinstance(twbx_path, WorkbookSpool)
+                    if not save_decoded:
+                        spools[code] = twbx_path
+                        twbx_path = twbx_path.take()
+                    if cache is not None:
+                        cached = cache.get(code, content_hash=content_hash)
+                        if cached is not None:
+                            logger.info("Workbook %s has not changed, using the cache.", code)
+                            release(code)
+                            if revisions.get(code) is not None:
+                                cache.put(code, cached, revision=revisions[code])
+                            collect(code, cached)
+                            continue
+                    if metrics_path is None:
+                        extraction = extractions.submit(extract_workbook, code, twbx_path, None, engine, save_decoded,
+                                                         streaming, lineage is not None)
+                    else:
+                        extraction = extractions.submit(extract_workbook_measured, code, twbx_path, trace_memory,
+                                                         engine, save_decoded, streaming, lineage is not None)
+                    pending[extraction] = (code, attempt, 'extract', content_hash)
+                else:
+                    if metrics_path is not None:
+                        value, records = value
+                        phase_records.extend(records)
+                    if cache is not None:
+                        cache.put(code, value, revision=revisions.get(code), content_hash=content_hash)
+                    collect(code, value)
+            start_downloads()
+
+    if cache is not None:
+        logger.info("Extraction cache: %s", cache.stats())
+    if len(quarantine):
+        logger.warning("Quarantined workbooks: %s", quarantine.report())
+    if metrics_path is not None:
+        write_metrics(phase_records, metrics_path)
+
+    records = [results[code] for code in codes if code in results]
+    if output_path is not None and records and not append_each:
+        logger.debug("before saving data")
+        save_records(records, output_path)
+    return records, failed
+
+
+# table name -> name of the rows in flatten_record. The csv/parquet names are kept as the loaders know them,
+# so dashboards go to "views" and dashboard views (filters) go to "filters".
+TABLE_NAMES = ('all_columns_wb', 'workbooks', 'views', 'filters', 'columns', 'datasources')
+
+# columns of every table, in the order of the csv files and of the tuples from flatten_record_values
+TABLE_COLUMNS = {
+    'all_columns_wb': ('name', 'url', 'caption', 'datatype', 'name_column', 'role', 'formula', 'worksheet'),
+    'workbooks': ('workbook_luid', 'report_name', 'dashboard_name', 'wbldbn'),
+    'views': ('wbldbn', 'site', 'class', 'url'),
+    'filters': ('wbldbn', 'caption', 'type', 'value', 'options'),
+    'columns': ('wbldbn', 'aggregation', 'caption', 'datatype', 'default-type', 'name', 'role', 'formula', 'worksheet'),
+    'datasources': ('wbldbn', 'id', 'name', 'sqlproxy', 'url', 'dbname'),
+}
+
+# Columns with a handful of distinct values per table become pandas categoricals, the same ones the parquet export
+# dictionary encodes, so e.g. every "measure" is stored once.
+CATEGORY_COLUMNS = {
+    'all_columns_wb': ('datatype', 'role', 'worksheet'),
+    'workbooks': ('workbook_luid', 'report_name', 'wbldbn'),
+    'views': ('wbldbn', 'site', 'class'),
+    'filters': ('wbldbn', 'type'),
+    'columns': ('wbldbn', 'aggregation', 'datatype', 'default-type', 'role', 'worksheet'),
+    'datasources': ('wbldbn', 'sqlproxy', 'dbname'),
+}
+
+
+def to_text(value):
+    """
+    A table value as the exports store it: strings and None as they are, anything else (a filter's options list,
+    a number) as its str.
+    """
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def flatten_record_values(entry):
+    """
+    Flattens one extracted workbook into table rows, as tuples in the column order of TABLE_COLUMNS.
+    :param entry: extracted_data of one workbook.
+    :return: generator of (table name, row tuple) pairs.
+    """
+    name = entry.get('name')
+    url = entry.get('url')
+    for column in entry.get('Columns', []):
+        yield 'all_columns_wb', (
+            name,
+            url,
+            column.get('caption', ''),
+            column.get('datatype', ''),
+            column.get('name', ''),
+            column.get('role', ''),
+            column.get('formula', ''),
+            column.get('worksheet', ''),
+        )
 
-# Load the JSON data from file
-with open('TABLEAUDATAZEXTRAKTORU_test.json', 'r') as file:
-    data = json.load(file)
-
-if isinstance(data[0], str):
-    data = [json.loads(item) if isinstance(item, str) else item for item in data]
-
-#print(f"First item in data after parsing (if string): {data[0]}")
-#print(f"Type of first item now: {type(data[0])}")  # Should be a dict
-
-print("json successfully loaded")
-
-# Initialize empty lists for data collection
-dashboard_list_data = []
-dashboards_data = []
-views_data = []
-columns_data = []
-datasources_data = []
-extracted_data = []
-
-extracted_data = []
-
-for item in data:
-    columns = item.get('Columns', [])
-    for column in columns:
-        extracted_data.append({
-            'name': item.get('name'),
-            'url': item.get('url'),
-            'caption': column.get('caption', ''),
-            'datatype': column.get('datatype', ''),
-            'name_column': column.get('name', ''),
-            'role': column.get('role', ''),
-            'formula': column.get('formula', ''),
-            'worksheet': column.get('worksheet', '')
-        })
-
-all_columns_new = pd.DataFrame(extracted_data)
-all_columns_new.to_csv('all_columns_wb.csv')
-
-# Extract data
-for entry in data:
     workbook_luid = entry['workbook_luid']
     report_name = entry['report_name']
 
     # Iterate through each dashboard within an entry
     for dashboard_key, dashboard_value in entry['Dashboards'].items():
-        #print(entry['Dashboards'].items())
         # Construct wbldbn identifier
         wbldbn = f"{workbook_luid}_{dashboard_key}"
 
         # Dashboard list data collection
-        dashboard_list_data.append({
-            'workbook_luid': workbook_luid,
-            'report_name': report_name,
-            'dashboard_name': dashboard_key,
-            'wbldbn': wbldbn
-        })
-
-        site = dashboard_value['GeneralInfo'].get('site', 'N/A')
-        dashboard_class = dashboard_value.get('class', 'N/A')  # Safe access if 'class' might not be present
-        url = dashboard_value.get('url', 'N/A')  # Safe access for 'url'
-
-        # Safely extract 'Columns', 'Views', and 'Data sources' if they exist
-        column_names = [col.get('name', 'N/A') for col in
-                        dashboard_value.get('Columns', [])]  # Default to empty list if not found
-        view_captions = [view.get('caption', 'N/A') for view in
-                         dashboard_value.get('Views', [])]  # Default to empty list if not found
-        datasource_ids = [ds.get('id', 'N/A') for ds in
-                          dashboard_value['GeneralInfo'].get('Data sources', [])]  # Default to empty list if not found
-
-        dashboard_row = {
-            'wbldbn': wbldbn,
-            'site': site,
-            'class': dashboard_class,
-            'url': url
-        }
-
-        dashboards_data.append(dashboard_row)
+        yield 'workbooks', (workbook_luid, report_name, dashboard_key, wbldbn)
+
+        yield 'views', (
+            wbldbn,
+            dashboard_value['GeneralInfo'].get('site', 'N/A'),
+            dashboard_value.get('class', 'N/A'),  # Safe access if 'class' might not be present
+            dashboard_value.get('url', 'N/A'),  # Safe access for 'url'
+        )
+
         # Views data collection
         for view in dashboard_value['Views']:
-            views_data.append({
-                'wbldbn': wbldbn,
-                'caption': view['caption'],
-                'type': view['type'],
-                'value': view.get('value', ''),
-                'options': ', '.join(view.get('options', []))
-            })
+            yield 'filters', (
+                wbldbn,
+                view['caption'],
+                view['type'],
+                view.get('value', ''),
+                ', '.join(view.get('options', [])),
+            )
 
         # Columns data collection
         for column in dashboard_value['Columns']:
-            columns_data.append({
-                'wbldbn': wbldbn,
-                'aggregation': column.get('aggregation', None),
-                'caption': column.get('caption', None),
-                'datatype': column.get('datatype', None),
-                'default-type': column.get('default-type', None),
-                'name': column.get('name', None),
-                'role': column.get('role', None),
-                'formula': column.get('formula', None),
-                'worksheet': column.get('worksheet', None)
-            })
+            yield 'columns', (
+                wbldbn,
+                column.get('aggregation', None),
+                column.get('caption', None),
+                column.get('datatype', None),
+                column.get('default-type', None),
+                column.get('name', None),
+                column.get('role', None),
+                column.get('formula', None),
+                column.get('worksheet', None),
+            )
 
         # Datasources data collection
         for datasource in dashboard_value['GeneralInfo']['Data sources']:
-            datasources_data.append({
-                'wbldbn': wbldbn,
-                'id': datasource['id'],
-                'name': datasource['name'],
-                'sqlproxy': datasource.get('Sqlproxy', ''),  # Use get for optional fields
-                'url': datasource.get('URL', 'N/A'),  # missing url just to be sure
-                'dbname': datasource['dbname']
-            })
-
-# Create DataFrames
-workbooks = pd.DataFrame(dashboard_list_data)
-views = pd.DataFrame(dashboards_data)
-filters = pd.DataFrame(views_data)
-columns = pd.DataFrame(columns_data)
-datasources = pd.DataFrame(datasources_data)
-
-workbooks.to_csv('workbooks.csv', index=False)
-views.to_csv('views.csv', index=False)
-filters.to_csv('filters.csv', index=False)
-columns.to_csv('columns.csv', index=False)
-datasources.to_csv('datasources.csv', index=False)
-
-print("dataframes are ready to map")
\ No newline at end of file
+            yield 'datasources', (
+                wbldbn,
+                datasource['id'],
+                datasource['name'],
+                datasource.get('Sqlproxy', ''),  # Use get for optional fields
+                datasource.get('URL', 'N/A'),  # missing url just to be sure
+                datasource['dbname'],
+            )
+
+
+def flatten_record(entry):
+    """
+    Flattens one extracted workbook into table rows.
+    :param entry: extracted_data of one workbook.
+    :return: generator of (table name, row dict) pairs.
+    """
+    for table, values in flatten_record_values(entry):
+        yield table, dict(zip(TABLE_COLUMNS[table], values))
+
+
+def table_frame(name, rows):
+    """
+    Builds one table column by column from its row tuples, low-cardinality columns as categoricals.
+    :param name: table name, e.g. 'columns'.
+    :param rows: list of tuples from flatten_record_values.
+    :return: pandas.DataFrame
+    """
+    # pandas takes longer to import than most runs need to check a workbook, only the table export loads it
+    import pandas as pd
+
+    if not rows:
+        # an empty table is written as before, without a header
+        return pd.DataFrame()
+    columns = TABLE_COLUMNS[name]
+    # dtype=object keeps the python strings as they are, inferring string columns first only slows the csv down
+    frame = pd.DataFrame(dict(zip(columns, map(list, zip(*rows)))), columns=columns, dtype=object)
+    for column in CATEGORY_COLUMNS[name]:
+        try:
+            frame[column] = frame[column].astype('category')
+        except TypeError:
+            # unhashable values (e.g. a list) stay plain objects
+            pass
+    return frame
+
+
+def write_table(name, rows, output_dir='.'):
+    """
+    Writes one table as <name>.csv. all_columns_wb keeps its index column, as the loaders expect.
+    """
+    table_frame(name, rows).to_csv(os.path.join(output_dir, f'{name}.csv'), index=name == 'all_columns_wb')
+    return name
+
+
+def write_tables(json_path=OUTPUT_FILE, workers=None, output_dir='.'):
+    """
+    Flattens the extracted workbooks into workbooks, views, filters, columns and datasources csv tables.
+    :param json_path: json or json lines file written by save_records.
+    :param workers: write the tables in that many processes at once (building the frame and the csv is CPU bound),
+        None writes them one after the other.
+    :param output_dir: directory for the csv files.
+    :return: csv files in output_dir (the working directory by default).
+    """
+    tables = {name: [] for name in TABLE_NAMES}
+    appends = {name: rows.append for name, rows in tables.items()}
+
+    # The rows are millions of small tuples without reference cycles. Letting the garbage collector scan them again
+    # and again while they pile up took about a third of the time, so it is paused until the tables are written.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        # Records are read lazily, so everything below walks them only once
+        for entry in load_records(json_path):
+            for table, values in flatten_record_values(entry):
+                appends[table](values)
+
+        logger.info("json successfully loaded")
+
+        if workers:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # the biggest tables go first, so they do not end up last on a busy worker
+                names = sorted(TABLE_NAMES, key=lambda name: len(tables[name]), reverse=True)
+                for name in pool.map(write_table, names, [tables[name] for name in names], [output_dir] * len(names)):
+                    logger.debug("%s.csv written", name)
+        else:
+            for name in TABLE_NAMES:
+                write_table(name, tables[name], output_dir)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    logger.info("dataframes are ready to map")
+
+
+if __name__ == '__main__':
+    from tableau_cli import main
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _rss_bytes():
+    """
+    Current resident memory of the process. Not the peak (ru_maxrss): an extraction worker lives for many workbooks,
+    and its peak would stay at the biggest one it ever extracted.
+    :return: bytes, None without /proc (not Linux).
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _counts(tableau):
+    """
+    Size of the workbook and of the extracted data at the end of a phase.
+    """
+    index = getattr(tableau, '_index', None)
+    dashboards = tableau.extracted_data.get('Dashboards', {}) if isinstance(tableau.extracted_data, dict) else {}
+    return {
+        'elements': len(index.elements) if index is not None else 0,
+        'dashboards': len(dashboards),
+        'columns': sum(len(dashboard.get('Columns', [])) for dashboard in dashboards.values()
+                       if isinstance(dashboard, dict)),
+    }
+
+
+class PhaseMetrics:
+    """
+    Wall time, CPU time, memory and element counts of every phase (Tableau method) of one workbook.
+    Memory is the resident memory of the process after the phase and how much the phase added to it (negative when
+    it freed more than it took); with trace_memory the peak of python allocations inside the phase is measured too
+    (tracemalloc, which makes the extraction noticeably slower).
+    """
+
+    def __init__(self, workbook_luid, trace_memory=False):
+        self.workbook_luid = workbook_luid
+        self.trace_memory = trace_memory
+        self.records = []
+
+    @contextmanager
+    def phase(self, name, tableau=None):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        rss_start = _rss_bytes()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall_seconds = time.perf_counter() - wall_start
+            cpu_seconds = time.process_time() - cpu_start
+            rss = _rss_bytes()
+            record = {
+                'workbook_luid': self.workbook_luid,
+                'phase': name,
+                'wall_seconds': wall_seconds,
+                'cpu_seconds': cpu_seconds,
+                'rss_bytes': rss,
+                'rss_delta_bytes': rss - rss_start if rss is not None and rss_start is not None else None,
+            }
+            if self.trace_memory:
+                record['peak_alloc_bytes'] = tracemalloc.get_traced_memory()[1]
+            if tableau is not None:
+                record.update(_counts(tableau))
+            self.records.append(record)
+
+
+@contextmanager
+def no_phase(name, tableau=None):
+    yield
+
+
+def write_metrics_json(records, path):
+    """
+    Appends the phase records as json lines.
+    """
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+PROMETHEUS_METRICS = (
+    ('wall_seconds', 'Wall clock time of the extraction phase.'),
+    ('cpu_seconds', 'CPU time of the extraction phase.'),
+    ('rss_bytes', 'Resident memory of the extraction process after the phase.'),
+    ('rss_delta_bytes', 'Resident memory the extraction phase added (negative when it freed memory).'),
+    ('peak_alloc_bytes', 'Peak python allocations during the phase.'),
+    ('elements', 'XML elements in the workbook index after the phase.'),
+    ('dashboards', 'Dashboards in the extracted data after the phase.'),
+    ('columns', 'Dashboard columns in the extracted data after the phase.'),
+)
+
+
+def write_metrics_prometheus(records, path):
+    """
+    Writes the phase records in the Prometheus text format, for the node exporter textfile collector.
+    The file is replaced atomically, so the collector never reads half of it.
+    """
+    lines = []
+    for key, help_text in PROMETHEUS_METRICS:
+        samples = [record for record in records if record.get(key) is not None]
+        if not samples:
+            continue
+        name = f'tableau_extractor_phase_{key}'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for record in samples:
+            lines.append(f'{name}{{workbook="{_label(record["workbook_luid"])}",phase="{_label(record["phase"])}"}} '
+                         f'{record[key]}')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(path + '.tmp', path)
+
+
+def write_metrics(records, path):
+    """
+    Writes the report as Prometheus text for a .prom path, as json lines otherwise.
+    """
+    if os.path.splitext(path)[1] == '.prom':
+        write_metrics_prometheus(records, path)
+    else:
+        write_metrics_json(records, path)
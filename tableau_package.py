@@ -0,0 +1,171 @@
+import io
+import json
+import mmap
+import os
+import sys
+import zipfile
+from contextlib import contextmanager
+
+# member type by extension, for the package manifest
+MEMBER_TYPES = {
+    '.twb': 'workbook',
+    '.tds': 'datasource',
+    '.tdsx': 'datasource',
+    '.hyper': 'extract',
+    '.tde': 'extract',
+    '.png': 'image',
+    '.jpg': 'image',
+    '.jpeg': 'image',
+    '.gif': 'image',
+    '.bmp': 'image',
+    '.svg': 'image',
+    '.csv': 'data',
+    '.txt': 'data',
+    '.json': 'data',
+    '.xls': 'data',
+    '.xlsx': 'data',
+}
+
+COMPRESSION_NAMES = {
+    zipfile.ZIP_STORED: 'stored',
+    zipfile.ZIP_DEFLATED: 'deflated',
+    zipfile.ZIP_BZIP2: 'bzip2',
+    zipfile.ZIP_LZMA: 'lzma',
+}
+
+
+def member_type(filename):
+    return MEMBER_TYPES.get(os.path.splitext(filename)[1].lower(), 'other')
+
+
+class _MappedFile:
+    """
+    Read-only mmap as a file object for zipfile, which needs seekable() (mmap has it only since python 3.13).
+    """
+
+    def __init__(self, mapped):
+        self._mapped = mapped
+
+    def seekable(self):
+        return True
+
+    def __getattr__(self, name):
+        return getattr(self._mapped, name)
+
+
+class TwbxPackage:
+    """
+    Read-only view of a .twbx package. Opening it reads only the central directory at the end of the archive,
+    the .twb entry is found there and is the only member ever decompressed - extracts and images are not read at all.
+    A package on disk is memory-mapped, so the operating system pages in just the parts of the file that are touched.
+    """
+
+    def __init__(self, fileobj, mapped=None):
+        self._mapped = mapped
+        self.zip = zipfile.ZipFile(fileobj, 'r')
+        self.twb_info = self._find_twb()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _find_twb(self):
+        """
+        The .twb entry of the package, the one closest to the root if there are several.
+        """
+        candidates = [info for info in self.zip.infolist() if info.filename.endswith('.twb')]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda info: info.filename.count('/'))
+
+    def open_twb(self):
+        """
+        :return: binary file object decompressing the .twb as it is read.
+        """
+        return self.zip.open(self.twb_info)
+
+    def manifest(self):
+        """
+        Every member of the package with its sizes and type, straight from the central directory (nothing is decompressed).
+        :return: dict with 'members' (name, type, size, compressed_size, compression), the totals and the totals per type.
+        """
+        members = []
+        by_type = {}
+        for info in self.zip.infolist():
+            if info.is_dir():
+                continue
+            kind = member_type(info.filename)
+            members.append({
+                'name': info.filename,
+                'type': kind,
+                'size': info.file_size,
+                'compressed_size': info.compress_size,
+                'compression': COMPRESSION_NAMES.get(info.compress_type, str(info.compress_type)),
+            })
+            totals = by_type.setdefault(kind, {'members': 0, 'size': 0, 'compressed_size': 0})
+            totals['members'] += 1
+            totals['size'] += info.file_size
+            totals['compressed_size'] += info.compress_size
+        return {
+            'members': members,
+            'size': sum(member['size'] for member in members),
+            'compressed_size': sum(member['compressed_size'] for member in members),
+            'by_type': by_type,
+        }
+
+    def close(self):
+        self.zip.close()
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+
+
+@contextmanager
+def open_package(source):
+    """
+    Opens a workbook as a TwbxPackage.
+    :param source: path of a downloaded .twb / .twbx, its content as bytes, or a binary file object.
+    :return: context manager giving the TwbxPackage, or None when the source is not a zip (a plain .twb).
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if not isinstance(source, (str, os.PathLike)):
+        is_zip = zipfile.is_zipfile(source)
+        source.seek(0)
+        if not is_zip:
+            yield None
+            return
+        with TwbxPackage(source) as package:
+            yield package
+        return
+
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield None
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if not zipfile.is_zipfile(mapped):
+            mapped.close()
+            yield None
+            return
+        mapped.seek(0)
+        with TwbxPackage(_MappedFile(mapped), mapped) as package:
+            yield package
+
+
+def package_manifest(source):
+    """
+    Manifest of a downloaded workbook for capacity reporting, see TwbxPackage.manifest.
+    :param source: path, bytes or binary file object.
+    :return: manifest dict, None for a plain .twb.
+    """
+    with open_package(source) as package:
+        return package.manifest() if package is not None else None
+
+
+if __name__ == '__main__':
+    # python tableau_package.py a.twbx b.twbx ... prints one manifest per line
+    for path in sys.argv[1:]:
+        print(json.dumps({'path': path, 'manifest': package_manifest(path)}))
@@ -0,0 +1,133 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from tableau_logging import logger
+from tableau_metadata_extractor import OUTPUT_FILE, TABLE_NAMES, flatten_record, load_records, to_text
+
+# Columns with only a handful of distinct values (per table) are dictionary encoded,
+# so e.g. every "measure" in the columns table is stored once.
+DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+SCHEMAS = {
+    'all_columns_wb': pa.schema([
+        ('name', pa.string()),
+        ('url', pa.string()),
+        ('caption', pa.string()),
+        ('datatype', DICTIONARY),
+        ('name_column', pa.string()),
+        ('role', DICTIONARY),
+        ('formula', pa.string()),
+        ('worksheet', DICTIONARY),
+    ]),
+    'workbooks': pa.schema([
+        ('workbook_luid', DICTIONARY),
+        ('report_name', DICTIONARY),
+        ('dashboard_name', pa.string()),
+        ('wbldbn', DICTIONARY),
+    ]),
+    'views': pa.schema([
+        ('wbldbn', DICTIONARY),
+        ('site', DICTIONARY),
+        ('class', DICTIONARY),
+        ('url', pa.string()),
+    ]),
+    'filters': pa.schema([
+        ('wbldbn', DICTIONARY),
+        ('caption', pa.string()),
+        ('type', DICTIONARY),
+        ('value', pa.string()),
+        ('options', pa.string()),
+    ]),
+    'columns': pa.schema([
+        ('wbldbn', DICTIONARY),
+        ('aggregation', DICTIONARY),
+        ('caption', pa.string()),
+        ('datatype', DICTIONARY),
+        ('default-type', DICTIONARY),
+        ('name', pa.string()),
+        ('role', DICTIONARY),
+        ('formula', pa.string()),
+        ('worksheet', DICTIONARY),
+    ]),
+    'datasources': pa.schema([
+        ('wbldbn', DICTIONARY),
+        ('id', pa.string()),
+        ('name', pa.string()),
+        ('sqlproxy', DICTIONARY),
+        ('url', pa.string()),
+        ('dbname', DICTIONARY),
+    ]),
+}
+
+
+class TableWriter:
+    """
+    Writes one table into a parquet file batch by batch, so the rows of the whole site are never in memory at once.
+    Every batch becomes its own row group with min/max statistics, which is what lets readers skip row groups.
+    """
+
+    def __init__(self, name, output_dir='.', batch_size=50000):
+        self.name = name
+        self.schema = SCHEMAS[name]
+        self.path = os.path.join(output_dir, f'{name}.parquet')
+        self.batch_size = batch_size
+        self.columns = {field.name: [] for field in self.schema}
+        self.rows = 0
+        self.writer = pq.ParquetWriter(self.path, self.schema, use_dictionary=True, write_statistics=True)
+
+    def append(self, row):
+        for column, values in self.columns.items():
+            values.append(to_text(row.get(column)))
+        self.rows += 1
+        if len(self.columns[self.schema[0].name]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.columns[self.schema[0].name]:
+            return
+        arrays = []
+        for field in self.schema:
+            values = pa.array(self.columns[field.name], type=pa.string())
+            arrays.append(values.dictionary_encode() if pa.types.is_dictionary(field.type) else values)
+            self.columns[field.name] = []
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def write_parquet_tables(json_path=OUTPUT_FILE, output_dir='.', batch_size=50000):
+    """
+    Columnar version of write_tables - the same six tables, written as typed parquet files.
+    Records are read lazily and the tables are built in record batches of batch_size rows.
+    :param json_path: json or json lines file written by save_records.
+    :param output_dir: directory for the <table>.parquet files.
+    :param batch_size: rows per record batch (and row group).
+    :return: dict table name -> number of rows written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    writers = {name: TableWriter(name, output_dir, batch_size) for name in TABLE_NAMES}
+    try:
+        for entry in load_records(json_path):
+            for table, row in flatten_record(entry):
+                writers[table].append(row)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    logger.info("Parquet tables are in %s", output_dir)
+    return {name: writer.rows for name, writer in writers.items()}
+
+
+def read_parquet_table(name, output_dir='.', columns=None, filters=None):
+    """
+    Reads one exported table. Filters are pushed down to the parquet reader, so row groups that cannot match are not read.
+    :param name: table name, e.g. 'columns'.
+    :param columns: list of columns to read, None for all.
+    :param filters: pyarrow filters, e.g. [('wbldbn', '=', 'luid_Overview'), ('role', '=', 'measure')].
+    :return: pyarrow.Table
+    """
+    return pq.read_table(os.path.join(output_dir, f'{name}.parquet'), columns=columns, filters=filters)
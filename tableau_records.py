@@ -0,0 +1,126 @@
+import sys
+from collections.abc import Mapping
+
+# key tuple -> the same tuple with interned keys, shared by every record of that shape
+_shapes = {}
+
+
+def _shape(keys):
+    shape = _shapes.get(keys)
+    if shape is None:
+        shape = _shapes[keys] = tuple(sys.intern(key) for key in keys)
+    return shape
+
+
+class Record(Mapping):
+    """
+    Read-only, slotted stand-in for one extracted dict (a column, view, filter or datasource).
+    The values are kept in a tuple and the keys in a tuple shared by all records with the same keys, so a record
+    costs two slots and a tuple instead of a whole dict. It reads like a dict (get, [], items, ==) and keeps the key
+    order of the dict it was made from, so it turns back into exactly the same json.
+    """
+    __slots__ = ('_keys', '_values')
+    # values of these keys repeat across the whole site (roles, datatypes, ...), they are interned
+    INTERNED = frozenset()
+
+    def __init__(self, keys, values):
+        self._keys = _shape(tuple(keys))
+        self._values = tuple(sys.intern(value) if key in self.INTERNED and isinstance(value, str) else value
+                             for key, value in zip(self._keys, values))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.keys(), data.values())
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    def __reduce__(self):
+        # the key tuple is pickled once per pickle, not once per record
+        return type(self), (self._keys, self._values)
+
+    def to_dict(self):
+        return dict(zip(self._keys, self._values))
+
+
+class ColumnRecord(Record):
+    """ One entry of "Columns". """
+    __slots__ = ()
+    INTERNED = frozenset({'aggregation', 'datatype', 'default-type', 'role', 'type', 'class', 'datasource', 'worksheet'})
+
+
+class ViewRecord(Record):
+    """ One entry of the workbook "Views" (every column of every datasource). """
+    __slots__ = ()
+    INTERNED = frozenset({'Type'})
+
+
+class FilterRecord(Record):
+    """ One entry of the dashboard "Views" (filters and parameters). """
+    __slots__ = ()
+    INTERNED = frozenset({'type'})
+
+
+class DatasourceRecord(Record):
+    """ One entry of "Data sources". """
+    __slots__ = ()
+    # name, URL, id and path are different for every datasource, interning them would only fill the intern table
+    INTERNED = frozenset({'class', 'dbname'})
+
+
+def compact_workbook(extracted_data):
+    """
+    Swaps the entity dicts of a finished workbook for records. Objects shared between dashboards
+    (the GeneralInfo with its datasources) stay shared, so pickling the workbook writes them once.
+    :param extracted_data: extracted_data of one workbook, after the whole Tableau pipeline.
+    :return: the same extracted_data, changed in place.
+    """
+    compacted = {}
+
+    def records(items, record_type):
+        result = []
+        for item in items:
+            if isinstance(item, dict):
+                if id(item) not in compacted:
+                    compacted[id(item)] = record_type.from_dict(item)
+                item = compacted[id(item)]
+            result.append(item)
+        return result
+
+    for key, record_type in (('Views', ViewRecord), ('Columns', ColumnRecord), ('Data sources', DatasourceRecord)):
+        if isinstance(extracted_data.get(key), list):
+            extracted_data[key] = records(extracted_data[key], record_type)
+    for dashboard in extracted_data.get('Dashboards', {}).values():
+        if not isinstance(dashboard, dict):
+            continue
+        for key, record_type in (('Views', FilterRecord), ('Columns', ColumnRecord)):
+            if isinstance(dashboard.get(key), list):
+                dashboard[key] = records(dashboard[key], record_type)
+        general_info = dashboard.get('GeneralInfo')
+        # every dashboard has the same GeneralInfo dict, it is compacted once
+        if isinstance(general_info, dict) and id(general_info) not in compacted \
+                and isinstance(general_info.get('Data sources'), list):
+            compacted[id(general_info)] = general_info
+            general_info['Data sources'] = records(general_info['Data sources'], DatasourceRecord)
+    return extracted_data
+
+
+def record_default(obj):
+    """
+    default= of json.dump / json.dumps, writes records as the dicts they were made from.
+    """
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
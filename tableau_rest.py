@@ -0,0 +1,341 @@
+import io
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import weakref
+
+from tableau_logging import logger
+
+# Tableau ends a REST session after 240 minutes by default, the token is renewed a bit before that
+TOKEN_LIFETIME = 220 * 60
+RETRY_STATUSES = (429, 502, 503, 504)
+# a downloaded workbook stays in memory up to this size, bigger ones go to a temporary file
+SPOOL_MAX_MEMORY = 64 * 1024 * 1024
+
+
+class TableauRestError(Exception):
+    pass
+
+
+def _extension(response):
+    """
+    .twb or .twbx, from the file name in Content-Disposition or else from the Content-Type.
+    """
+    match = re.search(r'filename\*?="?([^";]+)"?', response.headers.get('Content-Disposition', ''))
+    if match and os.path.splitext(match.group(1))[1] in ('.twb', '.twbx'):
+        return os.path.splitext(match.group(1))[1]
+    return '.twb' if 'xml' in response.headers.get('Content-Type', '') else '.twbx'
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class WorkbookSpool:
+    """
+    Holds one downloaded workbook until it is extracted: in memory while it is at most max_memory bytes,
+    in a temporary file in directory (the system temp directory by default) once it grows past that.
+    The temporary file is removed by close(), or when the spool is garbage collected.
+    """
+
+    def __init__(self, max_memory=SPOOL_MAX_MEMORY, directory=None):
+        self.max_memory = max_memory
+        self.directory = directory
+        self.size = 0
+        self.path = None
+        self._buffer = io.BytesIO()
+        self._file = None
+        self._finalizer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def spilled(self):
+        return self.path is not None
+
+    def write(self, chunk):
+        if self._file is None and self.size + len(chunk) > self.max_memory:
+            fd, path = tempfile.mkstemp(suffix='.download', dir=self.directory)
+            self._track(path)
+            self._file = os.fdopen(fd, 'wb')
+            self._file.write(self._buffer.getbuffer())
+            self._buffer = None
+        (self._file or self._buffer).write(chunk)
+        self.size += len(chunk)
+        return len(chunk)
+
+    def _track(self, path):
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        self.path = path
+        self._finalizer = weakref.finalize(self, _remove, path)
+
+    def finish(self, extension):
+        """
+        Ends the download. A spilled workbook gets its extension, the extraction tells .twb from .twbx by it.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            path = os.path.splitext(self.path)[0] + extension
+            os.replace(self.path, path)
+            self._track(path)
+
+    def source(self):
+        """
+        :return: the workbook content as bytes, or the path of the temporary file it spilled to.
+        """
+        return self.path if self.spilled else self._buffer.getvalue()
+
+    def take(self):
+        """
+        Hands the workbook over to the extraction, so it is held once: the bytes, which the spool lets go of,
+        or the path of the temporary file, which stays until close().
+        """
+        if self.spilled:
+            return self.path
+        content = self._buffer.getvalue()
+        self._buffer = None
+        return content
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._finalizer is not None:
+            self._finalizer()
+        self._buffer = None
+
+
+class TableauRestClient:
+    """
+    Tableau REST API client for downloading many workbooks from several threads.
+    - one requests.Session with a connection pool, so downloads reuse keep-alive connections
+    - the sign-in token is renewed when the server says it expired (401) and before TOKEN_LIFETIME runs out
+    - at most max_concurrency requests at once, whatever the number of threads calling it
+    - 429 / 5xx answers are retried after the Retry-After the server asks for, or after a jittered exponential backoff
+    - workbook content is streamed in chunks to disk, to any binary file object or to a WorkbookSpool
+      that keeps small workbooks in memory
+    """
+
+    def __init__(self, server, site='', token_name=None, token_secret=None, username=None, password=None,
+                 api_version='3.19', max_concurrency=4, max_retries=5, backoff=1.0, max_backoff=60.0, timeout=60,
+                 chunk_size=1 << 20):
+        """
+        :param server: e.g. https://tableau.example.com
+        :param site: content url of the site, '' for the default site.
+        :param token_name: personal access token name (or use username and password).
+        :param max_concurrency: requests running at the same time.
+        :param max_retries: retries of one request after a rate limit / server error.
+        :param backoff: first backoff in seconds, doubled with every retry up to max_backoff.
+        """
+        self.server = server.rstrip('/')
+        self.site = site
+        self.api_version = api_version
+        if token_name is not None:
+            self._credentials = {'personalAccessTokenName': token_name, 'personalAccessTokenSecret': token_secret}
+        else:
+            self._credentials = {'name': username, 'password': password}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+
+        # requests is imported by the first client, the extractor only needs WorkbookSpool from this module
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        # one connection more than the limit for signing in while all download slots are busy
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency + 1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._sign_in_lock = threading.Lock()
+        self.token = None
+        self.site_id = None
+        self._signed_in_at = 0.0
+        self.sign_ins = 0
+        self.retries = 0
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """
+        Client configured from TABLEAU_SERVER, TABLEAU_SITE, TABLEAU_TOKEN_NAME and TABLEAU_TOKEN_SECRET.
+        """
+        return cls(os.environ['TABLEAU_SERVER'], os.environ.get('TABLEAU_SITE', ''),
+                   os.environ['TABLEAU_TOKEN_NAME'], os.environ['TABLEAU_TOKEN_SECRET'], **kwargs)
+
+    def __enter__(self):
+        self.sign_in()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _url(self, path):
+        return f'{self.server}/api/{self.api_version}/{path}'
+
+    def sign_in(self, expired_token=None):
+        """
+        Signs in and keeps the token and site id. With expired_token, threads that saw the same token expire
+        sign in only once - the ones coming later find a new token already there.
+        """
+        with self._sign_in_lock:
+            if expired_token is not None and self.token != expired_token:
+                return
+            body = {'credentials': dict(self._credentials, site={'contentUrl': self.site})}
+            response = self.session.post(self._url('auth/signin'), json=body, headers={'Accept': 'application/json'},
+                                         timeout=self.timeout)
+            if response.status_code != 200:
+                raise TableauRestError(f"Sign in failed with {response.status_code}: {response.text[:200]}")
+            credentials = response.json()['credentials']
+            self.token = credentials['token']
+            self.site_id = credentials['site']['id']
+            self._signed_in_at = time.monotonic()
+            self.sign_ins += 1
+            logger.info("Signed in to %s, site %s", self.server, self.site_id)
+
+    def close(self):
+        import requests
+
+        if self.token is not None:
+            try:
+                self.session.post(self._url('auth/signout'), headers={'X-Tableau-Auth': self.token}, timeout=self.timeout)
+            except requests.RequestException as e:
+                logger.warning("Sign out failed: %s", e)
+            self.token = None
+        self.session.close()
+
+    def _wait_before_retry(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            delay = int(retry_after)
+        else:
+            # full jitter, so threads that were limited together do not come back together
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        self.retries += 1
+        logger.warning("Retrying in %.1f s (attempt %s)", delay, attempt + 1)
+        time.sleep(delay)
+
+    def request(self, method, path, handle=None, stream=False, **kwargs):
+        """
+        One authenticated request with token renewal and retries.
+        :param handle: function called with the 200 response while the request still holds its concurrency slot,
+            so a streamed body counts against the limit until it is read. None returns the response.
+        :return: what handle returned, or the requests.Response.
+        """
+        import requests
+
+        if self.token is None or time.monotonic() - self._signed_in_at > TOKEN_LIFETIME:
+            self.sign_in(self.token)
+        headers = kwargs.pop('headers', None) or {}
+        attempt = 0
+        while True:
+            token = self.token
+            response = None
+            with self._slots:
+                try:
+                    response = self.session.request(method, self._url(path),
+                                                    headers=dict(headers, **{'X-Tableau-Auth': token}),
+                                                    stream=stream, timeout=self.timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    logger.warning("%s %s failed: %s", method, path, e)
+                if response is not None:
+                    if response.status_code == 200:
+                        if handle is None:
+                            return response
+                        with response:
+                            return handle(response)
+                    # reading the (short) error body puts the connection back into the pool instead of closing it
+                    response.content
+                    response.close()
+            if response is not None:
+                if response.status_code == 401 and attempt < self.max_retries:
+                    logger.info("Token expired, signing in again")
+                    self.sign_in(token)
+                    attempt += 1
+                    continue
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    raise TableauRestError(f"{method} {path} failed with {response.status_code}")
+            self._wait_before_retry(attempt, response)
+            attempt += 1
+
+    def list_workbooks(self, project=None, page_size=100):
+        """
+        Every workbook of the site, page by page.
+        :param project: only the workbooks of the project with this name.
+        :return: generator of the workbooks as the REST API describes them (id, name, project, updatedAt, ...).
+        """
+        params = {'pageSize': page_size}
+        if project is not None:
+            params['filter'] = f'projectName:eq:{project}'
+        page = 1
+        while True:
+            answer = self.request('GET', f'sites/{self.site_id}/workbooks', params=dict(params, pageNumber=page),
+                                  headers={'Accept': 'application/json'}).json()
+            workbooks = answer.get('workbooks', {}).get('workbook', [])
+            yield from workbooks
+            if not workbooks or page * page_size >= int(answer['pagination']['totalAvailable']):
+                return
+            page += 1
+
+    def download_workbook_to(self, workbook_id, fileobj, include_extract=False):
+        """
+        Streams the workbook content (.twb or .twbx) into a binary file object.
+        :return: extension of the workbook, '.twb' or '.twbx'.
+        """
+        def write(response):
+            for chunk in response.iter_content(self.chunk_size):
+                fileobj.write(chunk)
+            return _extension(response)
+
+        path = f'sites/{self.site_id}/workbooks/{workbook_id}/content'
+        params = {'includeExtract': str(include_extract).lower()}
+        return self.request('GET', path, write, stream=True, params=params)
+
+    def download_workbook(self, workbook_id, directory='.', include_extract=False):
+        """
+        Downloads the workbook into directory as <workbook_id>.twb / .twbx (workbook names are not unique on a site).
+        The file shows up only when it is complete, a failed download leaves nothing behind.
+        :return: path of the downloaded workbook.
+        """
+        temporary_path = os.path.join(directory, f'.{workbook_id}.download')
+        try:
+            with open(temporary_path, 'wb') as f:
+                extension = self.download_workbook_to(workbook_id, f, include_extract)
+            path = os.path.join(directory, f'{workbook_id}{extension}')
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        return path
+
+    def download_workbook_spooled(self, workbook_id, max_memory=SPOOL_MAX_MEMORY, directory=None,
+                                  include_extract=False):
+        """
+        Downloads the workbook into a WorkbookSpool instead of the working directory.
+        :param max_memory: bytes kept in memory before the download spills to a temporary file.
+        :param directory: where the temporary file goes, None for the system temp directory.
+        :return: WorkbookSpool, close it when the workbook is extracted.
+        """
+        spool = WorkbookSpool(max_memory, directory)
+        try:
+            spool.finish(self.download_workbook_to(workbook_id, spool, include_extract))
+        except BaseException:
+            spool.close()
+            raise
+        return spool
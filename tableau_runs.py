@@ -0,0 +1,150 @@
+import json
+import os
+import time
+from collections import Counter
+
+# statuses of a workbook in a run, the finished ones are not extracted again when the run is resumed
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+QUARANTINED = 'quarantined'
+FINISHED = (DONE, QUARANTINED)
+
+
+class RunManifest:
+    """
+    Record of one extraction run: the workbook_luids it was started with, the output file and the status of every
+    workbook, so an interrupted run can be resumed where it stopped.
+    Json lines, the run itself on the first line, then one line per status change. A line is appended (and flushed)
+    as soon as a workbook is done, so a crash loses at most the workbooks that were being extracted.
+    With every workbook written to the output, the output size is recorded too: resume() cuts the output back
+    to it, a workbook appended after the last recorded line would otherwise end up in it twice.
+    """
+
+    def __init__(self, path, header, statuses, output_bytes):
+        self.path = path
+        self.header = header
+        self.statuses = statuses
+        self.output_bytes = output_bytes
+        self._file = None
+
+    @property
+    def run_id(self):
+        return self.header['run_id']
+
+    @property
+    def luids(self):
+        return self.header['luids']
+
+    @property
+    def output_path(self):
+        return self.header['output_path']
+
+    @property
+    def revisions(self):
+        return self.header.get('revisions') or {}
+
+    @classmethod
+    def create(cls, luids, output_path, directory='tableau_runs', revisions=None, run_id=None):
+        """
+        Starts a new run.
+        :param luids: workbook_luids to extract, in order.
+        :param output_path: json lines file the workbooks are appended to.
+        :param revisions: optional dict workbook_luid -> revision (updatedAt of the REST listing), kept for the cache.
+        :param run_id: None for <start time>-<pid>, with a counter when that run exists already
+            (two runs started in the same second). A given run_id that exists raises FileExistsError.
+        :return: RunManifest saved as <directory>/<run_id>.jsonl.
+        """
+        os.makedirs(directory, exist_ok=True)
+        output_bytes = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+        header = {'run_id': run_id, 'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'output_path': output_path,
+                  'output_bytes': output_bytes, 'luids': list(dict.fromkeys(luids)), 'revisions': revisions or {}}
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        attempt = 0
+        while True:
+            header['run_id'] = run_id or (stamp if not attempt else f'{stamp}-{attempt}')
+            path = os.path.join(directory, f"{header['run_id']}.jsonl")
+            try:
+                with open(path, 'x', encoding='utf-8') as f:
+                    f.write(json.dumps(header) + '\n')
+            except FileExistsError:
+                if run_id:
+                    raise
+                attempt += 1
+                continue
+            return cls(path, header, {}, output_bytes)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a manifest back, the last status of a workbook wins. A line cut short by a crash is removed,
+        so the next status does not get appended to it.
+        """
+        statuses = {}
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            output_bytes = header['output_bytes']
+            complete = f.tell()
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                event = json.loads(line)
+                statuses[event['luid']] = event['status']
+                if event.get('output_bytes') is not None:
+                    output_bytes = event['output_bytes']
+                complete = f.tell()
+        if os.path.getsize(path) > complete:
+            with open(path, 'r+b') as f:
+                f.truncate(complete)
+        return cls(path, header, statuses, output_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def status(self, luid):
+        return self.statuses.get(luid, PENDING)
+
+    def remaining(self):
+        """
+        :return: workbook_luids that are not finished yet (pending, or failed to download), in the order of the run.
+        """
+        return [luid for luid in self.luids if self.status(luid) not in FINISHED]
+
+    def counts(self):
+        counts = Counter(self.status(luid) for luid in self.luids)
+        return {status: counts[status] for status in (DONE, FAILED, QUARANTINED, PENDING) if counts[status]}
+
+    def resume(self):
+        """
+        Prepares the output for resuming: everything after the last workbook the manifest knows to be written is cut.
+        :return: workbook_luids still to extract.
+        """
+        if os.path.exists(self.output_path) and os.path.getsize(self.output_path) > self.output_bytes:
+            with open(self.output_path, 'r+b') as f:
+                f.truncate(self.output_bytes)
+        return self.remaining()
+
+    def mark(self, luid, status, error=None, output_bytes=None):
+        """
+        Records the status of a workbook.
+        :param output_bytes: size of the output file once the workbook was written to it.
+        """
+        event = {'luid': luid, 'status': status, 'at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        if error is not None:
+            event['error'] = error
+        if output_bytes is not None:
+            event['output_bytes'] = output_bytes
+            self.output_bytes = output_bytes
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(event) + '\n')
+        self._file.flush()
+        self.statuses[luid] = status
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
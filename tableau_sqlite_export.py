@@ -0,0 +1,186 @@
+import sqlite3
+
+from tableau_logging import logger
+from tableau_metadata_extractor import (OUTPUT_FILE, TABLE_COLUMNS, TABLE_NAMES, flatten_record_values, load_records,
+                                        to_text)
+
+# Lookups the chatbot and the data catalog make, besides workbook_luid which every table is indexed by.
+INDEXES = {
+    'all_columns_wb': ('caption', 'name_column'),
+    'workbooks': ('wbldbn', 'report_name'),
+    'views': ('wbldbn',),
+    'filters': ('wbldbn',),
+    'columns': ('wbldbn', 'caption', 'name'),
+    'datasources': ('wbldbn', 'name', 'dbname'),
+}
+
+# columns of every table in the database, the csv columns tagged with the workbook_luid they belong to
+STORE_COLUMNS = {name: columns if 'workbook_luid' in columns else ('workbook_luid',) + columns
+                 for name, columns in TABLE_COLUMNS.items()}
+
+# Full text index over the captions and formulas of the dashboard columns. It is an external content table over
+# "columns", kept in sync by MetadataStore itself: filling it with one INSERT ... SELECT per transaction is about
+# five times faster than a trigger per row.
+FTS_SCHEMA = ('CREATE VIRTUAL TABLE IF NOT EXISTS columns_fts '
+              "USING fts5(caption, formula, content='columns', content_rowid='rowid')")
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def fts5_available():
+    connection = sqlite3.connect(':memory:')
+    try:
+        connection.execute('CREATE VIRTUAL TABLE probe USING fts5(text)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        connection.close()
+
+
+class MetadataStore:
+    """
+    The six tables of write_tables in a local SQLite database, every row tagged with its workbook_luid.
+    A workbook is replaced as a whole (delete + insert in one transaction), so loading it again is an upsert.
+    Without FTS5 in the sqlite library search_columns falls back to LIKE.
+    """
+
+    def __init__(self, path='tableau_metadata.db'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.fts = fts5_available()
+        self._create_schema()
+        self._insert_sql = {
+            name: f'INSERT INTO {_quote(name)} ({", ".join(map(_quote, columns))}) VALUES ({", ".join("?" * len(columns))})'
+            for name, columns in STORE_COLUMNS.items()
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _create_schema(self):
+        with self.connection:
+            for name, columns in STORE_COLUMNS.items():
+                column_list = ', '.join(f'{_quote(column)} TEXT' for column in columns)
+                self.connection.execute(f'CREATE TABLE IF NOT EXISTS {_quote(name)} ({column_list})')
+                for column in ('workbook_luid',) + INDEXES[name]:
+                    self.connection.execute(f'CREATE INDEX IF NOT EXISTS {_quote(f"{name}_{column}")} '
+                                            f'ON {_quote(name)} ({_quote(column)})')
+            if self.fts:
+                self.connection.execute(FTS_SCHEMA)
+            else:
+                logger.warning("sqlite has no FTS5, column search falls back to LIKE.")
+
+    def upsert(self, entries):
+        """
+        Replaces the rows of the given workbooks, all of them in one transaction.
+        :param entries: extracted_data of the workbooks. A workbook_luid given more than once is written once,
+            from its last entry (deleting the same FTS rows twice would corrupt the index).
+        :return: number of workbooks written.
+        """
+        entries = {entry['workbook_luid']: entry for entry in entries}.values()
+        luids = []
+        rows = {name: [] for name in TABLE_NAMES}
+        tagged = {name: STORE_COLUMNS[name] is not TABLE_COLUMNS[name] for name in TABLE_NAMES}
+        for entry in entries:
+            workbook_luid = entry['workbook_luid']
+            luids.append((workbook_luid,))
+            for table, values in flatten_record_values(entry):
+                values = tuple(map(to_text, values))
+                rows[table].append((workbook_luid,) + values if tagged[table] else values)
+        with self.connection:
+            self._delete(luids)
+            if self.fts:
+                last_rowid = self.connection.execute('SELECT coalesce(max(rowid), 0) FROM "columns"').fetchone()[0]
+            for name, table_rows in rows.items():
+                if table_rows:
+                    self.connection.executemany(self._insert_sql[name], table_rows)
+            if self.fts:
+                # new rows get rowids above the largest one before the insert
+                self.connection.execute('INSERT INTO columns_fts(rowid, caption, formula) '
+                                        'SELECT rowid, caption, formula FROM "columns" WHERE rowid > ?', (last_rowid,))
+        return len(luids)
+
+    def _delete(self, luids):
+        if self.fts:
+            self.connection.executemany("INSERT INTO columns_fts(columns_fts, rowid, caption, formula) "
+                                        "SELECT 'delete', rowid, caption, formula FROM \"columns\" WHERE workbook_luid = ?",
+                                        luids)
+        for name in TABLE_NAMES:
+            self.connection.executemany(f'DELETE FROM {_quote(name)} WHERE workbook_luid = ?', luids)
+
+    def delete(self, workbook_luid):
+        """
+        Removes a workbook that is gone from the site.
+        """
+        with self.connection:
+            self._delete([(workbook_luid,)])
+
+    def search_columns(self, query, datasource=None, limit=50):
+        """
+        Dashboard columns whose caption or formula matches query, best matches first.
+        :param query: FTS5 query, e.g. 'revenue', 'formula:sum*' or '"net revenue"'. Plain text without FTS5.
+        :param datasource: only columns of dashboards that use the datasource with this name.
+        :param limit: maximum number of rows.
+        :return: list of dicts, the columns table row plus workbook_luid.
+        """
+        if self.fts:
+            sql = ('SELECT c.* FROM columns_fts JOIN "columns" c ON c.rowid = columns_fts.rowid '
+                   'WHERE columns_fts MATCH ?')
+            parameters = [query]
+        else:
+            sql = 'SELECT c.* FROM "columns" c WHERE (c.caption LIKE ? OR c.formula LIKE ?)'
+            parameters = [f'%{query}%', f'%{query}%']
+        if datasource is not None:
+            sql += ' AND c.wbldbn IN (SELECT wbldbn FROM datasources WHERE name = ?)'
+            parameters.append(datasource)
+        sql += ' ORDER BY rank LIMIT ?' if self.fts else ' LIMIT ?'
+        parameters.append(limit)
+        return [dict(row) for row in self.connection.execute(sql, parameters)]
+
+    def datasource_columns(self, datasource):
+        """
+        Dashboard columns of every dashboard that uses the datasource with this name.
+        """
+        rows = self.connection.execute('SELECT c.* FROM "columns" c WHERE c.wbldbn IN '
+                                       '(SELECT wbldbn FROM datasources WHERE name = ?)', (datasource,))
+        return [dict(row) for row in rows]
+
+    def counts(self):
+        return {name: self.connection.execute(f'SELECT count(*) FROM {_quote(name)}').fetchone()[0]
+                for name in TABLE_NAMES}
+
+    def close(self):
+        self.connection.close()
+
+
+def write_sqlite(json_path=OUTPUT_FILE, db_path='tableau_metadata.db', batch_size=500):
+    """
+    SQLite version of write_tables - loads the extracted workbooks into a MetadataStore.
+    Workbooks already in the database are replaced, the others are left as they are.
+    :param json_path: json or json lines file written by save_records.
+    :param db_path: the database file, created if it does not exist.
+    :param batch_size: workbooks per transaction.
+    :return: dict table name -> number of rows in the database.
+    """
+    with MetadataStore(db_path) as store:
+        batch = []
+        for entry in load_records(json_path):
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                store.upsert(batch)
+                batch = []
+        if batch:
+            store.upsert(batch)
+        counts = store.counts()
+
+    logger.info("SQLite tables are in %s", db_path)
+    return counts
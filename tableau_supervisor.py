@@ -0,0 +1,312 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait as wait_connections
+
+from tableau_logging import configure_logging, logger, logging_settings
+
+# a workbook taking longer than this to extract is stopped and quarantined
+EXTRACT_TIMEOUT = 15 * 60
+# resident memory one extraction worker may use
+MAX_RSS_BYTES = 4 * 1024 ** 3
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class ExtractionAborted(Exception):
+    """
+    The worker extracting a workbook had to be stopped (or died), the workbook is not worth trying again.
+    """
+    reason = 'crashed'
+
+
+class WorkbookTimeout(ExtractionAborted):
+    reason = 'timeout'
+
+
+class WorkbookMemoryExceeded(ExtractionAborted):
+    reason = 'memory'
+
+
+def _worker_main(connection, directory, log_level, log_settings):
+    # a forkserver / spawn child starts where the forkserver was started, with logging unconfigured:
+    # it gets the handler, the trace sampling and the phase summary of the parent, or at least its level
+    os.chdir(directory)
+    if log_settings is not None:
+        configure_logging(**log_settings)
+    else:
+        logger.setLevel(log_level)
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:  # the pool is gone
+            break
+        if task is None:
+            break
+        function, args = task
+        try:
+            message = (True, function(*args))
+        except Exception as e:
+            message = (False, e)
+        try:
+            connection.send(message)
+        except Exception as e:  # the result or the exception does not pickle
+            connection.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+def _context(preload):
+    # Replacement workers are started while the download threads are running, and forking a threaded process
+    # can leave a lock held forever in the child. forkserver forks from a clean single-threaded process instead,
+    # which imports the preload modules once, so a new worker does not have to import pandas again.
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    if preload:
+        context.set_forkserver_preload(list(preload))
+    return context
+
+
+class _Worker:
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        log_settings = logging_settings()
+        self.process = context.Process(target=_worker_main, daemon=True,
+                                       args=(child_connection, os.getcwd(), logger.getEffectiveLevel(), log_settings))
+        self.process.start()
+        child_connection.close()
+        self.future = None
+        self.started = None
+
+    def start(self, future, function, args):
+        self.future = future
+        self.started = time.monotonic()
+        self.connection.send((function, args))
+
+    def rss_bytes(self):
+        try:
+            with open(f'/proc/{self.process.pid}/statm', 'r') as f:
+                return int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def exited(self):
+        self.process.join(1)
+        return ExtractionAborted(f"worker exited with code {self.process.exitcode}")
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class SupervisedPool:
+    """
+    Fixed number of worker processes for the extraction, with the submit() / Future interface of ProcessPoolExecutor.
+    A supervisor thread hands the queued tasks to idle workers and watches the busy ones: a task running longer than
+    timeout, or a worker whose resident memory grows over max_rss_bytes, gets its worker killed and the future fails
+    with WorkbookTimeout / WorkbookMemoryExceeded. A worker that dies fails its task with ExtractionAborted.
+    A fresh worker takes the place of every killed one, so the pool stays at its size and the other tasks go on.
+    The memory cap needs /proc (Linux), elsewhere only the timeout is enforced.
+    preload names the modules of the tasks, imported once in the forkserver (it only counts before its first start).
+    """
+
+    def __init__(self, max_workers=None, timeout=EXTRACT_TIMEOUT, max_rss_bytes=MAX_RSS_BYTES, poll_interval=0.2,
+                 preload=()):
+        self.timeout = timeout
+        self.max_rss_bytes = max_rss_bytes
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._context = _context(preload)
+        self._workers = [_Worker(self._context) for _ in range(self.max_workers)]
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._shutdown = False
+        self._abort = False
+        self.restarts = 0
+        self._thread = threading.Thread(target=self._supervise, name='extraction-supervisor', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.shutdown(wait=exc_type is None)
+
+    def submit(self, function, *args):
+        """
+        Queues function(*args) for the next idle worker. function and args must pickle.
+        :return: concurrent.futures.Future
+        """
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+            self._queue.append((future, function, args))
+        self._wakeup.set()
+        return future
+
+    def _supervise(self):
+        while True:
+            with self._lock:
+                if self._abort:
+                    return
+                for worker in list(self._workers):
+                    if worker.future is None and self._queue:
+                        future, function, args = self._queue.popleft()
+                        if future.set_running_or_notify_cancel():
+                            try:
+                                worker.start(future, function, args)
+                            except OSError:  # the worker died before it got the task
+                                self._replace(worker, worker.exited())
+                if not self._workers:
+                    # no worker could be started again, nothing would ever run the queued tasks
+                    while self._queue:
+                        future = self._queue.popleft()[0]
+                        if future.set_running_or_notify_cancel():
+                            future.set_exception(ExtractionAborted("no extraction worker is left"))
+                busy = [worker for worker in self._workers if worker.future is not None]
+                if self._shutdown and not busy and not self._queue:
+                    return
+            if not busy:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            ready = wait_connections([worker.connection for worker in busy], timeout=self.poll_interval)
+            for worker in busy:
+                if worker.connection in ready:
+                    self._collect(worker)
+                else:
+                    self._check_limits(worker)
+
+    def _collect(self, worker):
+        future = worker.future
+        try:
+            ok, value = worker.connection.recv()
+        except (EOFError, OSError):
+            self._replace(worker, worker.exited())
+            return
+        worker.future = None
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def _check_limits(self, worker):
+        if not worker.process.is_alive():
+            self._replace(worker, worker.exited())
+        elif self.timeout is not None and time.monotonic() - worker.started > self.timeout:
+            self._replace(worker, WorkbookTimeout(f"no result after {self.timeout} s"))
+        elif self.max_rss_bytes is not None:
+            rss = worker.rss_bytes()
+            if rss is not None and rss > self.max_rss_bytes:
+                self._replace(worker, WorkbookMemoryExceeded(f"worker used {rss >> 20} MB, the cap is "
+                                                             f"{self.max_rss_bytes >> 20} MB"))
+
+    def _replace(self, worker, error):
+        future = worker.future
+        worker.future = None
+        worker.kill()
+        position = self._workers.index(worker)
+        try:
+            self._workers[position] = _Worker(self._context)
+        except Exception as e:
+            # the pool goes on with one worker less, the supervisor thread must not die with the futures it watches
+            del self._workers[position]
+            logger.error("Could not start a new extraction worker, %s left: %s", len(self._workers), e)
+        else:
+            self.restarts += 1
+        logger.warning("Extraction worker stopped: %s", error)
+        future.set_exception(error)
+
+    def shutdown(self, wait=True):
+        """
+        :param wait: let the queued and running tasks finish, otherwise the queued ones are cancelled,
+            the running ones fail with ExtractionAborted and their workers are killed.
+        """
+        with self._lock:
+            self._shutdown = True
+            if not wait:
+                self._abort = True
+                while self._queue:
+                    future = self._queue.popleft()[0]
+                    if future.cancel():
+                        future.set_running_or_notify_cancel()  # wakes up wait() / as_completed() on it
+        self._wakeup.set()
+        # the supervisor is done with the workers and their connections before they are touched here
+        self._thread.join()
+        running = [worker for worker in self._workers if worker.future is not None]
+        for worker in running:
+            future = worker.future
+            worker.future = None
+            future.set_exception(ExtractionAborted("the extraction pool was shut down"))
+        for worker in running:
+            worker.kill()
+        for worker in self._workers:
+            if worker not in running:
+                worker.stop()
+
+
+class Quarantine:
+    """
+    Workbooks whose extraction failed, with the reason, so later runs skip them instead of trying again and again.
+    Saved as json in path (None keeps it in memory only). Remove a workbook once it has been fixed.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        if path is not None and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def __contains__(self, workbook_luid):
+        return workbook_luid in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, workbook_luid):
+        return self.entries.get(workbook_luid)
+
+    def add(self, workbook_luid, error):
+        self.entries[workbook_luid] = {
+            'reason': getattr(error, 'reason', 'error'),
+            'error': f"{type(error).__name__}: {error}",
+            'quarantined_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        self._save()
+
+    def remove(self, workbook_luid):
+        if self.entries.pop(workbook_luid, None) is not None:
+            self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(self.path + '.tmp', self.path)
+
+    def report(self):
+        """
+        :return: dict reason -> list of workbook_luids.
+        """
+        reasons = {}
+        for workbook_luid, entry in self.entries.items():
+            reasons.setdefault(entry['reason'], []).append(workbook_luid)
+        return reasons
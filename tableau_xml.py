@@ -0,0 +1,98 @@
+import xml.etree.ElementTree as ET
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml is optional, the stdlib parser is always there
+    lxml_etree = None
+
+
+class EtreeEngine:
+    """
+    xml.etree.ElementTree. Paths are ElementPath expressions, which the stdlib caches itself.
+    """
+    name = 'etree'
+    ParseError = ET.ParseError
+
+    def fromstring(self, text):
+        return ET.ElementTree(ET.fromstring(text))
+
+    def parse(self, source):
+        return ET.parse(source)
+
+    def iterparse(self, source, events):
+        return ET.iterparse(source, events=events)
+
+    def tree(self, root):
+        return ET.ElementTree(root)
+
+    def find(self, elem, path):
+        return elem.find(path)
+
+    def findall(self, elem, path):
+        return elem.findall(path)
+
+
+class LxmlEngine:
+    """
+    lxml.etree. Every path is compiled into an XPath object on first use and the compiled object is reused for
+    the rest of the process, evaluation runs in C. Comments and processing instructions are dropped while parsing,
+    so the tree has the same elements as the stdlib one.
+    """
+    name = 'lxml'
+    ParseError = lxml_etree.XMLSyntaxError if lxml_etree is not None else None
+
+    def __init__(self):
+        if lxml_etree is None:
+            raise ImportError("The lxml parser engine needs the lxml package")
+        self._parser = lxml_etree.XMLParser(remove_comments=True, remove_pis=True, huge_tree=True)
+        self._xpaths = {}
+
+    def _xpath(self, path):
+        xpath = self._xpaths.get(path)
+        if xpath is None:
+            xpath = self._xpaths[path] = lxml_etree.XPath(path)
+        return xpath
+
+    def fromstring(self, text):
+        # lxml refuses str input with an encoding declaration
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        return lxml_etree.ElementTree(lxml_etree.fromstring(text, self._parser))
+
+    def parse(self, source):
+        return lxml_etree.parse(source, self._parser)
+
+    def iterparse(self, source, events):
+        return lxml_etree.iterparse(source, events=events, remove_comments=True, remove_pis=True, huge_tree=True)
+
+    def tree(self, root):
+        return root.getroottree()
+
+    def find(self, elem, path):
+        found = self._xpath(path)(elem)
+        return found[0] if found else None
+
+    def findall(self, elem, path):
+        return self._xpath(path)(elem)
+
+
+ENGINES = {'etree': EtreeEngine, 'lxml': LxmlEngine}
+# lxml parses faster, but reading attributes through its element proxies is slower than the stdlib dicts and the
+# extraction reads a lot of them - on the benchmark workbooks the whole pipeline is ~15% slower with lxml.
+# It stays opt-in until the methods read less per element.
+DEFAULT_ENGINE = 'etree'
+
+_engines = {}
+
+
+def get_engine(name=None):
+    """
+    :param name: 'lxml' or 'etree', None for DEFAULT_ENGINE.
+    :return: the shared engine object, so compiled paths are kept between workbooks.
+    """
+    name = name or DEFAULT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown parser engine {name!r}, choose one of {sorted(ENGINES)}")
+    if name not in _engines:
+        _engines[name] = ENGINES[name]()
+    return _engines[name]
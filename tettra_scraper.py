@@ -1,15 +1,26 @@
 import json
+import os
 import re
+from contextlib import redirect_stdout
 from random import uniform
 from time import sleep
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
+
+
+def _import_browser():
+    """
+    Imports selenium and bs4 into this module. They are only needed once a browser starts,
+    so the first WebScrapper imports them instead of every import of this module.
+    """
+    global BeautifulSoup, webdriver, TimeoutException, NoSuchElementException, Options, ActionChains, By, EC, \
+        WebDriverWait
+    from bs4 import BeautifulSoup
+    from selenium import webdriver
+    from selenium.common.exceptions import TimeoutException, NoSuchElementException
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.common.action_chains import ActionChains
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
 
 
 def random_delay(a=0.7, b=1.5):
@@ -18,6 +29,7 @@ def random_delay(a=0.7, b=1.5):
 
 class WebScrapper():
     def __init__(self):
+        _import_browser()
         base_url = ''
         options = Options()
         options.add_experimental_option("excludeSwitches", ["enable-logging"])
@@ -415,36 +427,36 @@ class WebScrapper():
         with open("all_scraped_data_3.json", "w") as f:
             json.dump(self.all_scraped_data, f)
 
-### Turns off the print statements ###
-original_print = print
-print = lambda *args, **kwargs: None
-
-client = WebScrapper()
-client.introductory_scrapping()
-client.save_to_json()
-client.driver.quit()
-client = WebScrapper()
-client.introductory_scrapping_2()
-client.save_to_json_2()
-client.driver.quit()
-client = WebScrapper()
-client.introductory_scrapping_3()
-client.save_to_json_3()
-client.driver.quit()
-
-
-with open('all_scraped_data.json', 'r') as file:
-    data_1 = json.load(file)
-with open('all_scraped_data_2.json', 'r') as file:
-    data_2 = json.load(file)
-with open('all_scraped_data_3.json', 'r') as file:
-    data_3 = json.load(file)
-
-merged_data = data_1 + data_2 + data_3
-
-with open('all_scrapped_data_combined.json', 'w') as file:
-    json.dump(merged_data, file, indent=4)
-
-#print("Merging completed. Everything completed.")
-
-original_print("Merging completed. Everything completed.") ### do not open until turning off print statements
+def main():
+    ### Turns off the print statements ###
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        client = WebScrapper()
+        client.introductory_scrapping()
+        client.save_to_json()
+        client.driver.quit()
+        client = WebScrapper()
+        client.introductory_scrapping_2()
+        client.save_to_json_2()
+        client.driver.quit()
+        client = WebScrapper()
+        client.introductory_scrapping_3()
+        client.save_to_json_3()
+        client.driver.quit()
+
+    with open('all_scraped_data.json', 'r') as file:
+        data_1 = json.load(file)
+    with open('all_scraped_data_2.json', 'r') as file:
+        data_2 = json.load(file)
+    with open('all_scraped_data_3.json', 'r') as file:
+        data_3 = json.load(file)
+
+    merged_data = data_1 + data_2 + data_3
+
+    with open('all_scrapped_data_combined.json', 'w') as file:
+        json.dump(merged_data, file, indent=4)
+
+    print("Merging completed. Everything completed.")
+
+
+if __name__ == '__main__':
+    main()